@@ -65,13 +65,63 @@ citrus simulate
     default=False,
     help="Change output file from comma seperated CSV to tab seperated TSV."
 )
+@click.option(
+    '--no-cache',
+    is_flag=True,
+    default=False,
+    help="Always read genotypes from the genotype files instead of reusing "
+    "values cached on disk by previous runs over the same files and loci. "
+    "The cache location and max size are set with the CITRUS_CACHE_DIR and "
+    "CITRUS_CACHE_MAX_BYTES environment variables."
+)
+@click.option(
+    '-w', '--workers',
+    type=int,
+    default=1,
+    show_default=True,
+    help="Max number of simulation steps to run at once in threads. "
+    "Independent branches of the simulation (e.g. per gene effects) then "
+    "run in parallel. 0 uses the number of CPUs."
+)
+@click.option(
+    '-s', '--seed',
+    type=int,
+    default=None,
+    help="Seed for the random values drawn by the simulation, overwriting "
+    "the config's 'seed' key if present. Runs with the same seed give the "
+    "same output for any number of workers."
+)
+@click.option(
+    '--store-results',
+    is_flag=True,
+    default=False,
+    help="Store the outputs of simulation steps in the cache and reuse "
+    "them when rerunning with the same config, genotype files, and seed. "
+    "Steps that use random numbers, and steps that depend on them, are "
+    "only stored when a seed is set. Ignored with --no-cache."
+)
+@click.option(
+    '--chunk-size',
+    type=int,
+    default=None,
+    help="Simulate and save samples in chunks of this many samples, so "
+    "memory use does not grow with the number of samples. Steps that "
+    "scale by statistics over all samples (e.g. Heritability, "
+    "StandardScaler) take an extra pass over the chunks. Simulations with "
+    "random steps before such steps need a seed."
+)
 def simulate(
     config_file: str, 
     genotype_files: str,  
 	output_dir: str, 
 	output_filename: str, 
 	output_config_filename: str,
-    tsv: bool
+    tsv: bool,
+    no_cache: bool,
+    workers: int,
+    seed: int,
+    store_results: bool,
+    chunk_size: int
 ):
 	"""
 	Simulates phenotypes by modeling cis, inheritance, and trans
@@ -93,12 +143,27 @@ def simulate(
 
 
 	# Create simulation
-	sim = PhenoSimulation(config)
+	sim = PhenoSimulation(
+		config,
+		input_cache=not no_cache,
+		sim_workers=workers if workers > 0 else None,
+		seed=seed,
+		result_store=store_results and not no_cache
+	)
 	
-	# Run simulation
+	# Run simulation and save output
+	if chunk_size is not None:
+		sim.save_output_chunked(
+			sim.run_simulation_chunked(chunk_size=chunk_size),
+			output_dir=output_dir,
+			output_file_name=output_filename,
+			output_config_name=output_config_filename,
+			sep="\t" if tsv else ","
+		)
+		return
+
 	sim_vals = sim.run_simulation()
 	
-	# Save output
 	sim.save_output(
 		sim_vals,
 		output_dir=output_dir,
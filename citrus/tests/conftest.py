@@ -0,0 +1,23 @@
+import json
+import os
+
+import pytest
+
+
+EXAMPLE_DIR = os.path.join(
+	os.path.dirname(__file__), '..', '..', 'example-files'
+)
+
+
+@pytest.fixture
+def native_config():
+	""" Config of the linear additive example read with the native engine,
+	so simulations do not need Hail.
+	"""
+	with open(os.path.join(EXAMPLE_DIR, 'linear_additive.json')) as f:
+		config = json.load(f)
+	config['input'][0]['file'] = os.path.join(
+		EXAMPLE_DIR, 'example_gts_chr19.vcf.gz'
+	)
+	config['input'][0]['engine'] = 'native'
+	return config
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from pheno_sim.input_nodes.bgen_input import BGENInputSource
+from pheno_sim.input_nodes.native_input import NativeInputSource
+
+
+EXAMPLE_VCF = os.path.join(
+	os.path.dirname(__file__), '..', '..', 'example-files',
+	'example_gts_chr19.vcf.gz'
+)
+
+INPUT_NODES = [
+	{'alias': 'snp_0', 'type': 'SNP', 'chr': '19', 'pos': 280540},
+	{'alias': 'snp_1', 'type': 'SNP', 'chr': '19', 'pos': [523746]},
+]
+
+
+def _string(s, length_fmt='<H'):
+	return struct.pack(length_fmt, len(s)) + s.encode()
+
+
+def _variant_block(chrom, pos, hap_0, hap_1, phased):
+	""" Returns a zlib compressed layout 2 variant block with 8-bit
+	probabilities of hard calls.
+	"""
+	n = len(hap_0)
+	if phased:
+		# P(reference allele) of each haplotype
+		probs = np.column_stack([1 - hap_0, 1 - hap_1])
+	else:
+		# P(0/0) and P(0/1)
+		alt_counts = hap_0 + hap_1
+		probs = np.column_stack([alt_counts == 0, alt_counts == 1])
+	data = (
+		struct.pack('<IHBB', n, 2, 2, 2)
+		+ bytes([2] * n)
+		+ struct.pack('<BB', int(phased), 8)
+		+ (probs.astype(np.uint8) * 255).tobytes()
+	)
+	compressed = zlib.compress(data)
+	return (
+		_string(f'var_{pos}') + _string(f'rs{pos}') + _string(chrom)
+		+ struct.pack('<IH', pos, 2)
+		+ _string('C', '<I') + _string('T', '<I')
+		+ struct.pack('<II', len(compressed) + 4, len(data))
+		+ compressed
+	)
+
+
+def write_bgen(path, loci, sample_ids, hap_0, hap_1, phased):
+	""" Writes a zlib compressed layout 2 BGEN with sample ids, and its
+	.bgi index.
+	"""
+	sample_block = b''.join(_string(s) for s in sample_ids)
+	sample_block = struct.pack(
+		'<II', len(sample_block) + 8, len(sample_ids)
+	) + sample_block
+	flags = 1 | 2 << 2 | 1 << 31
+	header = struct.pack(
+		'<III4sI', 20, len(loci), len(sample_ids), b'bgen', flags
+	)
+
+	index_rows = []
+	with open(path, 'wb') as f:
+		f.write(struct.pack('<I', len(header) + len(sample_block)))
+		f.write(header + sample_block)
+		for i, (chrom, pos) in enumerate(loci):
+			block = _variant_block(chrom, pos, hap_0[i], hap_1[i], phased)
+			index_rows.append((chrom, pos, f.tell(), len(block)))
+			f.write(block)
+
+	conn = sqlite3.connect(path + '.bgi')
+	conn.execute(
+		'CREATE TABLE Variant (chromosome TEXT, position INT, '
+		'file_start_position INT, size_in_bytes INT)'
+	)
+	conn.executemany('INSERT INTO Variant VALUES (?, ?, ?, ?)', index_rows)
+	conn.commit()
+	conn.close()
+
+
+@pytest.fixture(scope='module')
+def vcf_haplotypes():
+	source = NativeInputSource({
+		'file': EXAMPLE_VCF, 'engine': 'native', 'input_nodes': INPUT_NODES
+	})
+	loci = source.get_required_loci()
+	hap_0, hap_1 = source.load_haplotypes(loci)
+	return loci, list(source.input_sample_ids), hap_0, hap_1
+
+
+def load_bgen(path, **kwargs):
+	source = BGENInputSource({
+		'file': path, 'engine': 'bgen', 'input_nodes': INPUT_NODES, **kwargs
+	})
+	hap_0, hap_1 = source.load_haplotypes(source.get_required_loci())
+	return source, hap_0, hap_1
+
+
+def test_phased_bgen_matches_vcf(tmp_path, vcf_haplotypes):
+	loci, sample_ids, vcf_hap_0, vcf_hap_1 = vcf_haplotypes
+	path = str(tmp_path / 'example.bgen')
+	write_bgen(path, loci, sample_ids, vcf_hap_0, vcf_hap_1, phased=True)
+
+	source, hap_0, hap_1 = load_bgen(path)
+
+	assert list(source.input_sample_ids) == sample_ids
+	np.testing.assert_array_equal(hap_0, vcf_hap_0)
+	np.testing.assert_array_equal(hap_1, vcf_hap_1)
+
+
+def test_unphased_bgen_dosages_match_vcf(tmp_path, vcf_haplotypes):
+	loci, sample_ids, vcf_hap_0, vcf_hap_1 = vcf_haplotypes
+	path = str(tmp_path / 'example.bgen')
+	write_bgen(path, loci, sample_ids, vcf_hap_0, vcf_hap_1, phased=False)
+
+	_, hap_0, hap_1 = load_bgen(path, unphased_het='second')
+
+	np.testing.assert_array_equal(hap_0 + hap_1, vcf_hap_0 + vcf_hap_1)
+	het = (hap_0 + hap_1) == 1
+	assert np.all(hap_1[het] == 1)
+
+
+def test_missing_index_raises(tmp_path, vcf_haplotypes):
+	loci, sample_ids, vcf_hap_0, vcf_hap_1 = vcf_haplotypes
+	path = str(tmp_path / 'example.bgen')
+	write_bgen(path, loci, sample_ids, vcf_hap_0, vcf_hap_1, phased=True)
+	os.remove(path + '.bgi')
+
+	with pytest.raises(ValueError):
+		load_bgen(path)
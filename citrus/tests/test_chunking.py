@@ -0,0 +1,162 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pheno_sim import PhenoSimulation
+from pheno_sim.chunking import population_passes, sample_chunks
+from pheno_sim.execution_plan import ExecutionPlan
+from pheno_sim.func_nodes import Heritability, StandardScaler, Sum
+from pheno_sim.population_stats import STATISTICS, StatsAccumulator
+
+
+POPULATION_STEPS = [
+	{
+		"type": "RandomConstant", "alias": "beta",
+		"input_match_size": "effects", "dist_name": "normal",
+		"dist_kwargs": {}, "by_feat": True
+	},
+	{
+		"type": "Product", "alias": "scaled_effects",
+		"input_aliases": ["beta", "effects"]
+	},
+	{
+		"type": "GaussianNoise", "alias": "noisy",
+		"input_alias": "scaled_effects", "noise_std": 0.5
+	},
+	{
+		"type": "StandardScaler", "alias": "standardized",
+		"input_alias": "noisy"
+	},
+	{
+		"type": "Heritability", "alias": "herit", "input_alias": "phenotype",
+		"heritability": 0.5
+	},
+	{"type": "RobustScaler", "alias": "robust", "input_alias": "herit"},
+	{
+		"type": "Sum", "alias": "mix",
+		"input_aliases": ["robust", "standardized"]
+	},
+	{
+		"type": "MinMaxScaler", "alias": "min_max", "input_alias": "mix",
+		"by_feat": False
+	},
+]
+
+
+@pytest.fixture
+def population_config(native_config):
+	native_config['simulation_steps'].extend(copy.deepcopy(POPULATION_STEPS))
+	return native_config
+
+
+def concat_chunks(chunks, alias):
+	parts = [chunk_vals[alias] for _, chunk_vals in chunks]
+	if isinstance(parts[0], tuple):
+		return tuple(
+			np.concatenate([np.asarray(part[i]) for part in parts], axis=-1)
+			for i in range(2)
+		)
+	return np.concatenate([np.asarray(part) for part in parts], axis=-1)
+
+
+def test_sample_chunks():
+	assert sample_chunks(10, 4) == [slice(0, 4), slice(4, 8), slice(8, 10)]
+	with pytest.raises(ValueError):
+		sample_chunks(10, 0)
+
+
+def test_population_passes():
+	plan = ExecutionPlan([
+		StandardScaler('scaled', 'x'),
+		Sum('total', ['scaled', 'y']),
+		Heritability('herit', 'total', heritability=0.5),
+		StandardScaler('y_scaled', 'y'),
+	])
+
+	passes = population_passes(plan)
+
+	assert [[step.alias for step in steps] for steps in passes] == [
+		['scaled', 'y_scaled'], ['herit']
+	]
+
+
+@pytest.mark.parametrize('name', list(STATISTICS))
+@pytest.mark.parametrize('by_row', [True, False])
+def test_accumulated_statistics_match_full_statistics(name, by_row):
+	vals = np.random.default_rng(0).normal(size=(3, 1000)).astype(np.float32)
+	accumulator = StatsAccumulator(name, by_row)
+
+	for chunk in sample_chunks(1000, 300):
+		accumulator.add(vals[:, chunk])
+
+	for result, expected in zip(
+		accumulator.result(), STATISTICS[name](vals, by_row)
+	):
+		assert result.dtype == expected.dtype
+		assert result.shape == expected.shape
+		np.testing.assert_allclose(result, expected, rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'blocked'])
+@pytest.mark.parametrize('chunk_size', [7, 1000, 10**6])
+def test_chunked_run_matches_full_run(population_config, backend, chunk_size):
+	expected = PhenoSimulation(
+		copy.deepcopy(population_config), input_cache=False, seed=7
+	).run_simulation()
+	sim = PhenoSimulation(
+		population_config, input_cache=False, seed=7, backend=backend
+	)
+
+	chunks = list(sim.run_simulation_chunked(chunk_size=chunk_size))
+
+	assert len(chunks) == -(-2504 // chunk_size)
+	for alias, vals in expected.items():
+		chunked_vals = concat_chunks(chunks, alias)
+		if not isinstance(vals, tuple):
+			vals, chunked_vals = (vals,), (chunked_vals,)
+		for hap, chunked_hap in zip(vals, chunked_vals):
+			np.testing.assert_allclose(
+				chunked_hap, np.asarray(hap), rtol=1e-10, atol=1e-12
+			)
+	assert all(step.fixed_stats is None for step in sim.simulation_steps)
+
+
+def test_saved_chunked_output_matches_saved_output(
+	tmp_path, population_config
+):
+	sim = PhenoSimulation(
+		copy.deepcopy(population_config), input_cache=False, seed=7
+	)
+	sim.save_output_chunked(
+		sim.run_simulation_chunked(['min_max', 'herit'], chunk_size=500),
+		output_dir=str(tmp_path), output_file_name='chunked.csv',
+		output_config_name='chunked_config.json'
+	)
+	sim = PhenoSimulation(population_config, input_cache=False, seed=7)
+	sim.save_output(
+		sim.run_simulation(['min_max', 'herit']),
+		output_dir=str(tmp_path), output_file_name='full.csv',
+		output_config_name='full_config.json'
+	)
+
+	chunked = pd.read_csv(os.path.join(tmp_path, 'chunked.csv'))
+	full = pd.read_csv(os.path.join(tmp_path, 'full.csv'))
+	assert list(chunked.columns) == list(full.columns)
+	assert (chunked['sample_id'] == full['sample_id']).all()
+	np.testing.assert_allclose(
+		chunked.drop(columns='sample_id').values,
+		full.drop(columns='sample_id').values,
+		rtol=1e-9
+	)
+
+
+def test_unseeded_random_steps_before_population_steps_raise(
+	population_config
+):
+	sim = PhenoSimulation(population_config, input_cache=False)
+
+	with pytest.raises(ValueError):
+		list(sim.run_simulation_chunked(chunk_size=500))
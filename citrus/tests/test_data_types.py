@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from pheno_sim.data_types import (
+	PackedValues, ReadOnlyValuesDict, StackedHaplotypes, select_samples,
+	stack_haplotypes
+)
+from pheno_sim.func_nodes import Clip, Product
+
+
+def test_stack_haplotypes_views_rows_of_one_array():
+	stacked = np.arange(12).reshape(2, 2, 3)
+	hap_vals = (stacked[0], stacked[1])
+
+	result = stack_haplotypes(hap_vals)
+
+	np.testing.assert_array_equal(result, stacked)
+	assert np.shares_memory(result, stacked)
+	assert not result.flags.writeable
+
+
+def test_stack_haplotypes_of_stacked_haplotypes():
+	stacked = np.arange(6).reshape(2, 3)
+
+	assert stack_haplotypes(StackedHaplotypes(stacked)) is stacked
+
+
+def test_stack_haplotypes_different_shapes_raises():
+	x = np.arange(10).reshape(2, 5)
+
+	with pytest.raises(ValueError):
+		stack_haplotypes((x[0, :5], x[1, :3]))
+
+
+def test_stack_haplotypes_copies_separate_arrays():
+	hap_vals = (np.zeros(3), np.ones(3))
+
+	result = stack_haplotypes(hap_vals)
+
+	np.testing.assert_array_equal(result, np.stack(hap_vals))
+
+
+def test_select_samples():
+	vals = np.arange(6).reshape(2, 3)
+	stacked = StackedHaplotypes(np.arange(12).reshape(2, 2, 3))
+
+	np.testing.assert_array_equal(select_samples(vals, [0, 2]), vals[:, [0, 2]])
+	selected = select_samples(stacked, slice(1, 3))
+	assert isinstance(selected, StackedHaplotypes)
+	np.testing.assert_array_equal(selected.stacked, stacked.stacked[..., 1:])
+
+
+def test_stacked_haplotype_nodes_match_per_haplotype_runs():
+	rng = np.random.default_rng(0)
+	hap_vals = (rng.normal(size=(3, 5)), rng.normal(size=(3, 5)))
+	stacked = StackedHaplotypes(np.stack(hap_vals))
+	vals = rng.normal(size=(3, 5))
+
+	product = Product('product', ['hap_vals', 'vals'])
+	clip = Clip('clip', 'hap_vals', min_val=-0.5, max_val=0.5)
+
+	for node, args in ((product, (vals,)), (clip, ())):
+		out = node(stacked, *args)
+		assert isinstance(out, StackedHaplotypes)
+		for hap, hap_out in zip(hap_vals, out):
+			np.testing.assert_array_equal(hap_out, node.run(hap, *args))
+
+
+def test_read_only_values_dict_shares_read_only_views():
+	arr = np.zeros((2, 3))
+	hap_vals = (np.zeros(3), np.ones(3))
+	packed = PackedValues.pack(np.ones((2, 3), dtype=int))
+
+	vals_dict = ReadOnlyValuesDict(arr=arr, hap_vals=hap_vals, packed=packed)
+	vals_copy = vals_dict.copy()
+
+	assert np.shares_memory(vals_copy['arr'], arr)
+	assert arr.flags.writeable
+	shared = (vals_copy['arr'], *vals_copy['hap_vals'], vals_copy['packed'].bits)
+	for vals in shared:
+		with pytest.raises(ValueError):
+			vals[...] = 1
+
+
+def test_read_only_values_dict_keys_are_not_reassigned():
+	vals_dict = ReadOnlyValuesDict(arr=np.zeros(3))
+
+	with pytest.raises(KeyError):
+		vals_dict['arr'] = np.ones(3)
+	with pytest.raises(KeyError):
+		vals_dict.update(arr=np.ones(3))
+
+	vals_dict['new'] = np.ones(3)
+	del vals_dict['arr']
+	assert list(vals_dict) == ['new']
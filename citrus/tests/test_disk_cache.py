@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+
+from pheno_sim.disk_cache import DiskCache, file_identity, make_key
+from pheno_sim.input_nodes.native_input import NativeInputSource
+
+
+EXAMPLE_VCF = os.path.join(
+	os.path.dirname(__file__), '..', '..', 'example-files',
+	'example_gts_chr19.vcf.gz'
+)
+
+
+def set_last_used(cache, key, timestamp):
+	meta_path = os.path.join(cache.cache_dir, key, 'meta.json')
+	os.utime(meta_path, (timestamp, timestamp))
+
+
+def test_put_get_round_trip(tmp_path):
+	cache = DiskCache(tmp_path)
+	arr = np.arange(6).reshape(2, 3)
+
+	cache.put('key', {'arr': arr}, metadata={'a': 1})
+	arrays, metadata = cache.get('key')
+
+	np.testing.assert_array_equal(arrays['arr'], arr)
+	assert not arrays['arr'].flags.writeable
+	assert metadata == {'a': 1}
+	assert cache.get('other_key') is None
+
+
+def test_entries_larger_than_max_bytes_are_not_stored(tmp_path):
+	cache = DiskCache(tmp_path, max_bytes=100)
+
+	cache.put('key', {'arr': np.zeros(100)})
+
+	assert cache.get('key') is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+	cache = DiskCache(tmp_path, max_bytes=3000)
+	for i, key in enumerate(['a', 'b']):
+		cache.put(key, {'arr': np.zeros(128)})
+		set_last_used(cache, key, 1000 + i)
+	cache.get('a')
+
+	cache.put('c', {'arr': np.zeros(128)})
+
+	assert cache.get('a') is not None
+	assert cache.get('b') is None
+	assert cache.get('c') is not None
+
+
+def test_make_key():
+	assert make_key('a', {'x': 1, 'y': 2}) == make_key('a', {'y': 2, 'x': 1})
+	assert make_key('a', {'x': 1}) != make_key('a', {'x': 2})
+
+
+def test_file_identity_changes_with_file(tmp_path):
+	path = tmp_path / 'x.txt'
+	path.write_text('a')
+	identity = file_identity(str(path))
+
+	path.write_text('ab')
+
+	assert file_identity(str(path)) != identity
+	assert file_identity(str(tmp_path / 'missing.txt')) is None
+
+
+def test_input_source_loads_cached_values(tmp_path, monkeypatch):
+	cache = DiskCache(tmp_path)
+	config = {
+		'file': EXAMPLE_VCF,
+		'engine': 'native',
+		'input_nodes': [
+			{'alias': 'snp', 'type': 'SNP', 'chr': '19', 'pos': 280540},
+		],
+	}
+	source = NativeInputSource(dict(config))
+	vals = source.load_inputs(cache)
+
+	def fail(*args):
+		raise AssertionError("Cached values were not used.")
+	monkeypatch.setattr(NativeInputSource, 'load_haplotypes', fail)
+	cached_source = NativeInputSource(dict(config))
+	cached_vals = cached_source.load_inputs(cache)
+
+	np.testing.assert_array_equal(
+		cached_source.input_sample_ids, source.input_sample_ids
+	)
+	for hap, cached_hap in zip(vals['snp'], cached_vals['snp']):
+		np.testing.assert_array_equal(cached_hap, hap)
@@ -0,0 +1,55 @@
+import copy
+
+import numpy as np
+import pytest
+
+from pheno_sim import PhenoSimulation
+from pheno_sim.data_types import DTypePolicy, StackedHaplotypes
+
+
+def test_presets_and_overrides():
+	compact = DTypePolicy('compact')
+	assert (compact.genotype, compact.indicator, compact.float) == (
+		np.int8, np.int8, np.float32
+	)
+
+	policy = DTypePolicy('compact', float='float64')
+	assert policy.float == np.float64
+	assert DTypePolicy.from_config(policy.to_config()) == policy
+	assert DTypePolicy.from_config(None) == DTypePolicy('wide')
+	assert DTypePolicy.from_config('compact') == compact
+
+
+@pytest.mark.parametrize('kwargs', [
+	{'preset': 'narrow'}, {'genotypes': 'int8'}, {'float': 'int32'}
+])
+def test_invalid_policies_raise(kwargs):
+	with pytest.raises(ValueError):
+		DTypePolicy(**kwargs)
+
+
+def test_cast_float_narrows_wide_floats():
+	policy = DTypePolicy('compact')
+	stacked = StackedHaplotypes(np.zeros((2, 3)))
+
+	assert policy.cast_float(np.zeros(3)).dtype == np.float32
+	assert policy.cast_float(np.zeros(3, dtype=np.int64)).dtype == np.int64
+	assert policy.cast_float(stacked).stacked.dtype == np.float32
+	assert policy.as_float(np.zeros(3, dtype=np.int8)).dtype == np.float32
+
+
+def test_compact_simulation_matches_wide(native_config):
+	wide = PhenoSimulation(copy.deepcopy(native_config), input_cache=False)
+	compact = PhenoSimulation(
+		native_config, input_cache=False, dtype_policy='compact'
+	)
+
+	wide_vals = wide.run_simulation()
+	compact_vals = compact.run_simulation()
+
+	assert compact_vals['chr19_280540_G_A'][0].dtype == np.int8
+	assert compact_vals['phenotype'].dtype == np.float32
+	np.testing.assert_allclose(
+		compact_vals['phenotype'], wide_vals['phenotype'], rtol=1e-6
+	)
+	assert compact.get_config()['dtype_policy']['preset'] == 'compact'
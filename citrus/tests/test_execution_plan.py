@@ -0,0 +1,254 @@
+import time
+
+import numpy as np
+import pytest
+
+from pheno_sim.base_nodes import AbstractBaseFunctionNode
+from pheno_sim.data_types import PackedValues, ReadOnlyValuesDict
+from pheno_sim.execution_plan import ExecutionPlan
+from pheno_sim.func_nodes import (
+	AdditiveCombine, GaussianNoise, Heritability, Product, Sum, SumReduce
+)
+
+
+class SlowScale(AbstractBaseFunctionNode):
+	""" Multiplies its input by a factor after sleeping, so concurrent
+	steps finish in a different order than they were started.
+	"""
+
+	def __init__(self, alias: str, input_alias: str, factor: float, delay: float):
+		super().__init__(alias)
+		self.inputs = input_alias
+		self.factor = factor
+		self.delay = delay
+
+	def run(self, input_vals):
+		time.sleep(self.delay)
+		return input_vals * self.factor
+
+
+def input_vals():
+	return ReadOnlyValuesDict({
+		'x': np.arange(12, dtype=float).reshape(3, 4),
+		'y': np.arange(4, dtype=float),
+	})
+
+
+def unordered_steps():
+	# Listed before the steps they take input from
+	return [
+		SumReduce('phenotype', 'total'),
+		Sum('total', ['scaled', 'y']),
+		Product('scaled', ['x', 'y']),
+		Product('unused', ['x', 'x']),
+	]
+
+
+def branching_steps():
+	# Later branches finish first when run concurrently
+	steps = [
+		SlowScale(f'branch_{i}', 'x', i + 1, 0.05 * (4 - i))
+		for i in range(4)
+	]
+	steps.append(Sum('total', [f'branch_{i}' for i in range(4)]))
+	steps.append(SumReduce('phenotype', 'total'))
+	return steps
+
+
+def test_concurrent_run_matches_serial_run():
+	serial = ExecutionPlan(branching_steps()).run(input_vals())
+	concurrent = ExecutionPlan(branching_steps()).run(
+		input_vals(), max_workers=4
+	)
+
+	assert list(concurrent) == list(serial)
+	for alias in serial:
+		np.testing.assert_array_equal(concurrent[alias], serial[alias])
+
+
+def test_concurrent_run_values_in_step_order():
+	vals = ExecutionPlan(branching_steps()).run(input_vals(), max_workers=4)
+
+	assert list(vals) == [
+		'x', 'y', 'branch_0', 'branch_1', 'branch_2', 'branch_3', 'total',
+		'phenotype'
+	]
+
+
+def test_steps_run_after_their_inputs():
+	plan = ExecutionPlan(unordered_steps(), optimize=False)
+
+	assert [step.alias for step in plan.steps] == [
+		'scaled', 'total', 'phenotype', 'unused'
+	]
+	assert plan.required_inputs == ['x', 'y']
+
+
+def test_outputs_prune_unneeded_steps():
+	plan = ExecutionPlan(unordered_steps(), outputs=['total'])
+
+	assert [step.alias for step in plan.steps] == ['scaled', 'total']
+
+	vals = plan.run(input_vals())
+	np.testing.assert_array_equal(
+		vals['total'],
+		np.arange(12).reshape(3, 4) * np.arange(4) + np.arange(4)
+	)
+	assert 'unused' not in vals
+
+
+def test_output_input_node_is_required():
+	plan = ExecutionPlan(unordered_steps(), outputs=['phenotype', 'x'])
+
+	assert plan.required_inputs == ['x', 'y']
+
+
+def test_duplicate_aliases_raise():
+	with pytest.raises(ValueError):
+		ExecutionPlan([Sum('total', ['x', 'y']), Sum('total', ['x', 'x'])])
+
+
+def test_cycle_raises():
+	with pytest.raises(ValueError):
+		ExecutionPlan([Sum('a', ['x', 'b']), Sum('b', ['a', 'y'])])
+
+
+def test_intermediate_values_are_released():
+	vals = ExecutionPlan(unordered_steps(), outputs=['phenotype']).run(
+		input_vals()
+	)
+
+	assert set(vals) == {'x', 'y', 'phenotype'}
+
+
+def test_input_values_are_released_when_requested():
+	vals = ExecutionPlan(unordered_steps(), outputs=['phenotype']).run(
+		input_vals(), release_inputs=True
+	)
+
+	assert set(vals) == {'phenotype'}
+
+
+def test_all_values_are_kept_without_outputs():
+	vals = ExecutionPlan(unordered_steps()).run(input_vals())
+
+	assert set(vals) == {'x', 'y', 'scaled', 'total', 'phenotype', 'unused'}
+
+
+def chain_steps():
+	steps = [Sum('step_0', ['x', 'x'])]
+	steps.extend(Sum(f'step_{i}', [f'step_{i - 1}', 'x']) for i in range(1, 6))
+	return steps
+
+
+def test_released_values_lower_peak_live_bytes():
+	kept = ExecutionPlan(chain_steps())
+	released = ExecutionPlan(chain_steps(), outputs=['step_5'])
+
+	kept_vals = kept.run(input_vals())
+	released_vals = released.run(input_vals())
+
+	np.testing.assert_array_equal(released_vals['step_5'], kept_vals['step_5'])
+	assert released.peak_live_bytes < kept.peak_live_bytes
+
+
+def noisy_steps():
+	return [
+		Product('scaled', ['x', 'y']),
+		GaussianNoise('noisy', 'scaled', noise_std=1.0),
+		SumReduce('phenotype', 'noisy'),
+	]
+
+
+def test_replicated_run_adds_replicate_axis():
+	plan = ExecutionPlan(noisy_steps())
+	single = ExecutionPlan(noisy_steps()).run(input_vals())
+
+	vals = plan.run(input_vals(), n_replicates=5)
+
+	assert plan.replicated_aliases == {'noisy', 'phenotype'}
+	# Not replicated, so broadcast without copying
+	assert vals['scaled'].shape == (5, 3, 4)
+	assert vals['scaled'].strides[0] == 0
+	for rep in range(5):
+		np.testing.assert_array_equal(vals['scaled'][rep], single['scaled'])
+	assert vals['phenotype'].shape == (5, 4)
+	assert not np.allclose(vals['phenotype'][0], vals['phenotype'][1])
+
+
+def test_replicated_run_matches_repeated_runs():
+	steps = [
+		SumReduce('total', 'x'),
+		Heritability('phenotype', 'total', heritability=0.3),
+	]
+
+	np.random.seed(5)
+	batched = ExecutionPlan(steps).run(input_vals(), n_replicates=4)
+	np.random.seed(5)
+	repeated = [ExecutionPlan(steps).run(input_vals()) for _ in range(4)]
+
+	np.testing.assert_allclose(
+		batched['phenotype'],
+		np.stack([vals['phenotype'] for vals in repeated])
+	)
+
+
+def packed_haplotype_vals(packed):
+	haps = [
+		np.random.default_rng(seed).integers(0, 2, (3, 4))
+		for seed in range(2)
+	]
+	if packed:
+		haps = [PackedValues.pack(hap) for hap in haps]
+	return ReadOnlyValuesDict({
+		'haps': tuple(haps),
+		'w': np.ones((3, 1)),
+	})
+
+
+def packed_haplotype_steps():
+	# Two replicated steps take the same packed input
+	return [
+		GaussianNoise('weights', 'w', noise_std=1.0),
+		Product('effects', ['haps', 'weights']),
+		Product('doubled', ['haps', 'weights', 'weights']),
+		Sum('total', ['effects', 'doubled']),
+		AdditiveCombine('combined', 'total'),
+		SumReduce('phenotype', 'combined'),
+	]
+
+
+def test_replicated_run_unpacks_packed_inputs_once(monkeypatch):
+	np.random.seed(3)
+	expected = ExecutionPlan(packed_haplotype_steps(), ['phenotype']).run(
+		packed_haplotype_vals(False), n_replicates=3
+	)
+
+	n_unpacked = []
+	unpack = PackedValues.unpack
+
+	def counting_unpack(self, dtype=int):
+		n_unpacked.append(self.n_feats)
+		return unpack(self, dtype)
+
+	monkeypatch.setattr(PackedValues, 'unpack', counting_unpack)
+
+	np.random.seed(3)
+	plan = ExecutionPlan(packed_haplotype_steps(), ['phenotype'])
+	vals = plan.run(packed_haplotype_vals(True), n_replicates=3)
+
+	# Once per haplotype
+	assert len(n_unpacked) == 2
+	np.testing.assert_allclose(vals['phenotype'], expected['phenotype'])
+	assert vals['phenotype'].shape == (3, 4)
+	# The unpacked haplotypes count towards the peak
+	unpacked_nbytes = sum(
+		hap.unpack(plan.steps[0].dtype_policy.genotype).nbytes
+		for hap in packed_haplotype_vals(True)['haps']
+	)
+	assert plan.peak_live_bytes > unpacked_nbytes
+
+
+def test_invalid_n_replicates_raises():
+	with pytest.raises(ValueError):
+		ExecutionPlan(noisy_steps()).run(input_vals(), n_replicates=0)
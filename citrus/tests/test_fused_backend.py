@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from pheno_sim.data_types import (
+	PackedValues, ReadOnlyValuesDict, StackedHaplotypes
+)
+from pheno_sim.execution_plan import ExecutionPlan
+from pheno_sim.func_nodes import (
+	AdditiveCombine, Clip, Concatenate, Constant, MaxCombine, MeanReduce,
+	Product, ReLU, Sigmoid, StandardScaler, Sum, SumReduce
+)
+from pheno_sim.fused_backend import FusedPlan
+
+
+def input_vals():
+	rng = np.random.default_rng(0)
+	return ReadOnlyValuesDict({
+		'g': StackedHaplotypes(
+			rng.integers(0, 2, (2, 7, 3000), dtype=np.int8)
+		),
+		'v': rng.normal(size=3000),
+		'p': PackedValues.pack(rng.integers(0, 2, (11, 3000))),
+	})
+
+
+def steps():
+	return [
+		Constant('beta', 'g', constant=0.1),
+		Product('effect', ['beta', 'g']),
+		Sum('shifted', ['effect', 'v']),
+		Clip('clipped', 'shifted', min_val=-0.5, max_val=1.5),
+		ReLU('relu', 'clipped', neg_slope=0.3),
+		Sigmoid('sigmoid', 'relu'),
+		MaxCombine('max_hap', 'sigmoid'),
+		AdditiveCombine('dosage', 'g'),
+		Concatenate('concat', ['max_hap', 'dosage', 'v']),
+		MeanReduce('mean', 'concat'),
+		SumReduce('n_alt', 'p'),
+		StandardScaler('scaled', 'mean'),
+		Sum('phenotype', ['scaled', 'n_alt']),
+	]
+
+
+def assert_values_close(actual, expected):
+	assert list(actual) == list(expected)
+	for alias in expected:
+		if isinstance(expected[alias], tuple):
+			for hap, expected_hap in zip(actual[alias], expected[alias]):
+				np.testing.assert_allclose(hap, expected_hap, rtol=1e-10)
+		else:
+			np.testing.assert_allclose(
+				np.asarray(actual[alias]), np.asarray(expected[alias]),
+				rtol=1e-10
+			)
+
+
+@pytest.mark.parametrize('outputs', [None, ['phenotype']])
+def test_blocked_run_matches_plan_run(outputs):
+	expected = ExecutionPlan(steps(), outputs=outputs).run(input_vals())
+
+	fused_plan = FusedPlan(
+		ExecutionPlan(steps(), outputs=outputs), use_numba=False,
+		block_size=1000
+	)
+	vals = fused_plan.run(input_vals(), max_workers=2)
+
+	assert any(len(stage) > 1 for stage in fused_plan.stages)
+	assert_values_close(vals, expected)
+
+
+def test_numba_run_matches_plan_run(tmp_path, monkeypatch):
+	pytest.importorskip('numba')
+	monkeypatch.setenv('CITRUS_CACHE_DIR', str(tmp_path))
+	expected = ExecutionPlan(steps()).run(input_vals())
+
+	fused_plan = FusedPlan(ExecutionPlan(steps()), use_numba=True)
+	vals = fused_plan.run(input_vals())
+
+	assert any(len(stage) > 1 for stage in fused_plan.stages)
+	assert_values_close(vals, expected)
+	assert len(list((tmp_path / 'codegen').glob('*.py'))) > 0
+
+
+def test_invalid_block_size_raises():
+	with pytest.raises(ValueError):
+		FusedPlan(ExecutionPlan(steps()), use_numba=False, block_size=0)
@@ -0,0 +1,73 @@
+import numpy as np
+
+from pheno_sim.data_types import ReadOnlyValuesDict, StackedHaplotypes
+from pheno_sim.execution_plan import ExecutionPlan
+from pheno_sim.func_nodes import (
+	AdditiveCombine, Constant, Identity, Product, Sum, SumReduce
+)
+
+
+def input_vals():
+	rng = np.random.default_rng(0)
+	return ReadOnlyValuesDict({
+		'gene': StackedHaplotypes(
+			rng.integers(0, 2, size=(2, 3, 10)).astype(float)
+		),
+	})
+
+
+def linear_steps():
+	return [
+		Constant('beta', 'gene', [0.1, 0.2, 0.3]),
+		Identity('beta_copy', 'beta'),
+		Constant('scale', 'gene', 2.0),
+		Product('beta_scaled', ['beta_copy', 'scale']),
+		Product('effect', ['beta_scaled', 'gene']),
+		Product('effect_dup', ['beta_scaled', 'gene']),
+		AdditiveCombine('combined', 'effect'),
+		AdditiveCombine('combined_dup', 'effect_dup'),
+		Sum('total', ['combined', 'combined_dup']),
+		SumReduce('phenotype', 'total'),
+	]
+
+
+def assert_values_equal(actual, expected):
+	assert list(actual) == list(expected)
+	for alias, vals in expected.items():
+		if isinstance(vals, tuple):
+			for hap_actual, hap_expected in zip(actual[alias], vals):
+				np.testing.assert_array_equal(hap_actual, hap_expected)
+		else:
+			np.testing.assert_array_equal(actual[alias], vals)
+
+
+def test_optimized_run_matches_unoptimized_run():
+	expected = ExecutionPlan(linear_steps(), optimize=False).run(input_vals())
+	actual = ExecutionPlan(linear_steps()).run(input_vals())
+
+	assert_values_equal(actual, expected)
+
+
+def test_optimized_run_keeps_step_order():
+	vals = ExecutionPlan(linear_steps()).run(input_vals())
+
+	assert list(vals) == ['gene'] + [step.alias for step in linear_steps()]
+
+
+def test_optimized_plan_with_outputs():
+	expected = ExecutionPlan(linear_steps(), optimize=False).run(input_vals())
+	plan = ExecutionPlan(linear_steps(), outputs=['beta_scaled', 'phenotype'])
+	actual = plan.run(input_vals(), release_inputs=True)
+
+	assert list(actual) == ['beta_scaled', 'phenotype']
+	for alias in actual:
+		np.testing.assert_array_equal(actual[alias], expected[alias])
+
+
+def test_optimizer_replaces_identity_and_duplicates():
+	plan = ExecutionPlan(linear_steps())
+	run_aliases = [step.alias for step in plan.steps]
+
+	assert plan.replaced_aliases['beta_copy'] == 'beta'
+	assert 'effect_dup' not in run_aliases
+	assert {'beta', 'scale', 'beta_scaled'} <= plan.compact_aliases
@@ -0,0 +1,167 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import pheno_sim
+from pheno_sim.data_types import PackedValues, stack_haplotypes
+from pheno_sim.input_nodes.input_runner import InputRunner
+
+
+def write_vcf(path, sample_ids, records):
+	""" Writes a VCF with one record per (pos, GT fields) in records. """
+	lines = [
+		'##fileformat=VCFv4.2',
+		'\t'.join(
+			['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO',
+			'FORMAT'] + sample_ids
+		),
+	]
+	for pos, gts in records:
+		lines.append('\t'.join(
+			['1', str(pos), '.', 'A', 'G', '.', '.', '.', 'GT'] + gts
+		))
+	with open(path, 'w') as f:
+		f.write('\n'.join(lines) + '\n')
+
+
+@pytest.fixture
+def input_config(tmp_path):
+	write_vcf(
+		str(tmp_path / 'a.vcf'),
+		['s1', 's2', 's3', 's4'],
+		[(100, ['0|0', '0|1', '1|0', '1|1'])]
+	)
+	# Samples in a different order, and without s3
+	write_vcf(
+		str(tmp_path / 'b.vcf'),
+		['s4', 's2', 's1'],
+		[(200, ['1|1', '1|0', '0|1'])]
+	)
+	return [
+		{
+			'file': str(tmp_path / 'a.vcf'),
+			'engine': 'native',
+			'input_nodes': [
+				{'alias': 'snp_a', 'type': 'SNP', 'chr': '1', 'pos': 100}
+			],
+		},
+		{
+			'file': str(tmp_path / 'b.vcf'),
+			'engine': 'native',
+			'input_nodes': [
+				{'alias': 'snp_b', 'type': 'SNP', 'chr': '1', 'pos': 200}
+			],
+		},
+	]
+
+
+def test_samples_in_all_sources_in_first_source_order(input_config):
+	runner = InputRunner(input_config, input_cache=False, max_workers=1)
+
+	sample_ids, vals = runner()
+
+	assert list(sample_ids) == ['s1', 's2', 's4']
+	np.testing.assert_array_equal(
+		stack_haplotypes(vals['snp_a']), [[0, 0, 1], [0, 1, 1]]
+	)
+	np.testing.assert_array_equal(
+		stack_haplotypes(vals['snp_b']), [[0, 1, 1], [1, 0, 1]]
+	)
+
+
+def test_packed_sources_in_different_sample_orders(input_config):
+	for source_config in input_config:
+		source_config['bit_packed'] = True
+	runner = InputRunner(input_config, input_cache=False, max_workers=1)
+
+	sample_ids, vals = runner()
+
+	assert list(sample_ids) == ['s1', 's2', 's4']
+	assert all(isinstance(v, PackedValues) for v in vals['snp_b'])
+	np.testing.assert_array_equal(
+		[v.unpack() for v in vals['snp_a']], [[0, 0, 1], [0, 1, 1]]
+	)
+	np.testing.assert_array_equal(
+		[v.unpack() for v in vals['snp_b']], [[0, 1, 1], [1, 0, 1]]
+	)
+
+
+def test_duplicate_sample_ids_raise(input_config):
+	write_vcf(
+		input_config[1]['file'],
+		['s4', 's2', 's2'],
+		[(200, ['1|1', '1|0', '0|1'])]
+	)
+	runner = InputRunner(input_config, input_cache=False, max_workers=1)
+
+	with pytest.raises(ValueError):
+		runner()
+
+
+def test_concurrent_loading_matches_sequential(input_config):
+	sequential = InputRunner(input_config, input_cache=False, max_workers=1)
+	concurrent = InputRunner(input_config, input_cache=False, max_workers=2)
+
+	sequential_ids, sequential_vals = sequential()
+	concurrent_ids, concurrent_vals = concurrent()
+
+	np.testing.assert_array_equal(concurrent_ids, sequential_ids)
+	for alias in sequential_vals:
+		np.testing.assert_array_equal(
+			stack_haplotypes(concurrent_vals[alias]),
+			stack_haplotypes(sequential_vals[alias])
+		)
+	# Config defaults set while loading in worker processes are kept
+	assert concurrent.get_config() == sequential.get_config()
+
+
+LOAD_AFTER_NUMBA_SCRIPT = """
+import json
+import sys
+
+import numpy as np
+from numba import njit, prange
+
+from pheno_sim.input_nodes.input_runner import InputRunner
+
+
+@njit(parallel=True)
+def double(x):
+	out = np.empty_like(x)
+	for i in prange(x.shape[0]):
+		out[i] = 2 * x[i]
+	return out
+
+
+if __name__ == '__main__':
+	double(np.arange(100000.0))
+	runner = InputRunner(
+		json.loads(sys.argv[1]), input_cache=False, max_workers=2
+	)
+	sample_ids, _ = runner()
+	assert list(sample_ids) == ['s1', 's2', 's4']
+"""
+
+
+def test_concurrent_loading_after_numba_parallel_run(input_config, tmp_path):
+	pytest.importorskip('numba')
+	script = tmp_path / 'load_after_numba.py'
+	script.write_text(LOAD_AFTER_NUMBA_SCRIPT)
+
+	env = dict(os.environ)
+	env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+		os.path.dirname(os.path.dirname(pheno_sim.__file__)),
+		env.get('PYTHONPATH'),
+	]))
+
+	# Worker processes forked after Numba started its threads hang on exit
+	result = subprocess.run(
+		[sys.executable, str(script), json.dumps(input_config)],
+		capture_output=True, text=True, timeout=120, env=env
+	)
+
+	assert result.returncode == 0, result.stderr
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from pheno_sim.data_types import DTypePolicy
+from pheno_sim.func_nodes import Concatenate, Product, Sum
+
+
+def mixed_inputs():
+	rng = np.random.default_rng(0)
+	return [
+		rng.integers(0, 3, size=(4, 6)).astype(np.int8),
+		rng.normal(size=6),
+		rng.normal(size=(4, 6)).astype(np.float32),
+	]
+
+
+@pytest.mark.parametrize(
+	'node_type,ufunc', [(Sum, np.add), (Product, np.multiply)]
+)
+def test_accumulation_matches_reducing_cast_inputs(node_type, ufunc):
+	inputs = mixed_inputs()
+	node = node_type('out', ['a', 'b', 'c'])
+
+	out = node(*inputs)
+
+	expected = ufunc(
+		ufunc(inputs[0].astype(float), inputs[1]), inputs[2].astype(float)
+	)
+	assert out.dtype == np.float64
+	assert out.shape == (4, 6)
+	np.testing.assert_array_equal(out, expected)
+
+
+def test_accumulation_uses_policy_float_dtype():
+	node = Sum('out', ['a', 'b', 'c'])
+	node.dtype_policy = DTypePolicy('compact')
+
+	out = node(*mixed_inputs())
+
+	assert out.dtype == np.float32
+
+
+def test_accumulation_on_haplotypes():
+	inputs = mixed_inputs()
+	hap_vals = (inputs[0], inputs[0] + 1)
+
+	out = Sum('out', ['a', 'b'])(hap_vals, inputs[1])
+
+	for hap, hap_out in zip(hap_vals, out):
+		np.testing.assert_array_equal(hap_out, hap + inputs[1])
+
+
+def test_concatenate_rows():
+	vector = np.arange(3)
+	matrix = np.arange(6).reshape(2, 3) * 1.5
+
+	out = Concatenate('out', ['a', 'b'])(vector, matrix)
+
+	np.testing.assert_array_equal(out, np.vstack([vector, matrix]))
+	assert out.dtype == np.float64
+
+
+def test_concatenate_different_samples_raises():
+	with pytest.raises(ValueError):
+		Concatenate('out', ['a', 'b'])(np.arange(3), np.arange(4))
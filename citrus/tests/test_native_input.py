@@ -0,0 +1,93 @@
+import copy
+import gzip
+import os
+
+import numpy as np
+import pytest
+
+from pheno_sim.data_types import stack_haplotypes
+from pheno_sim.input_nodes.native_input import NativeInputSource
+
+
+EXAMPLE_VCF = os.path.join(
+	os.path.dirname(__file__), '..', '..', 'example-files',
+	'example_gts_chr19.vcf.gz'
+)
+
+VCF_LINES = [
+	'##fileformat=VCFv4.2',
+	'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ts1\ts2\ts3',
+	'1\t100\t.\tA\tG\t.\t.\t.\tGT\t0|1\t1|1\t0|0',
+	'1\t200\t.\tC\tT\t.\t.\t.\tGT:DP\t1|0:5\t0|0:3\t0|1:2',
+	'2\t50\t.\tG\tA\t.\t.\t.\tGT\t1|1\t0|1\t1|0',
+]
+
+
+def source_config(vcf_path, **kwargs):
+	return {
+		'file': vcf_path,
+		'engine': 'native',
+		'input_nodes': [
+			{'alias': 'snp_a', 'type': 'SNP', 'chr': '1', 'pos': 100},
+			{'alias': 'snp_bc', 'type': 'SNP', 'chr': ['1', '2'], 'pos': [200, 50]},
+		],
+		**kwargs
+	}
+
+
+def load_stacked(config):
+	source = NativeInputSource(copy.deepcopy(config))
+	vals = source.load_inputs()
+	return source, {
+		alias: np.asarray(stack_haplotypes(v)) for alias, v in vals.items()
+	}
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_load_phased_genotypes(tmp_path, compress):
+	vcf_path = str(tmp_path / ('x.vcf.gz' if compress else 'x.vcf'))
+	text = '\n'.join(VCF_LINES) + '\n'
+	if compress:
+		with gzip.open(vcf_path, 'wt') as f:
+			f.write(text)
+	else:
+		with open(vcf_path, 'w') as f:
+			f.write(text)
+
+	source, vals = load_stacked(source_config(vcf_path))
+
+	assert list(source.input_sample_ids) == ['s1', 's2', 's3']
+	np.testing.assert_array_equal(vals['snp_a'], [[0, 1, 0], [1, 1, 0]])
+	np.testing.assert_array_equal(
+		vals['snp_bc'],
+		[[[1, 0, 0], [1, 0, 1]], [[0, 0, 1], [1, 1, 0]]]
+	)
+
+
+def test_unphased_genotypes_raise(tmp_path):
+	vcf_path = str(tmp_path / 'x.vcf')
+	with open(vcf_path, 'w') as f:
+		f.write('\n'.join(VCF_LINES).replace('0|1\t1|1', '0/1\t1|1') + '\n')
+
+	with pytest.raises(ValueError):
+		load_stacked(source_config(vcf_path))
+
+
+def test_indexed_read_matches_full_scan():
+	config = {
+		'file': EXAMPLE_VCF,
+		'engine': 'native',
+		'input_nodes': [
+			{'alias': 'snp_0', 'type': 'SNP', 'chr': '19', 'pos': 280540},
+			{'alias': 'snp_1', 'type': 'SNP', 'chr': '19', 'pos': [523746]},
+		],
+	}
+
+	indexed_source, indexed = load_stacked(config)
+	scan_source, scanned = load_stacked({**config, 'use_index': False})
+
+	np.testing.assert_array_equal(
+		indexed_source.input_sample_ids, scan_source.input_sample_ids
+	)
+	for alias in scanned:
+		np.testing.assert_array_equal(indexed[alias], scanned[alias])
@@ -0,0 +1,111 @@
+import copy
+
+import numpy as np
+import pytest
+
+from pheno_sim import PhenoSimulation
+from pheno_sim.data_types import DTypePolicy, PackedValues, select_samples
+from pheno_sim.func_nodes import (
+	AdditiveCombine, AnyReduce, MaxCombine, Product, Sum, SumReduce
+)
+from pheno_sim.func_nodes.math_func import PACKED_BLOCK_SIZE
+
+
+def genotypes(n_feats=11, n_samples=20):
+	rng = np.random.default_rng(0)
+	return rng.integers(0, 2, size=(n_feats, n_samples))
+
+
+def test_pack_unpack_round_trip():
+	vals = genotypes()
+	packed = PackedValues.pack(vals)
+
+	assert packed.shape == vals.shape
+	assert packed.bits.shape == (2, 20)
+	np.testing.assert_array_equal(packed.unpack(), vals)
+	np.testing.assert_array_equal(PackedValues.pack(vals[0]).unpack(), vals[0])
+
+
+def test_select_samples_stays_packed():
+	vals = genotypes()
+	packed = PackedValues.pack(vals)
+
+	for sample_idx in (slice(3, 9), [0, 5, 19]):
+		selected = select_samples(packed, sample_idx)
+		assert isinstance(selected, PackedValues)
+		np.testing.assert_array_equal(selected.unpack(), vals[:, sample_idx])
+
+
+def test_reduce_nodes_on_packed_values():
+	vals = genotypes()
+	packed = PackedValues.pack(vals)
+
+	np.testing.assert_array_equal(
+		SumReduce('sum', 'vals')(packed), SumReduce('sum', 'vals')(vals)
+	)
+	np.testing.assert_array_equal(
+		AnyReduce('any', 'vals')(packed), AnyReduce('any', 'vals')(vals)
+	)
+
+
+def test_packed_inputs_unpacked_to_genotype_dtype():
+	vals = genotypes()
+	hap_vals = (PackedValues.pack(vals), PackedValues.pack(vals[::-1]))
+
+	combine = MaxCombine('combine', 'hap_vals')
+	combine.dtype_policy = DTypePolicy('compact')
+	unpacked = combine._unpack_if_unsupported(hap_vals)
+	assert [v.dtype for v in unpacked] == [np.int8, np.int8]
+
+	np.testing.assert_array_equal(
+		combine(hap_vals), np.maximum(vals, vals[::-1])
+	)
+
+
+def test_packed_nodes_unpack_one_block_at_a_time(monkeypatch):
+	n_samples = 2 * PACKED_BLOCK_SIZE + 5
+	vals = genotypes(n_samples=n_samples)
+	other_vals = genotypes(n_samples=n_samples)[::-1]
+	hap_vals = (PackedValues.pack(vals), PackedValues.pack(other_vals))
+	beta = np.linspace(-1, 1, len(vals))[:, None]
+
+	unpacked_samples = []
+	unpack = PackedValues.unpack
+
+	def recording_unpack(self, dtype=int):
+		unpacked_samples.append(self.shape[-1])
+		return unpack(self, dtype)
+	monkeypatch.setattr(PackedValues, 'unpack', recording_unpack)
+
+	combine = AdditiveCombine('combine', 'hap_vals')
+	combine.dtype_policy = DTypePolicy('compact')
+	combined = combine(hap_vals)
+	assert combined.dtype == np.int8
+	np.testing.assert_array_equal(combined, vals + other_vals)
+
+	effects = Product('effects', ['beta', 'hap_vals'])(beta, hap_vals)
+	np.testing.assert_array_equal(effects[0], beta * vals)
+	np.testing.assert_array_equal(effects[1], beta * other_vals)
+
+	total = Sum('total', ['hap_vals', 'beta'])(hap_vals, beta)
+	np.testing.assert_array_equal(total[0], vals + beta)
+
+	assert max(unpacked_samples) == PACKED_BLOCK_SIZE
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'blocked'])
+def test_packed_simulation_matches_unpacked(native_config, backend):
+	outputs = ['chr19_280540_G_A_effect', 'effects', 'phenotype']
+	expected = PhenoSimulation(
+		copy.deepcopy(native_config), input_cache=False
+	).run_simulation(outputs)
+	native_config['input'][0]['bit_packed'] = True
+
+	vals = PhenoSimulation(
+		native_config, input_cache=False, backend=backend
+	).run_simulation(outputs)
+
+	for alias in outputs:
+		np.testing.assert_array_equal(
+			np.asarray(vals[alias]), np.asarray(expected[alias])
+		)
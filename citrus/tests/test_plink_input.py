@@ -0,0 +1,106 @@
+import copy
+import os
+
+import numpy as np
+import pytest
+
+from pheno_sim.input_nodes.native_input import NativeInputSource
+from pheno_sim.input_nodes.plink_input import PlinkInputSource
+
+
+EXAMPLE_VCF = os.path.join(
+	os.path.dirname(__file__), '..', '..', 'example-files',
+	'example_gts_chr19.vcf.gz'
+)
+
+INPUT_NODES = [
+	{'alias': 'snp_0', 'type': 'SNP', 'chr': '19', 'pos': 280540},
+	{'alias': 'snp_1', 'type': 'SNP', 'chr': '19', 'pos': [523746]},
+]
+
+
+def write_bed(prefix, loci, sample_ids, alt_counts):
+	""" Writes a .bed fileset with A1 as the alternate allele. """
+	# Number of A1 alleles -> 2-bit code (3 is also used for padding)
+	codes = np.array([3, 2, 0], dtype=np.uint8)[alt_counts]
+	codes = np.pad(codes, ((0, 0), (0, -len(sample_ids) % 4)), constant_values=3)
+	codes = codes.reshape(len(loci), -1, 4)
+	packed = (
+		codes[..., 0] | codes[..., 1] << 2 | codes[..., 2] << 4
+		| codes[..., 3] << 6
+	).astype(np.uint8)
+
+	with open(prefix + '.bed', 'wb') as f:
+		f.write(bytes([0x6c, 0x1b, 0x01]) + packed.tobytes())
+	with open(prefix + '.bim', 'w') as f:
+		for i, (chrom, pos) in enumerate(loci):
+			f.write(f"{chrom}\tvar_{i}\t0\t{pos}\tT\tC\n")
+	with open(prefix + '.fam', 'w') as f:
+		for sample_id in sample_ids:
+			f.write(f"{sample_id} {sample_id} 0 0 0 -9\n")
+
+
+@pytest.fixture(scope='module')
+def vcf_haplotypes():
+	source = NativeInputSource({
+		'file': EXAMPLE_VCF, 'engine': 'native', 'input_nodes': INPUT_NODES
+	})
+	loci = source.get_required_loci()
+	hap_0, hap_1 = source.load_haplotypes(loci)
+	return loci, list(source.input_sample_ids), hap_0, hap_1
+
+
+@pytest.fixture
+def bed_prefix(tmp_path, vcf_haplotypes):
+	loci, sample_ids, hap_0, hap_1 = vcf_haplotypes
+	prefix = str(tmp_path / 'example')
+	write_bed(prefix, loci, sample_ids, hap_0 + hap_1)
+	return prefix
+
+
+def load_bed(prefix, **kwargs):
+	source = PlinkInputSource({
+		'file': prefix + '.bed',
+		'engine': 'plink',
+		'input_nodes': copy.deepcopy(INPUT_NODES),
+		**kwargs
+	})
+	hap_0, hap_1 = source.load_haplotypes(source.get_required_loci())
+	return source, hap_0, hap_1
+
+
+def test_bed_dosages_match_vcf(bed_prefix, vcf_haplotypes):
+	_, sample_ids, vcf_hap_0, vcf_hap_1 = vcf_haplotypes
+
+	source, hap_0, hap_1 = load_bed(bed_prefix)
+
+	assert list(source.input_sample_ids) == sample_ids
+	np.testing.assert_array_equal(hap_0 + hap_1, vcf_hap_0 + vcf_hap_1)
+
+
+@pytest.mark.parametrize('unphased_het,on_hap', [('first', 0), ('second', 1)])
+def test_bed_unphased_het_assignment(bed_prefix, unphased_het, on_hap):
+	_, *haps = load_bed(bed_prefix, unphased_het=unphased_het)
+
+	het = (haps[0] + haps[1]) == 1
+	assert np.all(haps[on_hap][het] == 1)
+	assert np.all(haps[1 - on_hap][het] == 0)
+
+
+def test_bed_random_unphased_het_is_reproducible(bed_prefix):
+	source, hap_0, hap_1 = load_bed(bed_prefix, unphased_het='random')
+	seed = source.input_config['unphased_het_seed']
+
+	_, rerun_hap_0, _ = load_bed(
+		bed_prefix, unphased_het='random', unphased_het_seed=seed
+	)
+
+	np.testing.assert_array_equal(rerun_hap_0, hap_0)
+
+
+def test_bed_alt_allele_a2(bed_prefix, vcf_haplotypes):
+	_, _, vcf_hap_0, vcf_hap_1 = vcf_haplotypes
+
+	_, hap_0, hap_1 = load_bed(bed_prefix, alt_allele='A2')
+
+	np.testing.assert_array_equal(hap_0 + hap_1, 2 - (vcf_hap_0 + vcf_hap_1))
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from pheno_sim.population_stats import (
+	mean_std, median_iqr, memoize, min_max
+)
+
+
+def numpy_stats(vals, by_row):
+	axis = -1 if by_row else None
+	q25, q75 = np.percentile(vals, [25, 75], axis=axis, keepdims=True)
+	return {
+		'mean_std': (
+			np.mean(vals, axis=axis, keepdims=True),
+			np.std(vals, axis=axis, keepdims=True)
+		),
+		'min_max': (
+			np.min(vals, axis=axis, keepdims=True),
+			np.max(vals, axis=axis, keepdims=True)
+		),
+		'median_iqr': (
+			np.median(vals, axis=axis, keepdims=True), q75 - q25
+		),
+	}
+
+
+@pytest.mark.parametrize('n_samples', [1, 2, 7, 100])
+@pytest.mark.parametrize('by_row', [True, False])
+def test_statistics_match_numpy(n_samples, by_row):
+	vals = np.random.default_rng(0).normal(size=(3, n_samples))
+	expected = numpy_stats(vals, by_row)
+
+	for name, stat in (
+		('mean_std', mean_std), ('min_max', min_max),
+		('median_iqr', median_iqr)
+	):
+		for result, expected_result in zip(stat(vals, by_row), expected[name]):
+			assert result.shape == expected_result.shape
+			np.testing.assert_allclose(result, expected_result, rtol=1e-12)
+			assert not result.flags.writeable
+
+
+def test_median_iqr_of_vectors_and_nan():
+	vals = np.array([3.0, 1.0, np.nan, 2.0])
+
+	median, iqr = median_iqr(vals)
+
+	assert median.shape == (1,)
+	assert np.isnan(median[0]) and np.isnan(iqr[0])
+
+
+def test_statistics_are_memoized_within_block():
+	vals = np.random.default_rng(0).normal(size=(3, 10))
+
+	with memoize():
+		assert mean_std(vals) is mean_std(vals)
+		assert mean_std(vals) is not mean_std(vals, by_row=False)
+		# Views of the same values share statistics
+		assert min_max(vals[:2]) is min_max(vals[:2])
+		assert min_max(vals[:2]) is not min_max(vals[1:])
+
+	assert mean_std(vals) is not mean_std(vals)
@@ -0,0 +1,154 @@
+import copy
+
+import numpy as np
+import pytest
+
+from pheno_sim import PhenoSimulation
+from pheno_sim.func_nodes import FunctionNodeBuilder
+from pheno_sim.data_types import StackedHaplotypes
+from pheno_sim.random_streams import SAMPLE_BLOCK_SIZE, RandomStream
+
+
+STEPS = [
+	{
+		"type": "RandomConstant", "alias": "beta", "input_match_size": "g",
+		"dist_name": "normal", "dist_kwargs": {}, "by_feat": True
+	},
+	{"type": "Product", "alias": "effect", "input_aliases": ["beta", "g"]},
+	{"type": "AdditiveCombine", "alias": "dosage", "input_alias": "effect"},
+	{"type": "SumReduce", "alias": "total", "input_alias": "dosage"},
+	{
+		"type": "GaussianNoise", "alias": "noise", "input_alias": "dosage",
+		"noise_std": 1.0
+	},
+	{"type": "SumReduce", "alias": "noise_total", "input_alias": "noise"},
+	{
+		"type": "Heritability", "alias": "phenotype", "input_alias": "total",
+		"heritability": 0.4
+	},
+	{
+		"type": "Sum", "alias": "noisy_phenotype",
+		"input_aliases": ["phenotype", "noise_total"]
+	},
+]
+
+
+def input_vals():
+	rng = np.random.default_rng(0)
+	return {
+		'g': StackedHaplotypes(
+			rng.integers(0, 2, (2, 5, 10000), dtype=np.int8)
+		)
+	}
+
+
+def run(seed=None, config_seed=None, n_replicates=None, **kwargs):
+	config = {"input": [], "simulation_steps": copy.deepcopy(STEPS)}
+	if config_seed is not None:
+		config['seed'] = config_seed
+	sim = PhenoSimulation(config, seed=seed, **kwargs)
+	vals = sim.run_simulation_steps(input_vals(), n_replicates=n_replicates)
+	return sim, vals
+
+
+def assert_values_equal(actual, expected):
+	assert list(actual) == list(expected)
+	for alias in expected:
+		np.testing.assert_allclose(
+			np.asarray(actual[alias]), np.asarray(expected[alias]), rtol=1e-12
+		)
+
+
+@pytest.mark.parametrize(
+	'offset', [1, SAMPLE_BLOCK_SIZE - 1, SAMPLE_BLOCK_SIZE, 10000]
+)
+def test_draws_for_sample_ranges_match_full_draw(offset):
+	stream = RandomStream(42, 'noise')
+	stream.start_run(0)
+	full = stream.draw('normal', (3, 20000), {'scale': 2})
+
+	stream.start_run(0, sample_offset=offset)
+	part = stream.draw('normal', (3, 5000), {'scale': 2})
+
+	np.testing.assert_array_equal(part, full[:, offset:offset + 5000])
+
+
+def test_threaded_draws_match_serial_draws():
+	serial = RandomStream(42, 'noise', max_workers=1)
+	threaded = RandomStream(42, 'noise', max_workers=4)
+	serial.start_run(0)
+	threaded.start_run(0)
+
+	np.testing.assert_array_equal(
+		threaded.draw('standard_normal', (4, 300000)),
+		serial.draw('standard_normal', (4, 300000))
+	)
+
+
+def test_streams_differ_by_alias_and_run():
+	stream = RandomStream(42, 'noise')
+	other = RandomStream(42, 'other_noise')
+	stream.start_run(0)
+	other.start_run(0)
+	vals = stream.draw('normal', (3, 100))
+
+	assert not np.allclose(other.draw('normal', (3, 100)), vals)
+	stream.start_run(1)
+	assert not np.allclose(stream.draw('normal', (3, 100)), vals)
+
+
+def test_negative_seed_raises():
+	with pytest.raises(ValueError):
+		RandomStream(-1, 'noise')
+
+
+@pytest.mark.parametrize('kwargs', [
+	{'sim_workers': 3},
+	{'backend': 'blocked'},
+	{'sim_workers': 3, 'backend': 'blocked'},
+])
+def test_seeded_runs_match_for_any_workers_and_backend(kwargs):
+	_, expected = run(seed=7)
+
+	_, vals = run(seed=7, **kwargs)
+
+	assert_values_equal(vals, expected)
+
+
+def test_config_seed_and_other_seeds():
+	sim, expected = run(seed=7)
+
+	_, config_seeded = run(config_seed=7)
+	_, other_seed = run(seed=8)
+
+	assert_values_equal(config_seeded, expected)
+	assert not np.allclose(other_seed['noise_total'], expected['noise_total'])
+	assert sim.get_config()['seed'] == 7
+
+
+def test_sim_from_steps_list_uses_seed_and_dtype_policy():
+	_, expected = run(seed=7, dtype_policy='compact')
+	builder = FunctionNodeBuilder()
+	steps = []
+	for step_config in copy.deepcopy(STEPS):
+		steps.append(builder.create_node(step_config.pop('type'), **step_config))
+
+	sim = PhenoSimulation.from_sim_steps_list(
+		steps, seed=7, dtype_policy='compact'
+	)
+	vals = sim.run_simulation_steps(input_vals())
+
+	assert_values_equal(vals, expected)
+	assert vals['noise_total'].dtype == np.float32
+	assert sim.seed == 7
+	assert all(step.dtype_policy == sim.dtype_policy for step in steps)
+
+
+def test_seeded_replicates_are_reproducible():
+	sim, vals = run(seed=7, n_replicates=3)
+	rerun_vals = sim.run_simulation_steps(input_vals(), n_replicates=3)
+	_, new_sim_vals = run(seed=7, n_replicates=3)
+
+	# Later runs of a simulation draw new values
+	assert not np.allclose(rerun_vals['phenotype'], vals['phenotype'])
+	np.testing.assert_array_equal(new_sim_vals['phenotype'], vals['phenotype'])
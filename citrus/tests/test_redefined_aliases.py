@@ -0,0 +1,110 @@
+import copy
+import json
+import os
+
+import numpy as np
+import pytest
+
+from pheno_sim import PhenoSimulation
+
+
+REPO_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+
+REDEFINING_STEPS = [
+	{
+		'type': 'Sum', 'alias': 'doubled',
+		'input_aliases': ['phenotype', 'phenotype']
+	},
+	# Redefines phenotype using its earlier definition
+	{
+		'type': 'Sum', 'alias': 'phenotype',
+		'input_aliases': ['phenotype', 'doubled']
+	},
+	{
+		'type': 'Sum', 'alias': 'after',
+		'input_aliases': ['phenotype', 'phenotype']
+	},
+]
+
+
+@pytest.fixture
+def redefining_config(native_config):
+	native_config['simulation_steps'].extend(
+		copy.deepcopy(REDEFINING_STEPS)
+	)
+	return native_config
+
+
+def base_phenotype(native_config):
+	sim = PhenoSimulation(copy.deepcopy(native_config), input_cache=False)
+	return sim.run_simulation(['phenotype'])['phenotype']
+
+
+def test_steps_use_latest_earlier_definition(native_config):
+	expected = base_phenotype(native_config)
+	native_config['simulation_steps'].extend(copy.deepcopy(REDEFINING_STEPS))
+	sim = PhenoSimulation(native_config, input_cache=False)
+
+	vals = sim.run_simulation()
+
+	np.testing.assert_allclose(vals['doubled'], 2 * expected)
+	np.testing.assert_allclose(vals['phenotype'], 3 * expected)
+	np.testing.assert_allclose(vals['after'], 6 * expected)
+	assert 'phenotype#1' not in vals
+	assert [
+		step['alias'] for step in sim.get_config()['simulation_steps']
+	].count('phenotype') == 2
+
+
+@pytest.mark.parametrize('kwargs', [
+	{'backend': 'blocked'},
+	{'sim_workers': 3},
+	{'optimize': False},
+])
+def test_redefined_outputs_match_for_any_backend(redefining_config, kwargs):
+	expected = PhenoSimulation(
+		copy.deepcopy(redefining_config), input_cache=False
+	).run_simulation(['phenotype', 'after'])
+
+	vals = PhenoSimulation(
+		redefining_config, input_cache=False, **kwargs
+	).run_simulation(['phenotype', 'after'])
+
+	for alias in expected:
+		np.testing.assert_allclose(vals[alias], expected[alias])
+
+
+def test_rerun_after_updating_earlier_definition(redefining_config):
+	sim = PhenoSimulation(
+		copy.deepcopy(redefining_config), input_cache=False
+	)
+	first = sim.rerun()
+	sim.update_node('phenotype#1', type='MeanReduce')
+	vals = sim.rerun()
+
+	redefining_config['simulation_steps'][-4]['type'] = 'MeanReduce'
+	expected = PhenoSimulation(
+		redefining_config, input_cache=False
+	).run_simulation()
+
+	assert list(vals) == list(expected)
+	for alias in expected:
+		np.testing.assert_allclose(
+			np.asarray(vals[alias]), np.asarray(expected[alias])
+		)
+	assert not np.allclose(vals['after'], first['after'])
+
+
+@pytest.mark.parametrize('config_path', [
+	'doc/example_nbs/json_configs/complex_pheno_1.json',
+	'paper/pheno_sim/sim_configs/complex_pheno_1.json',
+])
+def test_shipped_configs_with_redefined_aliases_validate(config_path):
+	with open(os.path.join(REPO_DIR, config_path)) as f:
+		config = json.load(f)
+	sim = PhenoSimulation(config, input_cache=False)
+
+	specs = sim.validate()
+
+	assert specs['EID2B_deleterious_multiplier#1'].feat_shape != ()
+	assert specs['EID2B_deleterious_multiplier'].feat_shape == ()
@@ -0,0 +1,62 @@
+import copy
+
+import numpy as np
+import pytest
+
+from pheno_sim import PhenoSimulation
+
+
+@pytest.fixture
+def heritability_config(native_config):
+	native_config['simulation_steps'].append({
+		'type': 'Heritability',
+		'alias': 'noisy_phenotype',
+		'input_alias': 'phenotype',
+		'heritability': 0.5
+	})
+	return native_config
+
+
+def test_rerun_only_runs_updated_steps(heritability_config, monkeypatch):
+	sim = PhenoSimulation(heritability_config, input_cache=False, seed=3)
+	first = sim.rerun()
+
+	def fail():
+		raise AssertionError("Input values were loaded again.")
+	monkeypatch.setattr(sim, 'run_input_step', fail)
+	sim.update_node('chr19_523746_C_T_beta', constant=0.6)
+	second = sim.rerun()
+
+	for alias in ('chr19_280540_G_A', 'chr19_280540_G_A_effect'):
+		assert second[alias] is first[alias]
+	assert not np.allclose(second['phenotype'], first['phenotype'])
+
+
+def test_rerun_matches_new_simulation(heritability_config):
+	sim = PhenoSimulation(
+		copy.deepcopy(heritability_config), input_cache=False, seed=3
+	)
+	sim.rerun()
+	sim.update_node('chr19_523746_C_T_beta', constant=0.6)
+	sim.update_node('noisy_phenotype', heritability=0.2)
+	vals = sim.rerun()
+
+	heritability_config['simulation_steps'][1]['constant'] = 0.6
+	heritability_config['simulation_steps'][-1]['heritability'] = 0.2
+	new_sim = PhenoSimulation(heritability_config, input_cache=False, seed=3)
+	expected = new_sim.run_simulation()
+
+	assert sim.get_config()['simulation_steps'] == (
+		new_sim.get_config()['simulation_steps']
+	)
+	for alias in expected:
+		np.testing.assert_allclose(
+			np.asarray(vals[alias]), np.asarray(expected[alias]), rtol=1e-12
+		)
+
+
+def test_update_unknown_node_raises(heritability_config):
+	sim = PhenoSimulation(heritability_config, input_cache=False)
+
+	with pytest.raises(ValueError):
+		sim.update_node('not_a_step', constant=1.0)
@@ -0,0 +1,136 @@
+import copy
+
+import numpy as np
+
+from pheno_sim import PhenoSimulation
+from pheno_sim.data_types import ReadOnlyValuesDict
+from pheno_sim.disk_cache import DiskCache
+from pheno_sim.execution_plan import ExecutionPlan
+from pheno_sim.func_nodes import StandardScaler, SumReduce
+from pheno_sim.result_store import ResultStore
+
+
+STEP_CONFIGS = {
+	'scaled': {'type': 'StandardScaler', 'input_alias': 'x', 'by_feat': False},
+	'phenotype': {'type': 'SumReduce', 'input_alias': 'scaled'},
+}
+
+
+def input_vals(x=None):
+	if x is None:
+		x = np.arange(12, dtype=float).reshape(3, 4)
+	return ReadOnlyValuesDict({'x': x})
+
+
+def run_stored(store, x=None, fixed_stats=None, step_configs=STEP_CONFIGS):
+	steps = [
+		StandardScaler('scaled', 'x', by_feat=False),
+		SumReduce('phenotype', 'scaled'),
+	]
+	steps[0].fixed_stats = fixed_stats
+	plan = ExecutionPlan(steps)
+	vals_dict = input_vals(x)
+	stored_run = store.start_run(plan, vals_dict, step_configs)
+	return plan.run(vals_dict, stored_run=stored_run)
+
+
+def test_rerun_loads_stored_outputs(tmp_path):
+	store = ResultStore(DiskCache(tmp_path))
+
+	first = run_stored(store)
+	assert (store.hits, store.misses) == (0, 2)
+
+	second = run_stored(store)
+	assert (store.hits, store.misses) == (2, 2)
+	for alias in first:
+		np.testing.assert_array_equal(second[alias], first[alias])
+
+
+def test_changed_input_is_not_loaded(tmp_path):
+	store = ResultStore(DiskCache(tmp_path))
+	run_stored(store)
+
+	x = np.arange(12, dtype=float).reshape(3, 4) ** 2
+	vals = run_stored(store, x=x)
+
+	assert store.hits == 0
+	expected = run_stored(ResultStore(DiskCache(tmp_path / 'other')), x=x)
+	np.testing.assert_array_equal(vals['phenotype'], expected['phenotype'])
+
+
+def test_changed_config_is_not_loaded(tmp_path):
+	store = ResultStore(DiskCache(tmp_path))
+	run_stored(store)
+
+	run_stored(store, step_configs={
+		**STEP_CONFIGS,
+		'scaled': {**STEP_CONFIGS['scaled'], 'by_feat': True},
+	})
+
+	assert store.hits == 0
+
+
+def test_changed_fixed_stats_are_not_loaded(tmp_path):
+	# In chunked runs, a chunk's scaled values depend on the statistics of
+	# all samples, not only on the values of the chunk
+	store = ResultStore(DiskCache(tmp_path))
+	stats_a = (np.array(0.0), np.array(1.0))
+	stats_b = (np.array(5.0), np.array(2.0))
+
+	vals_a = run_stored(store, fixed_stats=stats_a)
+	vals_b = run_stored(store, fixed_stats=stats_b)
+
+	assert store.hits == 0
+	assert not np.array_equal(vals_a['scaled'], vals_b['scaled'])
+
+	run_stored(store, fixed_stats=stats_a)
+	assert store.hits == 2
+
+
+def noisy_config(config):
+	config['simulation_steps'].append({
+		'type': 'GaussianNoise',
+		'alias': 'noisy_phenotype',
+		'input_alias': 'phenotype',
+		'noise_std': 1.0
+	})
+	return config
+
+
+def run_simulation(config, store, seed=None):
+	sim = PhenoSimulation(
+		copy.deepcopy(config), input_cache=False, seed=seed,
+		result_store=store
+	)
+	return sim.run_simulation()
+
+
+def test_seeded_simulation_loads_stored_outputs(tmp_path, native_config):
+	store = ResultStore(DiskCache(tmp_path))
+	config = noisy_config(native_config)
+
+	first = run_simulation(config, store, seed=1)
+	misses = store.misses
+	second = run_simulation(config, store, seed=1)
+
+	assert misses > 0
+	assert store.misses == misses
+	assert store.hits == misses
+	for alias in first:
+		np.testing.assert_array_equal(
+			np.asarray(second[alias]), np.asarray(first[alias])
+		)
+
+
+def test_unseeded_random_steps_are_not_stored(tmp_path, native_config):
+	store = ResultStore(DiskCache(tmp_path))
+	config = noisy_config(native_config)
+
+	first = run_simulation(config, store)
+	hits = store.hits
+	second = run_simulation(config, store)
+
+	assert store.hits > hits
+	assert not np.allclose(
+		second['noisy_phenotype'], first['noisy_phenotype']
+	)
@@ -0,0 +1,89 @@
+import copy
+
+import pytest
+
+from pheno_sim import PhenoSimulation
+from pheno_sim.input_nodes.native_input import NativeInputSource
+from pheno_sim.shape_inference import ValueSpec
+
+
+@pytest.fixture
+def no_loading(monkeypatch):
+	def fail(*args):
+		raise AssertionError("Input data was loaded.")
+	monkeypatch.setattr(NativeInputSource, 'load_haplotypes', fail)
+
+
+def test_specs_match_simulated_values(native_config):
+	sim = PhenoSimulation(native_config, input_cache=False)
+	specs = sim.validate()
+
+	vals = sim.run_simulation()
+
+	assert set(specs) == set(vals)
+	for alias, spec in specs.items():
+		assert ValueSpec.of(vals[alias], len(sim.sample_ids)) == spec
+	assert specs['chr19_280540_G_A'].haplotype
+	assert specs['effects_by_haplotype'].feat_shape == (2,)
+	assert specs['phenotype'].feat_shape == ()
+
+
+def test_compact_policy_specs(native_config, no_loading):
+	sim = PhenoSimulation(
+		native_config, input_cache=False, dtype_policy='compact'
+	)
+
+	specs = sim.validate()
+
+	assert specs['chr19_280540_G_A'].dtype == 'int8'
+	assert specs['phenotype'].dtype == 'float32'
+
+
+def test_all_problems_reported_before_loading(native_config, no_loading):
+	config = copy.deepcopy(native_config)
+	steps = config['simulation_steps']
+	steps[2]['input_aliases'][1] = 'chr19_28054_G_A'
+	steps.extend([
+		{
+			'type': 'AdditiveCombine', 'alias': 'dosage',
+			'input_alias': 'chr19_523746_C_T'
+		},
+		# Not HaplotypeValues
+		{
+			'type': 'AdditiveCombine', 'alias': 'bad_combine',
+			'input_alias': 'dosage'
+		},
+		{
+			'type': 'Concatenate', 'alias': 'two_rows',
+			'input_aliases': ['dosage', 'dosage']
+		},
+		{
+			'type': 'Concatenate', 'alias': 'three_rows',
+			'input_aliases': ['dosage', 'dosage', 'dosage']
+		},
+		# Shapes do not broadcast
+		{
+			'type': 'Sum', 'alias': 'bad_sum',
+			'input_aliases': ['two_rows', 'three_rows']
+		},
+		{
+			'type': 'SumReduce', 'alias': 'downstream',
+			'input_alias': 'bad_sum'
+		},
+	])
+	sim = PhenoSimulation(config, input_cache=False)
+
+	with pytest.raises(ValueError) as error:
+		sim.run_simulation()
+
+	message = str(error.value)
+	for alias in ('chr19_28054_G_A', 'bad_combine', 'bad_sum'):
+		assert alias in message
+	assert "'downstream'" not in message
+
+
+def test_unknown_outputs_raise(native_config, no_loading):
+	sim = PhenoSimulation(native_config, input_cache=False)
+
+	with pytest.raises(ValueError):
+		sim.validate(['phenotype', 'not_a_value'])
@@ -1,6 +1,9 @@
 __version__ = "0.1.0"
 
-from .data_types import HaplotypeValues, Values, ValuesDict
+from .data_types import (
+    HaplotypeValues, Values, ValuesDict, PackedValues, DTypePolicy,
+    StackedHaplotypes
+)
 
 from .base_nodes import (
     AbstractBaseInputNode,
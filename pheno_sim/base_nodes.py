@@ -3,7 +3,11 @@
 from abc import ABC, abstractmethod
 from typing import List, Dict, Union, TypedDict
 import numpy as np
-from pheno_sim.data_types import HaplotypeValues, Values, ValuesDict
+from pheno_sim.data_types import (
+	DTypePolicy, HaplotypeValues, PackedValues, StackedHaplotypes, Values,
+	ValuesDict, stack_haplotypes
+)
+from pheno_sim.population_stats import STATISTICS
 
 
 class AbstractBaseInputNode(ABC):
@@ -85,6 +89,67 @@ class AbstractBaseFunctionNode(ABC):
 			value of the key in input_mapping is passed to the function. If
 			the value of a key in input_mapping is a List[str], then the values
 			in the ValuesDict are returned as a list in that order.
+
+	Class attributes:
+		supports_packed: Whether run() accepts PackedValues inputs. If
+			False (default), PackedValues inputs are unpacked (to the
+			dtype policy's genotype dtype) before run() is called.
+		dtype_policy: DTypePolicy of the simulation the node is run in.
+			Nodes use it for the dtypes of values they create, and float
+			outputs wider than its float dtype are narrowed. Set per node
+			by PhenoSimulation. Defaults to the 'wide' preset.
+		haplotype_vectorized: Whether run() can process both haplotypes
+			in one call. If True, HaplotypeValues inputs are passed to
+			run() stacked as one (2, ...) array, with Values inputs given a
+			leading axis of size 1 so they broadcast across haplotypes.
+			Only set this for nodes that apply elementwise (broadcasting)
+			operations, since all axes are shifted by one.
+		replicate_vectorized: Whether run() can process all replicates of
+			a replicated run (see ExecutionPlan.run) in one call. If True,
+			all inputs are given a leading replicate axis, otherwise run()
+			is called once per replicate. Like haplotype_vectorized, only
+			set this for nodes whose run() treats leading axes as batch
+			axes (e.g. element-wise operations, or random draws of the
+			input's shape).
+		broadcast_constant: Whether the output only depends on the shapes
+			of the inputs and is constant along all axes but the first
+			(feature) axis, e.g. Constant. If True, the graph optimizer
+			runs the node on size 1 arrays in place of the broadcast axes
+			and broadcasts its output only where it is used (see
+			graph_optimizer).
+		constant_foldable: Whether run() computes each output value with
+			exact element-wise operations (e.g. addition, comparisons) of
+			the corresponding, broadcast, input values, so running it on
+			compact inputs and broadcasting the output gives the same
+			values as running it on broadcast inputs. If True and all
+			inputs are compact constants, the graph optimizer runs the
+			node on the compact values.
+		sample_wise: Whether each sample's output values only depend on
+			that sample's input values (e.g. element-wise operations and
+			reductions over features), so run() gives the same values when
+			called on any block of samples. The fused backend (see
+			fused_backend) runs groups of such nodes block by block.
+		uses_random: Whether run() draws random numbers. When steps run
+			concurrently, nodes that use random numbers without a
+			random_stream run one at a time in plan order, so results
+			with a seeded global random state are the same as running
+			the steps one after another. Custom nodes that draw random
+			numbers should set this.
+		random_stream: RandomStream the node draws random numbers from
+			(see random_streams), or None to use NumPy's global random
+			state or unseeded generators. Set per node by PhenoSimulation
+			when the simulation has a seed. Custom nodes that set
+			uses_random should draw from it when it is set.
+		population_stat: Name of the statistic over samples (a key of
+			population_stats.STATISTICS, e.g. 'mean_std') the node scales
+			its input with, or None. Nodes that set it get the statistic
+			with population_stats(), so chunked runs (see
+			PhenoSimulation.run_simulation_chunked) can compute it over
+			all samples in an earlier pass and fix it.
+		population_by_row: Whether the population statistic is computed
+			for each row (over the last axis) or over all values.
+		fixed_stats: Statistic returned by population_stats() in place of
+			computing it from the input, or None. Set by chunked runs.
 	
 	Methods:
 
@@ -97,7 +162,24 @@ class AbstractBaseFunctionNode(ABC):
 			Returns a dict of updates to the config dict that should be
 			made to reflect random selections made in the simulation for
 			reproducability.
+
+		population_stats(self, vals) -> tuple
+			Returns the node's population statistic of its input values,
+			or fixed_stats if set.
 	"""
+	supports_packed = False
+	dtype_policy = DTypePolicy()
+	haplotype_vectorized = False
+	replicate_vectorized = False
+	broadcast_constant = False
+	constant_foldable = False
+	sample_wise = False
+	uses_random = False
+	random_stream = None
+	population_stat = None
+	population_by_row = True
+	fixed_stats = None
+
 	def __init__(self, alias: str, *args, **kwargs):
 		self.alias = alias
 		self.inputs = None
@@ -110,6 +192,18 @@ class AbstractBaseFunctionNode(ABC):
 	) -> Values:
 		pass
 
+	def _unpack_if_unsupported(self, arg):
+		""" Returns arg, with PackedValues (including in HaplotypeValues)
+		unpacked to the genotype dtype if the node does not support them.
+		"""
+		if self.supports_packed:
+			return arg
+		if isinstance(arg, PackedValues):
+			return arg.unpack(self.dtype_policy.genotype)
+		if isinstance(arg, tuple) and not isinstance(arg, StackedHaplotypes):
+			return tuple(self._unpack_if_unsupported(a) for a in arg)
+		return arg
+
 	def __call__(
 		self,
 		*args: Union[Values, HaplotypeValues],
@@ -129,9 +223,16 @@ class AbstractBaseFunctionNode(ABC):
 		- If any of the inputs are HaplotypeValues objects, then the run()
 			is called twice (once for each haplotype) and a single
 			HaplotypeValues object is returned. Any Values objects are
-			used as inputs to both calls.
+			used as inputs to both calls. If the node is
+			haplotype_vectorized, run() is instead called once on the
+			stacked haplotypes (see _run_stacked).
 
 		"""
+		args = [self._unpack_if_unsupported(arg) for arg in args]
+		kwargs = {
+			key: self._unpack_if_unsupported(arg)
+			for key, arg in kwargs.items()
+		}
 		
 		includes_haplotypes = False
 
@@ -145,6 +246,12 @@ class AbstractBaseFunctionNode(ABC):
 				includes_haplotypes = True
 				break
 
+		if includes_haplotypes and self.haplotype_vectorized:
+			ret_vals = self._run_stacked(args, kwargs)
+
+			if ret_vals is not None:
+				return self.dtype_policy.cast_float(ret_vals)
+
 		if includes_haplotypes:
 			hap1_args = []
 			hap2_args = []
@@ -155,7 +262,7 @@ class AbstractBaseFunctionNode(ABC):
 				if isinstance(arg, tuple):
 					hap1_args.append(arg[0])
 					hap2_args.append(arg[1])
-				elif isinstance(arg, np.ndarray):
+				elif isinstance(arg, (np.ndarray, PackedValues)):
 					hap1_args.append(arg)
 					hap2_args.append(arg)
 				else:
@@ -168,7 +275,7 @@ class AbstractBaseFunctionNode(ABC):
 				if isinstance(arg, tuple):
 					hap1_kwargs[key] = arg[0]
 					hap2_kwargs[key] = arg[1]
-				elif isinstance(arg, np.ndarray):
+				elif isinstance(arg, (np.ndarray, PackedValues)):
 					hap1_kwargs[key] = arg
 					hap2_kwargs[key] = arg
 				else:
@@ -188,15 +295,75 @@ class AbstractBaseFunctionNode(ABC):
 				if len(ret_vals[i].shape) == 2 and ret_vals[i].shape[0] == 1:
 					ret_vals[i] = ret_vals[i][0]
 
-			return tuple(ret_vals)
+			return self.dtype_policy.cast_float(tuple(ret_vals))
 		else:
 			ret_val = self.run(*args, **kwargs)
 			# if is 1 x n matrix, convert to vector
 			if len(ret_val.shape) == 2 and ret_val.shape[0] == 1:
-				return ret_val[0]
-			else:
-				return ret_val
+				ret_val = ret_val[0]
+
+			return self.dtype_policy.cast_float(ret_val)
 		
+	def _run_stacked(self, args, kwargs):
+		""" Runs run() once on both haplotypes for haplotype_vectorized
+		nodes.
+
+		Each HaplotypeValues input is stacked into a (2, ...) array (no copy
+		is made for StackedHaplotypes, e.g. input node values and outputs of
+		other haplotype_vectorized nodes) and Values inputs get a leading
+		axis of size 1. All inputs are padded with size 1 axes to the same
+		number of per-haplotype dimensions, so broadcasting matches calling
+		run() per haplotype.
+
+		Returns:
+			StackedHaplotypes of the output, or None if the inputs cannot
+			be stacked, in which case run() should be called per haplotype.
+		"""
+		hap_ndim = 0
+		for arg in (*args, *kwargs.values()):
+			if isinstance(arg, StackedHaplotypes):
+				hap_ndim = max(hap_ndim, arg.stacked.ndim - 1)
+			elif isinstance(arg, tuple):
+				if (
+					len(arg) != 2
+					or not isinstance(arg[0], np.ndarray)
+					or not isinstance(arg[1], np.ndarray)
+					or arg[0].shape != arg[1].shape
+				):
+					return None
+				hap_ndim = max(hap_ndim, arg[0].ndim)
+			elif isinstance(arg, np.ndarray):
+				hap_ndim = max(hap_ndim, arg.ndim)
+			else:
+				return None
+
+		def stack(arg):
+			if isinstance(arg, tuple):
+				stacked = stack_haplotypes(arg)
+				if stacked.ndim == hap_ndim + 1:
+					return stacked
+				return stacked.reshape(
+					(2,) + (1,) * (hap_ndim + 1 - stacked.ndim)
+					+ stacked.shape[1:]
+				)
+			if arg.ndim == hap_ndim + 1:
+				return arg
+			return arg.reshape((1,) * (hap_ndim + 1 - arg.ndim) + arg.shape)
+
+		ret_val = np.asarray(self.run(
+			*[stack(arg) for arg in args],
+			**{key: stack(arg) for key, arg in kwargs.items()}
+		))
+
+		if ret_val.ndim == 0 or ret_val.shape[0] != 2:
+			ret_val = np.broadcast_to(ret_val, (2,) + ret_val.shape[1:])
+
+		# if is 1 x n matrix per haplotype, convert to vector
+		if ret_val.ndim == 3 and ret_val.shape[1] == 1:
+			ret_val = ret_val[:, 0]
+
+		return StackedHaplotypes(ret_val)
+
 	def get_config_updates(self) -> dict:
 		""" Used to update the config dict with random selections made. 
 		
@@ -205,6 +372,16 @@ class AbstractBaseFunctionNode(ABC):
 		"""
 		return dict()
 
+	def population_stats(self, vals) -> tuple:
+		""" Returns the population statistic (see population_stat) of the
+		input values, or fixed_stats if set.
+		"""
+		if self.fixed_stats is not None:
+			return self.fixed_stats
+		return STATISTICS[self.population_stat](
+			vals, by_row=self.population_by_row
+		)
+
 
 class AbstractBaseCombineFunctionNode(AbstractBaseFunctionNode):
 	""" Abstract base class for combine function nodes.
@@ -233,6 +410,11 @@ class AbstractBaseCombineFunctionNode(AbstractBaseFunctionNode):
 
 		Does type checking that the inputs are all HaplotypeValues.
 		"""
+		args = [self._unpack_if_unsupported(arg) for arg in args]
+		kwargs = {
+			key: self._unpack_if_unsupported(arg)
+			for key, arg in kwargs.items()
+		}
 
 		for arg in args:
 			if not isinstance(arg, tuple):
@@ -246,5 +428,5 @@ class AbstractBaseCombineFunctionNode(AbstractBaseFunctionNode):
 					"CombineFunctionNode inputs must be HaplotypeValues objects."
 				)
 
-		return self.run(*args, **kwargs)
+		return self.dtype_policy.cast_float(self.run(*args, **kwargs))
 		
\ No newline at end of file
@@ -0,0 +1,79 @@
+""" Helpers for running simulations on chunks of samples (see
+PhenoSimulation.run_simulation_chunked), so only the values of one chunk
+are held at once.
+
+Most steps compute each sample's values from that sample's input values,
+and steps that draw random numbers from a RandomStream draw each sample's
+values independently of the samples drawn with it (see random_streams),
+so they give the same values when run chunk by chunk. Steps that scale
+with statistics over all samples (those that set population_stat, e.g.
+Heritability and the scalers) do not. Their statistics are computed in
+passes over the chunks before the final pass:
+
+	- Pass 0 runs the steps needed for the inputs of population steps that
+		do not depend on other population steps, and accumulates their
+		statistics (see population_stats.StatsAccumulator).
+	- Pass k does the same for population steps that depend on population
+		steps of pass k - 1, which are run with their statistics fixed.
+
+A simulation without population steps is run in a single pass.
+
+Example:
+	passes = population_passes(plan)
+	chunks = sample_chunks(n_samples, DEFAULT_CHUNK_SIZE)
+"""
+
+from typing import List
+
+from pheno_sim.base_nodes import AbstractBaseFunctionNode
+from pheno_sim.random_streams import SAMPLE_BLOCK_SIZE
+
+
+# Default number of samples per chunk. Chunks that start at multiples of
+# the random stream block size do not draw and drop values of the samples
+# before them.
+DEFAULT_CHUNK_SIZE = 16 * SAMPLE_BLOCK_SIZE
+
+
+def sample_chunks(n_samples: int, chunk_size: int) -> List[slice]:
+	""" Returns slices of consecutive chunks of chunk_size samples (the last
+	chunk may be smaller) covering n_samples samples.
+	"""
+	if chunk_size < 1:
+		raise ValueError("chunk_size must be a positive int.")
+	return [
+		slice(start, min(start + chunk_size, n_samples))
+		for start in range(0, n_samples, chunk_size)
+	]
+
+
+def population_passes(plan) -> List[List[AbstractBaseFunctionNode]]:
+	""" Returns the steps of an ExecutionPlan that set population_stat,
+	grouped by the pass over the chunks their statistics are computed in.
+
+	A step's pass is the number of population steps it depends on through
+	its longest chain of inputs, so the population steps a step depends on
+	have their statistics fixed in earlier passes.
+
+	Args:
+		plan: ExecutionPlan of the simulation steps to run.
+
+	Returns:
+		List of lists of steps, one list per pass, in plan order.
+	"""
+	levels = dict()
+	passes = []
+
+	for step in plan.steps:
+		level = max(
+			(levels.get(alias, 0) for alias in plan.dependencies[step.alias]),
+			default=0
+		)
+		if step.population_stat is not None:
+			if level == len(passes):
+				passes.append([])
+			passes[level].append(step)
+			level += 1
+		levels[step.alias] = level
+
+	return passes
@@ -12,14 +12,414 @@ Data types:
 		indexed such that for each chromosome, the first item in the tuple is
         always the value from the same copy of the chromosome. And similarly,
         the second item in the tuple is always the value from the other copy
-        of the chromosome.
+        of the chromosome. Input nodes and haplotype_vectorized function
+        nodes return StackedHaplotypes, whose two arrays are views of one
+        stacked (2, ...) array.
         
+	StackedHaplotypes: HaplotypeValues stored as one (2, ...) array, with
+		the tuple items being views of it.
+
 	ValuesDict: A dictionary of Values or HaplotypeValues.
+
+	ReadOnlyValuesDict: A ValuesDict whose arrays are read-only views and
+		whose existing keys cannot be overwritten, so values can be shared
+		between simulation runs without copying.
+
+	PackedValues: Values that are all 0 or 1 (e.g. biallelic haplotypes),
+		stored bit-packed along the feature dimension. Input sources produce
+		these when 'bit_packed' is set in their config. Function nodes that
+		do not support them natively receive them unpacked.
+
+	DTypePolicy: The numpy dtypes used for genotype, indicator, and
+		continuous values in the simulation.
 """
 
 import numpy as np
 from typing import Tuple, Union, Dict
 
+
+class PackedValues:
+	""" 0/1 Values stored bit-packed along the feature dimension.
+
+	A (num_feats, num_samples) array of 0s and 1s is stored as a
+	(ceil(num_feats / 8), num_samples) uint8 array, so each value takes one
+	bit. A vector (num_samples,) is treated as one feature. Sample
+	dimension stays last, so selecting samples does not require unpacking.
+
+	Attributes:
+		bits: uint8 array of packed values, with the sample dimension last.
+		n_feats: Number of features (rows) of the unpacked values.
+		is_vector: Whether the unpacked values are a 1D vector.
+		shape: Shape of the unpacked values.
+		ndim: Number of dimensions of the unpacked values.
+
+	Methods:
+		pack(values): Class method. Returns PackedValues of a 0/1 array.
+		unpack(dtype): Returns the unpacked values.
+		count(): Returns the number of 1s for each sample.
+		take(indices, axis): Selects samples.
+	"""
+
+	# Number of 1 bits of each byte value, for numpy without bitwise_count
+	_BYTE_POPCOUNT = np.unpackbits(
+		np.arange(256, dtype=np.uint8)[:, None], axis=1
+	).sum(axis=1).astype(np.uint8)
+
+	def __init__(self, bits, n_feats, is_vector=False):
+		self.bits = bits
+		self.n_feats = n_feats
+		self.is_vector = is_vector
+
+	@classmethod
+	def pack(cls, values):
+		""" Returns PackedValues of a 1D or 2D array of 0s and 1s (or
+		booleans), packing along the first (feature) dimension.
+		"""
+		values = np.asarray(values)
+		is_vector = values.ndim == 1
+		if is_vector:
+			values = values[None, :]
+
+		return cls(
+			np.packbits(values.astype(bool), axis=0),
+			values.shape[0],
+			is_vector
+		)
+
+	@property
+	def shape(self):
+		if self.is_vector:
+			return self.bits.shape[1:]
+		return (self.n_feats,) + self.bits.shape[1:]
+
+	@property
+	def ndim(self):
+		return len(self.shape)
+
+	def unpack(self, dtype=int):
+		""" Returns the unpacked values as an array of dtype. """
+		values = np.unpackbits(self.bits, axis=0, count=self.n_feats)
+		if self.is_vector:
+			values = values[0]
+		return values.astype(dtype, copy=False)
+
+	def count(self):
+		""" Returns the number of 1s (i.e. the sum over features) for each
+		sample, using a popcount of the packed bytes.
+		"""
+		if hasattr(np, 'bitwise_count'):
+			byte_counts = np.bitwise_count(self.bits)
+		else:
+			byte_counts = self._BYTE_POPCOUNT[self.bits]
+		return byte_counts.sum(axis=0, dtype=int)
+
+	def take(self, indices, axis=-1, out=None, mode='raise'):
+		""" Selects samples. Only the sample (last) axis is supported. """
+		if axis not in (-1, self.ndim - 1):
+			raise ValueError(
+				"PackedValues only support take along the sample axis."
+			)
+		return PackedValues(
+			np.take(self.bits, indices, axis=-1, mode=mode),
+			self.n_feats,
+			self.is_vector
+		)
+
+	def __getitem__(self, key):
+		# Indexing only the sample axis (vals[..., idx]) stays packed
+		if (
+			isinstance(key, tuple) and len(key) == 2 and key[0] is Ellipsis
+		):
+			return self.take(key[1])
+		return self.unpack()[key]
+
+	def __array__(self, dtype=None, copy=None):
+		return self.unpack(int if dtype is None else dtype)
+
+	def __len__(self):
+		return self.shape[0]
+
+	def __repr__(self):
+		return f"PackedValues(shape={self.shape})"
+
+
+class DTypePolicy:
+	""" The numpy dtypes used for values in the simulation.
+
+	Presets:
+		wide (default): int64 genotypes and indicators, float64 continuous
+			values.
+		compact: int8 genotypes and indicators, float32 continuous values.
+			Uses a quarter to an eighth of the memory of 'wide', at the
+			cost of float32 precision.
+
+	Attributes:
+		genotype: dtype of haplotype values from input sources.
+		indicator: dtype of 0/1 outputs (e.g. AnyReduce, AllReduce).
+		float: dtype of continuous values. Function node outputs with a
+			wider float dtype are narrowed to this.
+
+	Args:
+		preset (default 'wide'): Name of the preset to start from.
+		**dtypes: Optional genotype, indicator, and float dtypes that
+			override the preset.
+
+	Methods:
+		from_config(config): Class method. Returns the policy for the
+			'dtype_policy' value of a simulation config.
+		to_config(): Returns a JSON serializable config of the policy.
+		as_float(vals): Returns vals as floats, using float for integers.
+		cast_float(vals): Returns vals with floats narrowed to float.
+	"""
+
+	PRESETS = {
+		'wide': {'genotype': 'int64', 'indicator': 'int64', 'float': 'float64'},
+		'compact': {'genotype': 'int8', 'indicator': 'int8', 'float': 'float32'},
+	}
+
+	def __init__(self, preset='wide', **dtypes):
+		if preset not in self.PRESETS:
+			raise ValueError(
+				f"Invalid dtype policy preset '{preset}'. Must be one of "
+				f"{list(self.PRESETS.keys())}."
+			)
+
+		unknown = set(dtypes) - set(self.PRESETS[preset])
+		if unknown:
+			raise ValueError(f"Invalid dtype policy keys: {sorted(unknown)}")
+
+		self.preset = preset
+		dtypes = {**self.PRESETS[preset], **dtypes}
+
+		self.genotype = np.dtype(dtypes['genotype'])
+		self.indicator = np.dtype(dtypes['indicator'])
+		self.float = np.dtype(dtypes['float'])
+
+		if not np.issubdtype(self.float, np.floating):
+			raise ValueError("dtype policy float must be a floating dtype.")
+
+	@classmethod
+	def from_config(cls, config):
+		""" Returns the policy for a 'dtype_policy' config value.
+
+		Args:
+			config: None (the 'wide' preset), a preset name, a dict with an
+				optional 'preset' key and dtype keys, or a DTypePolicy.
+		"""
+		if config is None:
+			return cls()
+		if isinstance(config, cls):
+			return config
+		if isinstance(config, str):
+			return cls(config)
+		if isinstance(config, dict):
+			return cls(**config)
+		raise ValueError(f"Invalid dtype policy: {config}")
+
+	def to_config(self):
+		""" Returns a JSON serializable config of the policy. """
+		return {
+			'preset': self.preset,
+			'genotype': self.genotype.name,
+			'indicator': self.indicator.name,
+			'float': self.float.name,
+		}
+
+	def as_float(self, vals):
+		""" Returns vals as a floating point array. Non-float values are
+		converted to the policy's float dtype, so operations like np.exp do
+		not compute small integer dtypes at low (float16) precision.
+		"""
+		vals = np.asarray(vals)
+		if np.issubdtype(vals.dtype, np.floating):
+			return vals
+		return vals.astype(self.float)
+
+	def cast_float(self, vals):
+		""" Returns vals (an array or tuple of arrays) with floating point
+		arrays wider than the policy's float dtype narrowed to it.
+		"""
+		if isinstance(vals, StackedHaplotypes):
+			stacked = self.cast_float(vals.stacked)
+			if stacked is vals.stacked:
+				return vals
+			return StackedHaplotypes(stacked)
+		if isinstance(vals, tuple):
+			return tuple(self.cast_float(v) for v in vals)
+		if (
+			isinstance(vals, np.ndarray)
+			and np.issubdtype(vals.dtype, np.floating)
+			and vals.dtype.itemsize > self.float.itemsize
+		):
+			return vals.astype(self.float)
+		return vals
+
+	def __eq__(self, other):
+		return (
+			isinstance(other, DTypePolicy)
+			and self.to_config() == other.to_config()
+		)
+
+	def __repr__(self):
+		return (
+			f"DTypePolicy(genotype={self.genotype.name}, "
+			f"indicator={self.indicator.name}, float={self.float.name})"
+		)
+
+
 Values = np.ndarray
 HaplotypeValues = Tuple[np.ndarray, np.ndarray]
 ValuesDict = Dict[str, Union[HaplotypeValues, Values]]
+
+
+class StackedHaplotypes(tuple):
+	""" HaplotypeValues stored as one stacked (2, ...) array.
+
+	Behaves as the usual length 2 tuple of arrays, whose items are views of
+	the stacked array, so code using the tuple API is unaffected. Nodes
+	that process both haplotypes in one call (see haplotype_vectorized in
+	AbstractBaseFunctionNode) use the stacked array directly.
+
+	Attributes:
+		stacked: The (2, ...) array of both haplotypes' values.
+
+	Args:
+		stacked: Array with a first dimension of size 2.
+	"""
+
+	def __new__(cls, stacked):
+		self = super().__new__(cls, (stacked[0], stacked[1]))
+		self.stacked = stacked
+		return self
+
+	def __reduce__(self):
+		# Pickle the stacked array only, so unpickled items are still views
+		return (type(self), (self.stacked,))
+
+
+class ReadOnlyValuesDict(dict):
+	""" ValuesDict whose values cannot be modified.
+
+	Arrays added to the dict (including those of HaplotypeValues and
+	PackedValues) are stored as read-only views, so in-place changes to
+	them raise a ValueError instead of changing values shared with other
+	dicts. New keys can be added, and keys can be removed, but existing
+	keys cannot be assigned new values.
+
+	Copying the dict (copy() or ReadOnlyValuesDict(vals_dict)) does not
+	copy the arrays, so each simulation run (e.g. each replicate when
+	estimating heritability) can start from a copy of the same input
+	values.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		super().__init__()
+		self.update(*args, **kwargs)
+
+	def __setitem__(self, key, vals):
+		if key in self:
+			raise KeyError(
+				f"Values for '{key}' are already set and are read-only."
+			)
+		super().__setitem__(key, read_only_values(vals))
+
+	def update(self, *args, **kwargs):
+		for key, vals in dict(*args, **kwargs).items():
+			self[key] = vals
+
+	def setdefault(self, key, default=None):
+		if key not in self:
+			self[key] = default
+		return self[key]
+
+	def __ior__(self, other):
+		self.update(other)
+		return self
+
+	def copy(self):
+		return ReadOnlyValuesDict(self)
+
+
+def read_only_values(vals):
+	""" Returns Values, HaplotypeValues, or PackedValues with arrays that
+	are read-only views of vals' arrays. Arrays that are already read-only
+	are returned as they are. Other objects are returned unchanged.
+	"""
+	if isinstance(vals, np.ndarray):
+		if not vals.flags.writeable:
+			return vals
+		vals = vals.view()
+		vals.flags.writeable = False
+		return vals
+	if isinstance(vals, StackedHaplotypes):
+		stacked = read_only_values(vals.stacked)
+		if stacked is vals.stacked:
+			return vals
+		return StackedHaplotypes(stacked)
+	if isinstance(vals, tuple):
+		return tuple(read_only_values(v) for v in vals)
+	if isinstance(vals, PackedValues):
+		bits = read_only_values(vals.bits)
+		if bits is vals.bits:
+			return vals
+		return PackedValues(bits, vals.n_feats, vals.is_vector)
+	return vals
+
+
+def select_samples(vals, sample_idx):
+	""" Returns Values, HaplotypeValues, or PackedValues with the sample
+	(last) axis indexed by sample_idx.
+	"""
+	if isinstance(vals, StackedHaplotypes):
+		return StackedHaplotypes(vals.stacked[..., sample_idx])
+	if isinstance(vals, tuple):
+		return tuple(select_samples(v, sample_idx) for v in vals)
+	if isinstance(vals, PackedValues):
+		# Indexes the bits directly, so slices give views
+		return PackedValues(
+			vals.bits[..., sample_idx], vals.n_feats, vals.is_vector
+		)
+	return vals[..., sample_idx]
+
+
+def stack_haplotypes(hap_vals: HaplotypeValues) -> np.ndarray:
+	""" Returns the two haplotypes' arrays stacked as one (2, ...) array.
+
+	For StackedHaplotypes this is the stacked array. If the second array
+	otherwise starts at a fixed offset from the first in the same memory
+	with the same strides, the stacked array is a read-only view. In both
+	cases nothing is copied. Otherwise the arrays are copied with np.stack.
+	"""
+	if isinstance(hap_vals, StackedHaplotypes):
+		return hap_vals.stacked
+
+	hap_0, hap_1 = hap_vals
+
+	if (
+		_root_array(hap_0) is _root_array(hap_1)
+		and hap_0.shape == hap_1.shape
+		and hap_0.dtype == hap_1.dtype
+		and hap_0.strides == hap_1.strides
+	):
+		offset = (
+			hap_1.__array_interface__['data'][0]
+			- hap_0.__array_interface__['data'][0]
+		)
+		if offset % hap_0.itemsize == 0:
+			return np.lib.stride_tricks.as_strided(
+				hap_0,
+				shape=(2,) + hap_0.shape,
+				strides=(offset,) + hap_0.strides,
+				writeable=False
+			)
+
+	return np.stack(hap_vals)
+
+
+def _root_array(arr: np.ndarray) -> np.ndarray:
+	""" Returns the array that owns the memory arr is a view of. Views of
+	ndarray subclasses (e.g. memory maps) can have chains of bases.
+	"""
+	while isinstance(arr.base, np.ndarray):
+		arr = arr.base
+	return arr
@@ -1 +1,7 @@
-from .input_source_info import InputVariantInfo
\ No newline at end of file
+def __getattr__(name):
+	# Imported lazily since it requires Hail, which is slow to import and
+	# not needed to run simulations with the native input engine.
+	if name == 'InputVariantInfo':
+		from .input_source_info import InputVariantInfo
+		return InputVariantInfo
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,208 @@
+""" Persistent on-disk cache of numpy arrays.
+
+Entries are sets of named numpy arrays plus JSON metadata, stored under a
+key computed from any JSON serializable description of what was computed
+(see make_key). Arrays are saved as .npy files and loaded as read-only
+memory maps, so reading a cached entry does not copy it into memory.
+
+The cache is bounded in size. When adding an entry makes the cache larger
+than its max size, the least recently used entries are removed.
+
+Cache location and size default to the CITRUS_CACHE_DIR and
+CITRUS_CACHE_MAX_BYTES environment variables, or '~/.cache/citrus' and
+10 GiB if not set.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'citrus')
+DEFAULT_MAX_BYTES = 10 * 1024**3
+
+# Increment to invalidate entries written by older versions
+CACHE_FORMAT_VERSION = 2
+
+_META_FILE = 'meta.json'
+
+
+def make_key(*key_parts):
+	""" Returns a hex digest key for JSON serializable key parts. """
+	key_json = json.dumps(
+		[CACHE_FORMAT_VERSION, *key_parts],
+		sort_keys=True,
+		default=str
+	)
+	return hashlib.sha256(key_json.encode()).hexdigest()
+
+
+def file_identity(file_path):
+	""" Returns a JSON serializable identity of a local file, made of its
+	absolute path, size, and modification time. Returns None if the file
+	does not exist.
+	"""
+	try:
+		stat = os.stat(file_path)
+	except (OSError, TypeError, ValueError):
+		return None
+
+	return [os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns]
+
+
+class DiskCache:
+	""" Size-bounded, least recently used cache of numpy arrays on disk.
+
+	Attributes:
+		cache_dir: Directory the cache entries are stored in.
+		max_bytes: Max total size of the cache entries in bytes.
+
+	Args:
+		cache_dir (default None): Directory to store the cache in. If None,
+			the CITRUS_CACHE_DIR environment variable or '~/.cache/citrus'
+			is used.
+		max_bytes (default None): Max total size of the cache in bytes. If
+			None, the CITRUS_CACHE_MAX_BYTES environment variable or 10 GiB
+			is used.
+
+	Methods:
+		get(key): Returns (arrays, metadata) for a key, or None.
+		put(key, arrays, metadata): Adds an entry to the cache.
+		clear(): Removes all entries from the cache.
+	"""
+
+	def __init__(self, cache_dir=None, max_bytes=None):
+		if cache_dir is None:
+			cache_dir = os.environ.get('CITRUS_CACHE_DIR', DEFAULT_CACHE_DIR)
+		if max_bytes is None:
+			max_bytes = int(
+				os.environ.get('CITRUS_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+			)
+
+		self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+		self.max_bytes = max_bytes
+
+	def _entry_dir(self, key):
+		return os.path.join(self.cache_dir, key)
+
+	def get(self, key):
+		""" Returns the cached entry for a key.
+
+		Args:
+			key: Key of the entry (see make_key).
+
+		Returns:
+			None if the key is not in the cache, otherwise a tuple of:
+				- Dict of array names to read-only memory-mapped arrays.
+				- Metadata dict.
+		"""
+		entry_dir = self._entry_dir(key)
+		meta_path = os.path.join(entry_dir, _META_FILE)
+
+		try:
+			with open(meta_path) as f:
+				meta = json.load(f)
+
+			arrays = {
+				name: np.load(
+					os.path.join(entry_dir, f'{i}.npy'), mmap_mode='r'
+				)
+				for i, name in enumerate(meta['array_names'])
+			}
+
+			# Mark as recently used
+			os.utime(meta_path)
+		except (OSError, ValueError, KeyError):
+			return None
+
+		return arrays, meta['metadata']
+
+	def put(self, key, arrays, metadata=None):
+		""" Adds an entry to the cache, then evicts least recently used
+		entries until the cache is within max_bytes.
+
+		Entries are written to a temporary directory and then moved into
+		place, so concurrent readers never see partial entries. Entries
+		larger than max_bytes are not stored.
+
+		Args:
+			key: Key of the entry (see make_key).
+			arrays: Dict of array names to numpy arrays.
+			metadata (default None): JSON serializable metadata.
+		"""
+		entry_size = sum(np.asarray(arr).nbytes for arr in arrays.values())
+		if entry_size > self.max_bytes:
+			return
+
+		os.makedirs(self.cache_dir, exist_ok=True)
+		tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+
+		try:
+			array_names = list(arrays.keys())
+			for i, name in enumerate(array_names):
+				np.save(
+					os.path.join(tmp_dir, f'{i}.npy'),
+					np.asarray(arrays[name]),
+					allow_pickle=False
+				)
+
+			with open(os.path.join(tmp_dir, _META_FILE), 'w') as f:
+				json.dump(
+					{
+						'array_names': array_names,
+						'metadata': metadata,
+						'created': time.time()
+					},
+					f
+				)
+
+			entry_dir = self._entry_dir(key)
+			if os.path.exists(entry_dir):
+				shutil.rmtree(entry_dir, ignore_errors=True)
+			os.rename(tmp_dir, entry_dir)
+		except OSError:
+			# Another process may have written the same entry
+			shutil.rmtree(tmp_dir, ignore_errors=True)
+			return
+
+		self._evict(keep=key)
+
+	def _evict(self, keep=None):
+		""" Removes least recently used entries until the cache is within
+		max_bytes. The entry with key keep is not removed.
+		"""
+		entries = []
+		total_size = 0
+
+		for key in os.listdir(self.cache_dir):
+			entry_dir = self._entry_dir(key)
+			if key.startswith('.') or not os.path.isdir(entry_dir):
+				continue
+			try:
+				last_used = os.stat(os.path.join(entry_dir, _META_FILE)).st_mtime
+				size = sum(
+					entry.stat().st_size for entry in os.scandir(entry_dir)
+				)
+			except OSError:
+				continue
+			entries.append((last_used, key, size))
+			total_size += size
+
+		for _, key, size in sorted(entries):
+			if total_size <= self.max_bytes:
+				break
+			if key == keep:
+				continue
+			shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+			total_size -= size
+
+	def clear(self):
+		""" Removes all entries from the cache. """
+		if os.path.isdir(self.cache_dir):
+			for key in os.listdir(self.cache_dir):
+				shutil.rmtree(self._entry_dir(key), ignore_errors=True)
@@ -0,0 +1,983 @@
+""" Compiled execution plan for the simulation steps of a PhenoSimulation.
+
+The simulation steps form a directed acyclic graph, where the edges are
+given by each function node's inputs aliases. An ExecutionPlan is built
+once from the simulation steps and can then be run any number of times on
+different input values.
+
+Building the plan:
+	1. Topologically sorts the function nodes by their inputs. Nodes keep
+		their order in the simulation steps where possible.
+	2. Unless built with optimize=False, runs the graph optimizer (see
+		graph_optimizer), which bypasses Identity nodes, merges duplicate
+		nodes, and marks constant values to compute in compact form.
+	3. If output aliases are given, prunes nodes the outputs do not depend
+		on, and records which input node values the outputs require.
+	4. Precomputes how each node's input values are bound to its arguments
+		(no inputs, a single value, positional, or keyword), so running the
+		plan does not inspect node inputs again.
+	5. If output aliases are given, counts the steps that use each value.
+		When the plan is run, values that are not outputs are released
+		from the ValuesDict right after their last use, so peak memory is
+		the live working set rather than all node outputs.
+
+Steps may be run concurrently in a thread pool (see ExecutionPlan.run).
+
+A plan can also be run for a number of replicates at once (e.g. to
+estimate heritability), adding a leading replicate axis to the values of
+steps that use random numbers or depend on steps that do. Other steps are
+run once. See ExecutionPlan.run.
+
+Example:
+	plan = ExecutionPlan(sim.simulation_steps, outputs=['phenotype'])
+	plan.required_inputs	# Input node aliases 'phenotype' depends on
+	vals_dict = plan.run(input_vals)
+	plan.peak_live_bytes	# Peak size of the live values during the run
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from pheno_sim.base_nodes import AbstractBaseFunctionNode
+from pheno_sim.data_types import (
+	PackedValues, StackedHaplotypes, ValuesDict, read_only_values,
+	stack_haplotypes
+)
+from pheno_sim.graph_optimizer import optimize_graph
+from pheno_sim.population_stats import memoize
+
+
+# Argument binding strategies of function nodes
+_NO_INPUTS = 0
+_SINGLE = 1
+_POSITIONAL = 2
+_KEYWORD = 3
+
+
+class ExecutionPlan:
+	""" Topologically ordered, optionally pruned, plan of function nodes.
+
+	Attributes:
+		steps: List of the function nodes to run, in execution order.
+		outputs: List of the requested output aliases, or None if all
+			function nodes are run.
+		required_inputs: List of the aliases of values that the steps use
+			but are not produced by any function node (i.e. input node
+			aliases), in order of first use.
+		dependencies: Dict mapping each function node alias to the list of
+			aliases it takes as input. For optimized plans, these are the
+			aliases of the values the node is run on.
+		peak_live_bytes: Peak total size in bytes of the values in the
+			ValuesDict during the last run, or None if not run yet.
+		replicated_aliases: Set of the aliases of function nodes whose
+			values differ between replicates, i.e. nodes that use random
+			numbers and the nodes that depend on them.
+		replaced_aliases: Dict mapping aliases of function nodes that
+			steps do not take input from (Identity nodes and duplicates
+			removed by the graph optimizer) to the alias of the value used
+			in their place.
+		compact_aliases: Set of the aliases of steps whose values are
+			computed in compact form (see graph_optimizer).
+
+	Args:
+		simulation_steps: List of function nodes.
+		outputs (default None): List of aliases of the values to compute.
+			These may be function node or input node aliases. If None, all
+			function nodes are run.
+		optimize (default True): Whether to run the graph optimizer on the
+			simulation steps. Values are the same either way.
+
+	Methods:
+		run(vals_dict, release_inputs, max_workers, n_replicates): Runs the
+			steps of the plan on vals_dict and returns it with the function
+			node outputs added and, if outputs were given, dead
+			intermediate values removed.
+	"""
+
+	def __init__(
+		self,
+		simulation_steps: List[AbstractBaseFunctionNode],
+		outputs: List[str] = None,
+		optimize: bool = True
+	):
+		self.outputs = None if outputs is None else list(outputs)
+
+		nodes = dict()
+		for node in simulation_steps:
+			if node.alias in nodes:
+				raise ValueError(
+					f"Multiple simulation steps have alias '{node.alias}'."
+				)
+			nodes[node.alias] = node
+
+		self.dependencies = {
+			alias: self.get_input_aliases(node)
+			for alias, node in nodes.items()
+		}
+
+		order = self._topological_order(nodes)
+
+		# Order of the function node values in vals_dict after a run
+		self._value_order = list(order)
+
+		self.replaced_aliases = dict()
+		self.compact_aliases = set()
+		self._shared_aliases = dict()
+
+		if optimize:
+			optimization = optimize_graph(
+				[nodes[alias] for alias in order],
+				self.dependencies,
+				self.outputs
+			)
+			self.replaced_aliases = optimization.replaced_aliases
+			self.compact_aliases = optimization.compact_aliases
+			self._shared_aliases = optimization.shared_aliases
+
+			order = [node.alias for node in optimization.steps]
+			nodes = {alias: nodes[alias] for alias in order}
+			self.dependencies = {
+				alias: [
+					self.replaced_aliases.get(input_alias, input_alias)
+					for input_alias in self.dependencies[alias]
+				]
+				for alias in order
+			}
+
+		if self.outputs is not None:
+			needed = self._get_needed_aliases(
+				[
+					self._shared_aliases.get(alias, alias)
+					for alias in self.outputs
+				],
+				nodes
+			)
+			order = [alias for alias in order if alias in needed]
+
+		self.steps = [nodes[alias] for alias in order]
+
+		self.required_inputs = list(dict.fromkeys(
+			input_alias
+			for alias in order
+			for input_alias in self.dependencies[alias]
+			if input_alias not in nodes
+		))
+		if self.outputs is not None:
+			self.required_inputs.extend(
+				alias for alias in self.outputs
+				if alias not in nodes
+				and alias not in self._shared_aliases
+				and alias not in self.required_inputs
+			)
+
+		self._bindings = [self._get_binding(node) for node in self.steps]
+		self._step_deps = self._get_step_dependencies()
+		self.replicated_aliases = self._get_replicated_aliases()
+		self.peak_live_bytes = None
+
+	@staticmethod
+	def get_input_aliases(node: AbstractBaseFunctionNode) -> List[str]:
+		""" Returns the aliases of the values a function node takes as
+		input, in order of its inputs attribute.
+		"""
+		if node.inputs is None:
+			return []
+		elif isinstance(node.inputs, str):
+			return [node.inputs]
+		elif isinstance(node.inputs, list):
+			return list(node.inputs)
+		elif isinstance(node.inputs, dict):
+			input_aliases = []
+			for input_alias in node.inputs.values():
+				if isinstance(input_alias, list):
+					input_aliases.extend(input_alias)
+				else:
+					input_aliases.append(input_alias)
+			return input_aliases
+		else:
+			raise ValueError(
+				"Function node attribute inputs must be None, str, list, or dict."
+			)
+
+	def _topological_order(
+		self,
+		nodes: Dict[str, AbstractBaseFunctionNode]
+	) -> List[str]:
+		""" Returns the function node aliases in an order where each node
+		comes after the nodes it takes input from. Ties are broken by the
+		order of the simulation steps.
+		"""
+		order = []
+		state = dict()	# alias -> 'visiting' or 'done'
+
+		for start in nodes:
+			if start in state:
+				continue
+
+			# Iterative depth first search, so deep graphs do not hit the
+			# recursion limit
+			stack = [(start, iter(self.dependencies[start]))]
+			state[start] = 'visiting'
+
+			while stack:
+				alias, deps = stack[-1]
+				for dep in deps:
+					if dep not in nodes:
+						continue
+					if state.get(dep) == 'visiting':
+						raise ValueError(
+							"Simulation steps have a cycle including "
+							f"'{dep}'."
+						)
+					if dep not in state:
+						state[dep] = 'visiting'
+						stack.append((dep, iter(self.dependencies[dep])))
+						break
+				else:
+					stack.pop()
+					state[alias] = 'done'
+					order.append(alias)
+
+		return order
+
+	def _get_needed_aliases(
+		self,
+		outputs: List[str],
+		nodes: Dict[str, AbstractBaseFunctionNode]
+	) -> set:
+		""" Returns the aliases of the function nodes that outputs depend
+		on, including outputs.
+		"""
+		needed = set()
+		to_visit = [alias for alias in outputs if alias in nodes]
+
+		while to_visit:
+			alias = to_visit.pop()
+			if alias in needed:
+				continue
+			needed.add(alias)
+			to_visit.extend(
+				dep for dep in self.dependencies[alias] if dep in nodes
+			)
+
+		return needed
+
+	def _get_binding(self, node: AbstractBaseFunctionNode):
+		""" Returns the (strategy, aliases) used to bind a node's inputs,
+		with aliases in replaced_aliases replaced.
+		"""
+		def value_alias(alias):
+			return self.replaced_aliases.get(alias, alias)
+
+		if node.inputs is None:
+			return _NO_INPUTS, None
+		elif isinstance(node.inputs, str):
+			return _SINGLE, value_alias(node.inputs)
+		elif isinstance(node.inputs, list):
+			return _POSITIONAL, tuple(
+				value_alias(alias) for alias in node.inputs
+			)
+		elif isinstance(node.inputs, dict):
+			return _KEYWORD, tuple(
+				(
+					name,
+					tuple(value_alias(a) for a in alias)
+					if isinstance(alias, list) else value_alias(alias)
+				)
+				for name, alias in node.inputs.items()
+			)
+		else:
+			raise ValueError(
+				"Function node attribute inputs must be None, str, list, or dict."
+			)
+
+	def _get_step_dependencies(self) -> List[List[int]]:
+		""" Returns, for each step, the indices of the steps that must
+		finish before it starts.
+
+		These are the steps producing its inputs and, for nodes that use
+		random numbers without a random_stream, the previous such node in
+		the plan, so random numbers are drawn in the same order as when
+		running one step at a time. Nodes with a random_stream draw from
+		their own stream, so can run in any order.
+		"""
+		step_index = {node.alias: i for i, node in enumerate(self.steps)}
+
+		step_deps = []
+		prev_random = None
+		for i, node in enumerate(self.steps):
+			deps = {
+				step_index[alias] for alias in self.dependencies[node.alias]
+				if alias in step_index
+			}
+			if node.uses_random and node.random_stream is None:
+				if prev_random is not None:
+					deps.add(prev_random)
+				prev_random = i
+			step_deps.append(sorted(deps))
+
+		return step_deps
+
+	def _get_replicated_aliases(self) -> set:
+		""" Returns the aliases of the steps that use random numbers or
+		take input from such steps (directly or indirectly).
+		"""
+		replicated = set()
+		for node in self.steps:
+			if node.uses_random or any(
+				alias in replicated
+				for alias in self.dependencies[node.alias]
+			):
+				replicated.add(node.alias)
+		return replicated
+
+	def _bind_inputs(self, i: int, vals_dict: ValuesDict):
+		""" Returns the (args, kwargs) to call step i with. """
+		strategy, aliases = self._bindings[i]
+
+		if strategy == _SINGLE:
+			return (vals_dict[aliases],), {}
+		elif strategy == _POSITIONAL:
+			return [vals_dict[alias] for alias in aliases], {}
+		elif strategy == _KEYWORD:
+			return (), {
+				input_name: (
+					[vals_dict[alias] for alias in input_alias]
+					if isinstance(input_alias, tuple)
+					else vals_dict[input_alias]
+				)
+				for input_name, input_alias in aliases
+			}
+		else:
+			return (), {}
+
+	def run(
+		self,
+		vals_dict: ValuesDict,
+		release_inputs: bool = False,
+		max_workers: int = 1,
+		n_replicates: int = None,
+		stored_run=None
+	) -> ValuesDict:
+		""" Runs the steps of the plan.
+
+		If the plan has outputs, intermediate values that are not outputs
+		are removed from vals_dict once every step that uses them has run,
+		and peak_live_bytes is set to the peak total size of the values in
+		vals_dict.
+
+		With max_workers > 1, steps whose inputs are ready run concurrently
+		in a thread pool (NumPy releases the GIL in most heavy operations),
+		so independent branches of the graph (e.g. one per gene) run in
+		parallel. Nodes with uses_random set and no random_stream still run
+		one at a time in plan order, so results are the same as with
+		max_workers=1.
+
+		With n_replicates set, the plan is run for that many replicates at
+		once. Steps in replicated_aliases output values with a leading
+		replicate axis (for HaplotypeValues, each haplotype's array has
+		it). Other steps are run once, and their outputs are broadcast to
+		have the replicate axis without copying. Nodes with
+		replicate_vectorized set are called once on all replicates, with
+		inputs that are not replicated broadcast along the replicate axis,
+		so random nodes draw values for all replicates in one call. Other
+		replicated nodes are called once per replicate. PackedValues
+		inputs of replicate_vectorized nodes are unpacked once per run, and
+		the unpacked values count towards peak_live_bytes until released.
+
+		Steps in compact_aliases are run on compact values, which are
+		broadcast to their full shape (without copying) when used by other
+		steps and once the run finishes. In replicated runs, all steps are
+		run on full values.
+
+		Statistics of the same values used by several steps (e.g. by a
+		scaler and a Heritability node) are computed once per run (see
+		population_stats).
+
+		Args:
+			vals_dict: A ValuesDict containing (at least) the values of
+				required_inputs.
+			release_inputs (default False): Whether to also remove input
+				values in vals_dict that are not outputs after their last
+				use. Only set this when the caller does not use vals_dict's
+				input values after the run.
+			max_workers (default 1): Max number of steps to run at once. If
+				None, uses the number of CPUs.
+			n_replicates (default None): Number of replicates to run. If
+				None, values have no replicate axis.
+			stored_run (default None): StoredRun of a ResultStore (see
+				result_store) to load step outputs from and store them
+				in. Not used in replicated runs.
+
+		Returns:
+			vals_dict, with the outputs of the function nodes run added.
+		"""
+		if max_workers is None:
+			max_workers = os.cpu_count() or 1
+		if n_replicates is not None and n_replicates < 1:
+			raise ValueError("n_replicates must be at least 1.")
+		if n_replicates is not None:
+			stored_run = None
+
+		run_state = _RunState(self, vals_dict, release_inputs)
+
+		# Steps using statistics of the same values share them
+		with memoize():
+			if max_workers <= 1 or len(self.steps) <= 1:
+				for i in range(len(self.steps)):
+					args, kwargs = self._bind_inputs(
+						i, run_state.step_inputs(i, n_replicates)
+					)
+					run_state.step_done(
+						i, self._call_stored(
+							i, args, kwargs, n_replicates, stored_run
+						)
+					)
+			else:
+				self._run_concurrent(
+					vals_dict, run_state, max_workers, n_replicates,
+					stored_run
+				)
+
+		self.peak_live_bytes = run_state.peak_live_bytes
+
+		if n_replicates is not None:
+			for node in self.steps:
+				if node.alias not in vals_dict:
+					continue
+				vals = vals_dict.pop(node.alias)
+				if isinstance(vals, _Replicated):
+					vals_dict[node.alias] = vals.vals
+				else:
+					vals_dict[node.alias] = _map_arrays(
+						vals,
+						lambda arr, lead: np.broadcast_to(
+							np.expand_dims(arr, lead),
+							arr.shape[:lead] + (n_replicates,)
+							+ arr.shape[lead:]
+						)
+					)
+
+		self._share_duplicate_values(vals_dict)
+		self._order_values(vals_dict)
+
+		return vals_dict
+
+	def _order_values(self, vals_dict: ValuesDict) -> None:
+		""" Moves the function node values in vals_dict after the other
+		(input) values, in step order, expanding compact values to their
+		full shape. Concurrent runs add values in the order steps finish,
+		so this keeps the order of the returned values (e.g. of saved
+		output columns) the same for any max_workers and with or without
+		optimization.
+		"""
+		for alias in self._value_order:
+			if alias in vals_dict:
+				vals_dict[alias] = _expand_compact(vals_dict.pop(alias))
+
+	def _share_duplicate_values(self, vals_dict: ValuesDict) -> None:
+		""" Adds the values of returned duplicate steps that were not run
+		(see graph_optimizer) to vals_dict after a run, and removes the
+		values they share if those are not outputs.
+		"""
+		for alias, shared_alias in self._shared_aliases.items():
+			if shared_alias in vals_dict:
+				vals_dict[alias] = vals_dict[shared_alias]
+		if self.outputs is not None:
+			for shared_alias in set(self._shared_aliases.values()):
+				if shared_alias not in self.outputs:
+					vals_dict.pop(shared_alias, None)
+
+	def _call_stored(
+		self,
+		i: int,
+		args,
+		kwargs,
+		n_replicates: int = None,
+		stored_run=None
+	):
+		""" Calls step i with bound inputs, or loads its output from
+		stored_run's result store if it is stored.
+		"""
+		if stored_run is None:
+			return self._call_step(i, args, kwargs, n_replicates)
+		return stored_run.call(
+			i, lambda: self._call_step(i, args, kwargs, n_replicates)
+		)
+
+	def _call_step(self, i: int, args, kwargs, n_replicates: int = None):
+		""" Calls step i with bound inputs. For replicated steps in a
+		replicated run, returns the output wrapped as _Replicated.
+		"""
+		node = self.steps[i]
+
+		if n_replicates is None:
+			if node.alias in self.compact_aliases:
+				return self._call_compact(node, args, kwargs)
+			return node(
+				*_map_values(list(args), _expand_compact),
+				**_map_values(kwargs, _expand_compact)
+			)
+
+		if node.alias not in self.replicated_aliases:
+			return node(*args, **kwargs)
+
+		args = list(args)
+		if (
+			node.replicate_vectorized
+			and n_replicates > 1
+			and len(_iter_arrays([args, kwargs])) > 0
+		):
+			return _Replicated(
+				self._call_vectorized(node, args, kwargs, n_replicates)
+			)
+
+		# Call once per replicate and stack the outputs
+		rep_outputs = [
+			node(
+				*_replicate_index(args, rep),
+				**_replicate_index(kwargs, rep)
+			)
+			for rep in range(n_replicates)
+		]
+		if isinstance(rep_outputs[0], tuple):
+			return _Replicated(StackedHaplotypes(np.stack(
+				[stack_haplotypes(output) for output in rep_outputs], axis=1
+			)))
+		return _Replicated(np.stack(rep_outputs))
+
+	@staticmethod
+	def _call_compact(node, args, kwargs) -> '_Compact':
+		""" Calls a step in compact_aliases on compact values.
+
+		Nodes with broadcast_constant set are called with placeholder
+		arrays of the compact shape of their inputs, other (constant
+		foldable) nodes with the compact values of their inputs. The
+		output's full shape is that of its broadcast inputs, and it is
+		HaplotypeValues if any input is.
+		"""
+		args = list(args)
+		shapes = []
+		haplotype = False
+		for vals in _flatten_values([args, kwargs]):
+			shapes.append(_full_shape(vals))
+			haplotype = haplotype or (
+				vals.haplotype if isinstance(vals, _Compact)
+				else isinstance(vals, tuple)
+			)
+
+		shape = np.broadcast_shapes(*shapes)
+		# 1 x n matrices are converted to vectors, as node outputs are
+		if len(shape) == 2 and shape[0] == 1:
+			shape = shape[1:]
+
+		if node.broadcast_constant:
+			def to_compact(vals):
+				return _compact_placeholder(_full_shape(vals))
+		else:
+			def to_compact(vals):
+				return vals.vals
+
+		output = node(
+			*_map_values(args, to_compact),
+			**_map_values(kwargs, to_compact)
+		)
+		return _Compact(read_only_values(output), shape, haplotype)
+
+	@staticmethod
+	def _call_vectorized(node, args, kwargs, n_replicates: int):
+		""" Calls a replicate_vectorized node once for all replicates.
+
+		Input arrays are reshaped to (n_replicates, ...) with size 1 axes
+		added after the replicate axis, so all inputs have the same number
+		of dimensions per replicate (as for stacked haplotypes, see
+		AbstractBaseFunctionNode). Inputs that are not replicated are
+		broadcast along the replicate axis.
+		"""
+		per_rep_ndim = 0
+		for arr, lead, replicated in _iter_arrays([args, kwargs]):
+			per_rep_ndim = max(per_rep_ndim, arr.ndim - lead - replicated)
+
+		def reshape(arr, lead, replicated):
+			shape = arr.shape[lead + replicated:]
+			new_shape = (
+				arr.shape[:lead] + (n_replicates,)
+				+ (1,) * (per_rep_ndim - len(shape)) + shape
+			)
+			if replicated:
+				return arr.reshape(new_shape)
+			return np.broadcast_to(
+				arr.reshape(
+					arr.shape[:lead] + (1,) * (per_rep_ndim + 1 - len(shape))
+					+ shape
+				),
+				new_shape
+			)
+
+		output = node(
+			*_map_inputs(args, reshape),
+			**_map_inputs(kwargs, reshape)
+		)
+
+		# 1 x n matrices per replicate are converted to vectors, as node
+		# outputs are when not replicated
+		return _map_arrays(
+			output,
+			lambda arr, lead: (
+				arr[(slice(None),) * (lead + 1) + (0,)]
+				if arr.ndim == lead + 3 and arr.shape[lead + 1] == 1
+				else arr
+			)
+		)
+
+	def _run_concurrent(
+		self,
+		vals_dict: ValuesDict,
+		run_state: '_RunState',
+		max_workers: int,
+		n_replicates: int = None,
+		stored_run=None
+	) -> None:
+		""" Runs the steps in a thread pool as their dependencies finish.
+
+		Inputs are bound and outputs stored in the calling thread, so only
+		the node calls run in worker threads.
+		"""
+		n_waiting = [len(deps) for deps in self._step_deps]
+		dependents = [[] for _ in self.steps]
+		for i, deps in enumerate(self._step_deps):
+			for dep in deps:
+				dependents[dep].append(i)
+
+		ready = [i for i, n in enumerate(n_waiting) if n == 0]
+		running = dict()
+
+		with ThreadPoolExecutor(max_workers=max_workers) as pool:
+			try:
+				while ready or running:
+					# Submit ready steps in plan order
+					for i in sorted(ready):
+						args, kwargs = self._bind_inputs(
+							i, run_state.step_inputs(i, n_replicates)
+						)
+						running[pool.submit(
+							self._call_stored,
+							i, args, kwargs, n_replicates, stored_run
+						)] = i
+					ready = []
+
+					done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+					for future in done:
+						i = running.pop(future)
+						run_state.step_done(i, future.result())
+
+						for dependent in dependents[i]:
+							n_waiting[dependent] -= 1
+							if n_waiting[dependent] == 0:
+								ready.append(dependent)
+			except BaseException:
+				for future in running:
+					future.cancel()
+				raise
+
+
+class _RunState:
+	""" Tracks the outputs, value releases, and live size of one run of an
+	ExecutionPlan.
+	"""
+
+	def __init__(
+		self,
+		plan: ExecutionPlan,
+		vals_dict: ValuesDict,
+		release_inputs: bool
+	):
+		self.plan = plan
+		self.vals_dict = vals_dict
+
+		# Number of steps left to use each releasable value
+		self.remaining_uses = dict()
+		if plan.outputs is not None:
+			# Steps that duplicates share values with are kept too
+			outputs = set(plan.outputs).union(plan._shared_aliases.values())
+			input_aliases = set(plan.required_inputs)
+			for node in plan.steps:
+				for alias in set(plan.dependencies[node.alias]):
+					if alias in outputs:
+						continue
+					if alias in input_aliases and not release_inputs:
+						continue
+					self.remaining_uses[alias] = (
+						self.remaining_uses.get(alias, 0) + 1
+					)
+
+		# (alias, dtype) -> values with PackedValues unpacked, for
+		# replicate_vectorized steps in replicated runs
+		self.unpacked = dict()
+
+		self.live_bytes = sum(
+			_values_nbytes(vals) for vals in vals_dict.values()
+		)
+		self.peak_live_bytes = self.live_bytes
+
+	def step_inputs(self, i: int, n_replicates: int = None):
+		""" Returns the values to bind the inputs of step i from: the
+		ValuesDict, or for replicate_vectorized steps in replicated runs,
+		the values with PackedValues unpacked (see unpacked_values).
+		"""
+		node = self.plan.steps[i]
+		if (
+			n_replicates is None
+			or not node.replicate_vectorized
+			or node.alias not in self.plan.replicated_aliases
+		):
+			return self.vals_dict
+		return _UnpackedValues(self, node.dtype_policy.genotype)
+
+	def unpacked_values(self, alias: str, dtype):
+		""" Returns the values of alias with PackedValues unpacked to
+		dtype. Each value is unpacked once per run, and counts towards the
+		live size until alias is released.
+		"""
+		key = (alias, np.dtype(dtype))
+		if key not in self.unpacked:
+			vals = self.vals_dict[alias]
+			unpacked = _unpack_packed(vals, dtype)
+			if unpacked is None:
+				return vals
+			self.unpacked[key] = unpacked
+			self.live_bytes += _values_nbytes(unpacked)
+			self.peak_live_bytes = max(self.peak_live_bytes, self.live_bytes)
+		return self.unpacked[key]
+
+	def step_done(self, i: int, node_output) -> None:
+		""" Stores the output of step i and releases values no remaining
+		step uses.
+		"""
+		node = self.plan.steps[i]
+
+		self.vals_dict[node.alias] = node_output
+		self.live_bytes += _values_nbytes(node_output)
+		self.peak_live_bytes = max(self.peak_live_bytes, self.live_bytes)
+
+		self.release_inputs_of(i)
+
+	def release_inputs_of(self, i: int) -> None:
+		""" Releases the input values of step i that no remaining step
+		uses. Used directly for steps whose outputs are not stored.
+		"""
+		node = self.plan.steps[i]
+
+		for alias in set(self.plan.dependencies[node.alias]):
+			if alias not in self.remaining_uses:
+				continue
+			self.remaining_uses[alias] -= 1
+			if self.remaining_uses[alias] == 0:
+				self.live_bytes -= _values_nbytes(
+					self.vals_dict.pop(alias, None)
+				)
+				for key in [key for key in self.unpacked if key[0] == alias]:
+					self.live_bytes -= _values_nbytes(self.unpacked.pop(key))
+
+
+class _UnpackedValues:
+	""" Values of a run of an ExecutionPlan, looked up by alias with
+	PackedValues unpacked (see _RunState.unpacked_values).
+	"""
+	__slots__ = ('run_state', 'dtype')
+
+	def __init__(self, run_state: _RunState, dtype):
+		self.run_state = run_state
+		self.dtype = dtype
+
+	def __getitem__(self, alias: str):
+		return self.run_state.unpacked_values(alias, self.dtype)
+
+
+def _unpack_packed(vals, dtype):
+	""" Returns Values or HaplotypeValues with PackedValues unpacked to
+	dtype, or None if they have no PackedValues.
+	"""
+	if isinstance(vals, PackedValues):
+		return vals.unpack(dtype)
+	if isinstance(vals, tuple) and any(
+		isinstance(v, PackedValues) for v in vals
+	):
+		return tuple(
+			v.unpack(dtype) if isinstance(v, PackedValues) else v
+			for v in vals
+		)
+	return None
+
+
+def _values_nbytes(vals) -> int:
+	""" Returns the number of bytes of memory used by Values,
+	HaplotypeValues, or PackedValues. Broadcast dimensions (e.g. of
+	Constant outputs) take no memory, so they are not counted.
+	"""
+	if isinstance(vals, (_Replicated, _Compact)):
+		return _values_nbytes(vals.vals)
+	if isinstance(vals, tuple):
+		return sum(_values_nbytes(v) for v in vals)
+	if isinstance(vals, PackedValues):
+		return vals.bits.nbytes
+	if isinstance(vals, np.ndarray):
+		n_elements = 1
+		for size, stride in zip(vals.shape, vals.strides):
+			if stride != 0:
+				n_elements *= size
+		return n_elements * vals.itemsize
+	return 0
+
+
+class _Replicated:
+	""" Wraps a value with a leading replicate axis during a replicated run
+	of an ExecutionPlan, to tell it apart from values that are the same
+	for all replicates.
+	"""
+	__slots__ = ('vals',)
+
+	def __init__(self, vals):
+		self.vals = vals
+
+
+class _Compact:
+	""" Wraps the compact values of a step in compact_aliases during a
+	run of an ExecutionPlan.
+
+	Attributes:
+		vals: Values with size 1 axes in place of broadcast axes.
+		shape: Full shape of the values (of each haplotype's array if
+			haplotype is True).
+		haplotype: Whether the full values are HaplotypeValues.
+	"""
+	__slots__ = ('vals', 'shape', 'haplotype')
+
+	def __init__(self, vals, shape, haplotype):
+		self.vals = vals
+		self.shape = shape
+		self.haplotype = haplotype
+
+	def expand(self):
+		""" Returns the values broadcast to their full shape, as
+		StackedHaplotypes if haplotype is True.
+		"""
+		if self.haplotype:
+			return StackedHaplotypes(
+				np.broadcast_to(self.vals, (2,) + self.shape)
+			)
+		return np.broadcast_to(self.vals, self.shape)
+
+
+def _full_shape(vals) -> tuple:
+	""" Returns the shape of Values, PackedValues, or _Compact values, or
+	of each haplotype's array of HaplotypeValues.
+	"""
+	if isinstance(vals, tuple):
+		return tuple(vals[0].shape)
+	return tuple(vals.shape)
+
+
+def _compact_placeholder(shape: tuple) -> np.ndarray:
+	""" Returns a placeholder array (a broadcast zero, so it takes no
+	memory) with the compact shape for values of the given full shape: the
+	feature axis of matrices is kept, and all other axes have size 1.
+	"""
+	if len(shape) >= 2:
+		compact_shape = shape[:1] + (1,) * (len(shape) - 1)
+	else:
+		compact_shape = (1,) * len(shape)
+	return np.broadcast_to(np.zeros((), dtype=np.int8), compact_shape)
+
+
+def _expand_compact(vals):
+	""" Returns _Compact values broadcast to full shape, and other values
+	unchanged.
+	"""
+	if isinstance(vals, _Compact):
+		return vals.expand()
+	return vals
+
+
+def _map_values(inputs, fn):
+	""" Applies fn to each value of bound node inputs (a list of arguments
+	or dict of keyword arguments, where values may also be lists).
+	"""
+	if isinstance(inputs, dict):
+		return {key: _map_values(val, fn) for key, val in inputs.items()}
+	if isinstance(inputs, list):
+		return [_map_values(val, fn) for val in inputs]
+	return fn(inputs)
+
+
+def _flatten_values(inputs) -> list:
+	""" Returns a list of the values of bound node inputs (see
+	_map_values).
+	"""
+	found = []
+
+	def add_value(vals):
+		found.append(vals)
+		return vals
+
+	_map_values(inputs, add_value)
+	return found
+
+
+def _map_arrays(vals, fn):
+	""" Applies fn(array, lead) to the arrays of Values or HaplotypeValues,
+	where lead is the number of leading axes that are not part of the
+	per-haplotype value (1 for the stacked array of StackedHaplotypes).
+	"""
+	if isinstance(vals, StackedHaplotypes):
+		return StackedHaplotypes(fn(vals.stacked, 1))
+	if isinstance(vals, tuple):
+		return tuple(fn(v, 0) for v in vals)
+	if isinstance(vals, (np.ndarray, PackedValues)):
+		return fn(vals, 0)
+	return vals
+
+
+def _map_inputs(inputs, fn):
+	""" Applies fn(array, lead, replicated) to the arrays of bound node
+	inputs (a list of arguments or dict of keyword arguments, where values
+	may also be lists), unwrapping _Replicated values.
+	"""
+	if isinstance(inputs, dict):
+		return {key: _map_inputs(val, fn) for key, val in inputs.items()}
+	if isinstance(inputs, list):
+		return [_map_inputs(val, fn) for val in inputs]
+	if isinstance(inputs, _Replicated):
+		return _map_arrays(inputs.vals, lambda arr, lead: fn(arr, lead, 1))
+	return _map_arrays(inputs, lambda arr, lead: fn(arr, lead, 0))
+
+
+def _iter_arrays(inputs):
+	""" Returns a list of (array, lead, replicated) for the arrays of
+	bound node inputs (see _map_inputs).
+	"""
+	found = []
+
+	def add_array(arr, lead, replicated):
+		found.append((arr, lead, replicated))
+		return arr
+
+	_map_inputs(inputs, add_array)
+	return found
+
+
+def _replicate_index(inputs, rep: int):
+	""" Returns bound node inputs with replicated values indexed to
+	replicate rep.
+	"""
+	return _map_inputs(
+		inputs,
+		lambda arr, lead, replicated: (
+			arr[(slice(None),) * lead + (rep,)] if replicated else arr
+		)
+	)
+
@@ -52,6 +52,11 @@ class IfElse(AbstractBaseFunctionNode):
             'le', 'gt', 'lt', 'eq', or 'ne'.
     """
 
+    haplotype_vectorized = True
+    replicate_vectorized = True
+    constant_foldable = True
+    sample_wise = True
+
     def __init__(
         self,
         alias: str,
@@ -41,6 +41,13 @@ class Constant(AbstractBaseFunctionNode):
             size as this input.
         constant: The constant value(s) to generate.
     """
+
+    # Only the shape of input_match_size is used, so it is not unpacked
+    supports_packed = True
+    haplotype_vectorized = True
+    replicate_vectorized = True
+    broadcast_constant = True
+    sample_wise = True
     
     def __init__(
         self,
@@ -60,14 +67,18 @@ class Constant(AbstractBaseFunctionNode):
             input_match_size: The input values used to determine the size of
                 the output array. Output will be the same size as this input.
         """
+        # Floats are made the policy's float dtype before broadcasting, so
+        # the output stays a view instead of being cast to a full array
+        constant = self.dtype_policy.cast_float(np.asarray(self.constant))
+
         if isinstance(self.constant, list):
             return np.broadcast_to(
-                np.array(self.constant)[:, np.newaxis],
+                constant[:, np.newaxis],
                 input_match_size.shape
             )
         else:
             return np.broadcast_to(
-                self.constant,
+                constant,
                 input_match_size.shape
             )
         
@@ -129,6 +140,9 @@ class RandomConstant(AbstractBaseFunctionNode):
             None, the drawn_vals will be used instead of drawing new values.
     """
 
+    broadcast_constant = True
+    uses_random = True
+
     def __init__(
         self,
         alias: str,
@@ -150,14 +164,17 @@ class RandomConstant(AbstractBaseFunctionNode):
 
     def _draw_constant(self, input_match):
         """Draw constant value(s) from the distribution."""
-        dist = getattr(np.random.default_rng(), self.dist_name)
-        if self.by_feat:
-            if input_match.ndim == 1:
-                return dist(size=1, **self.dist_kwargs)
-            else:
-                return dist(size=input_match.shape[0], **self.dist_kwargs)
+        if self.by_feat and input_match.ndim > 1:
+            size = input_match.shape[0]
         else:
-            return dist(size=1, **self.dist_kwargs)
+            size = 1
+
+        if self.random_stream is not None:
+            return self.random_stream.draw(
+                self.dist_name, (size,), self.dist_kwargs, by_sample=False
+            )
+        dist = getattr(np.random.default_rng(), self.dist_name)
+        return dist(size=size, **self.dist_kwargs)
 
     def run(self, input_match_size):
         """Generate the constant value(s).
@@ -173,15 +190,17 @@ class RandomConstant(AbstractBaseFunctionNode):
 
             else:	# Use drawn_vals from config file
                 self.constant = np.array(self.drawn_vals)
+
+        constant = self.dtype_policy.cast_float(self.constant)
                 
         if self.by_feat:
             return np.broadcast_to(
-                self.constant[:, np.newaxis],
+                constant[:, np.newaxis],
                 input_match_size.shape
             )
         else:
             return np.broadcast_to(
-                self.constant,
+                constant,
                 input_match_size.shape
             )
 
@@ -41,6 +41,9 @@ class Distribution(AbstractBaseFunctionNode):
         dist_name: The name of the distribution to sample from.
         dist_kwargs: The keyword arguments for the distribution.
     """
+
+    replicate_vectorized = True
+    uses_random = True
     
     def __init__(
         self,
@@ -57,6 +60,10 @@ class Distribution(AbstractBaseFunctionNode):
 
     def run(self, input_match_size):
         """Draw values from the distribution."""
+        if self.random_stream is not None:
+            return self.random_stream.draw(
+                self.dist_name, input_match_size.shape, self.dist_kwargs
+            )
         dist = getattr(np.random.default_rng(), self.dist_name)
         return dist(size=input_match_size.shape, **self.dist_kwargs)
     
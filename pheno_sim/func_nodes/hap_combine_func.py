@@ -17,8 +17,9 @@ Classes:
 
 import numpy as np
 
-from pheno_sim.data_types import HaplotypeValues
+from pheno_sim.data_types import HaplotypeValues, PackedValues
 from pheno_sim.base_nodes import AbstractBaseCombineFunctionNode
+from pheno_sim.func_nodes.math_func import _accumulate
 
 
 class AdditiveCombine(AbstractBaseCombineFunctionNode):
@@ -40,8 +41,16 @@ class AdditiveCombine(AbstractBaseCombineFunctionNode):
 		array([[ 8, 10, 12],
 			   [14, 16, 18]])
 	```
+
+	Bit-packed haplotypes are summed from their bits one block of samples
+	at a time, to the dtype policy's genotype dtype, without unpacking
+	them in full.
 	"""
 
+	supports_packed = True
+	replicate_vectorized = True
+	sample_wise = True
+
 	def __init__(self, alias: str, input_alias: str):
 		""" Initialize the node. 
 		
@@ -53,6 +62,8 @@ class AdditiveCombine(AbstractBaseCombineFunctionNode):
 		self.inputs = input_alias
 
 	def run(self, hap_vals: HaplotypeValues):
+		if any(isinstance(vals, PackedValues) for vals in hap_vals):
+			return _accumulate(np.add, hap_vals, self.dtype_policy.genotype)
 		return hap_vals[0] + hap_vals[1]
 	
 
@@ -77,6 +88,9 @@ class MaxCombine(AbstractBaseCombineFunctionNode):
 	```
 	"""
 
+	replicate_vectorized = True
+	sample_wise = True
+
 	def __init__(self, alias: str, input_alias: str):
 		""" Initialize the node.
 
@@ -112,6 +126,9 @@ class MinCombine(AbstractBaseCombineFunctionNode):
 	```
 	"""
 
+	replicate_vectorized = True
+	sample_wise = True
+
 	def __init__(self, alias: str, input_alias: str):
 		""" Initialize the node.
 
@@ -159,6 +176,9 @@ class MeanCombine(AbstractBaseCombineFunctionNode):
 	```
 	"""
 
+	replicate_vectorized = True
+	sample_wise = True
+
 	def __init__(
 		self,
 		alias: str,
@@ -186,8 +206,10 @@ class MeanCombine(AbstractBaseCombineFunctionNode):
 		if self.mean_type == "arithmetic":
 			return np.mean(hap_vals, axis=0)
 		elif self.mean_type == "geometric":
+			hap_vals = self.dtype_policy.as_float(hap_vals)
 			return np.exp(np.mean(np.log(hap_vals), axis=0))
 		elif self.mean_type == "harmonic":
+			hap_vals = self.dtype_policy.as_float(hap_vals)
 			return 1 / np.mean(np.divide(1, hap_vals), axis=0)
 		else:
 			raise ValueError(
@@ -11,10 +11,16 @@ Classes:
 
 import numpy as np
 
-from pheno_sim.data_types import HaplotypeValues, Values, ValuesDict
+from pheno_sim.data_types import (
+    HaplotypeValues, PackedValues, Values, ValuesDict, select_samples
+)
 from pheno_sim.base_nodes import AbstractBaseFunctionNode
 
 
+# Number of samples of PackedValues inputs unpacked at once
+PACKED_BLOCK_SIZE = 4096
+
+
 class Identity(AbstractBaseFunctionNode):
     """A node that returns the input.
     
@@ -28,6 +34,8 @@ class Identity(AbstractBaseFunctionNode):
         (array([1, 2, 3]), array([4, 5, 6]))
     ```
     """
+
+    sample_wise = True
     
     def __init__(self, alias: str, input_alias: str):
         """Initialize Identity node.
@@ -60,6 +68,8 @@ class Sum(AbstractBaseFunctionNode):
         - Vectors are summed element-wise over each of the num_feats of
             the matrices.
 
+    PackedValues inputs are unpacked one block of samples at a time.
+
     Examples:
     ```python
         >>> Sum("sum", ["arrs"])([np.array([1, 2, 3]), np.array([4, 5, 6])])
@@ -82,6 +92,12 @@ class Sum(AbstractBaseFunctionNode):
     ```		
     """
 
+    supports_packed = True
+    haplotype_vectorized = True
+    replicate_vectorized = True
+    constant_foldable = True
+    sample_wise = True
+
     def __init__(self, alias: str, input_aliases: list):
         """Initialize Sum node.
 
@@ -94,7 +110,7 @@ class Sum(AbstractBaseFunctionNode):
 
     def run(self, *input_vals):
         """Return the sum of the inputs."""
-        return np.sum(np.array(input_vals, dtype=object), axis=0).astype(float)
+        return _accumulate(np.add, input_vals, self.dtype_policy.float)
     
 
 class Product(AbstractBaseFunctionNode):
@@ -113,6 +129,9 @@ class Product(AbstractBaseFunctionNode):
         - Vectors are multiplied element-wise over each of the num_feats of
             the matrices.
 
+    PackedValues inputs (e.g. bit-packed genotypes multiplied by
+    per-feature effects) are unpacked one block of samples at a time.
+
     Examples:
     ```python
         >>> Product("product", ["arrs"])(
@@ -137,6 +156,12 @@ class Product(AbstractBaseFunctionNode):
     ```
     """
 
+    supports_packed = True
+    haplotype_vectorized = True
+    replicate_vectorized = True
+    constant_foldable = True
+    sample_wise = True
+
     def __init__(self, alias: str, input_aliases: list):
         """Initialize Product node.
         
@@ -149,7 +174,36 @@ class Product(AbstractBaseFunctionNode):
 
     def run(self, *input_vals):
         """Return the product of the inputs."""
-        return np.prod(np.array(input_vals, dtype=object), axis=0).astype(float)
+        return _accumulate(np.multiply, input_vals, self.dtype_policy.float)
+
+
+def _accumulate(ufunc, input_vals, dtype):
+    """Apply a binary ufunc cumulatively to the inputs, left to right.
+
+    The inputs are broadcast together and cast to dtype as the ufunc reads
+    them, and results are accumulated in place in one preallocated output
+    array, so no intermediate arrays are created. Values are the same as
+    reducing the inputs after casting each to dtype.
+
+    If any input is PackedValues, see _accumulate_packed.
+    """
+    if any(isinstance(vals, PackedValues) for vals in input_vals):
+        return _accumulate_packed(ufunc, input_vals, dtype)
+
+    if len(input_vals) == 1:
+        return np.asarray(input_vals[0], dtype=dtype)
+
+    out = np.empty(
+        np.broadcast_shapes(*[np.shape(vals) for vals in input_vals]),
+        dtype=dtype
+    )
+    ufunc(
+        input_vals[0], input_vals[1], out=out, dtype=dtype, casting='unsafe'
+    )
+    for vals in input_vals[2:]:
+        ufunc(out, vals, out=out, dtype=dtype, casting='unsafe')
+
+    return out
 
     
 if __name__ == "__main__":
@@ -202,4 +256,33 @@ if __name__ == "__main__":
         np.array([1, 2, 3]),
         np.array([[1, 1, 1], [2, 2, 2]]),
         np.array([[1, 1, 1], [2, 2, 2]])
-    ]))
\ No newline at end of file
+    ]))
+
+
+def _accumulate_packed(ufunc, input_vals, dtype):
+    """Apply a binary ufunc cumulatively to inputs including PackedValues.
+
+    The output is computed PACKED_BLOCK_SIZE samples at a time, unpacking
+    only that block of each PackedValues input (as uint8), so the inputs
+    are never unpacked in full. Values are the same as with the inputs
+    unpacked to any integer dtype.
+    """
+    shape = np.broadcast_shapes(*[np.shape(vals) for vals in input_vals])
+    out = np.empty(shape, dtype=dtype)
+    n_samples = shape[-1]
+
+    def sample_block(vals, block):
+        if isinstance(vals, PackedValues):
+            return select_samples(vals, block).unpack(np.uint8)
+        # Inputs broadcast along the sample axis are used whole
+        if np.ndim(vals) == 0 or np.shape(vals)[-1] != n_samples:
+            return vals
+        return vals[..., block]
+
+    for start in range(0, n_samples, PACKED_BLOCK_SIZE):
+        block = slice(start, start + PACKED_BLOCK_SIZE)
+        out[..., block] = _accumulate(
+            ufunc, [sample_block(vals, block) for vals in input_vals], dtype
+        )
+
+    return out
@@ -43,6 +43,8 @@ class GaussianNoise(AbstractBaseFunctionNode):
 		array([3.056, 1.008, 0.998])
 	```
 	"""
+	replicate_vectorized = True
+	uses_random = True
 	
 	def __init__(self, alias: str, input_alias: str, noise_std: float):
 		"""Initialize GaussianNoise node.
@@ -58,6 +60,10 @@ class GaussianNoise(AbstractBaseFunctionNode):
 		
 	def run(self, input_vals):
 		"""Return the input with Gaussian noise added."""
+		if self.random_stream is not None:
+			return input_vals + self.random_stream.draw(
+				'normal', input_vals.shape, {'loc': 0, 'scale': self.noise_std}
+			)
 		return input_vals + np.random.normal(
 			loc=0, scale=self.noise_std, size=input_vals.shape
 		)
@@ -128,6 +134,9 @@ class Heritability(AbstractBaseFunctionNode):
 		array([1.005, 0.978, 0.975])
 	```
 	"""
+	replicate_vectorized = True
+	uses_random = True
+	population_stat = 'mean_std'
 
 	def __init__(self, alias: str, input_alias: str, heritability: float):
 		"""Initialize GaussianNoiseRatio node.
@@ -142,38 +151,29 @@ class Heritability(AbstractBaseFunctionNode):
 		self.heritability = heritability
 
 	def run(self, input_vals):
-		"""Return the input with noise added to achieve some heritability."""
-
-		if input_vals.ndim == 1:
-			# Vector input
-			return np.sqrt(self.heritability) * np.divide(
-				input_vals - np.mean(input_vals), 
-				np.std(input_vals),
-				out=np.zeros_like(input_vals),
-				where=np.std(input_vals) != 0,
-				casting='unsafe'
-			) + np.sqrt(1 - self.heritability) * np.random.normal(
-				loc=0, scale=1, size=input_vals.shape
-			)
-		elif input_vals.ndim == 2:
-			# Apply to each row of matrix
-			return np.apply_along_axis(
-				func1d=lambda x: np.sqrt(self.heritability) * np.divide(
-					x - np.mean(x), 
-					np.std(x),
-					out=np.zeros_like(x),
-					where=np.std(x) != 0,
-					casting='unsafe'
-				) + np.sqrt(1 - self.heritability) * np.random.normal(
-					loc=0, scale=1, size=x.shape
-				),
-				axis=1, arr=input_vals
-			)
-		else:
+		"""Return the input with noise added to achieve some heritability.
+
+		Vectors are scaled over all samples, and matrices over each row's
+		samples. Any further leading axes (e.g. replicates) are treated
+		like rows.
+		"""
+		if input_vals.ndim == 0:
 			raise ValueError(
-				"Input must be a vector or 2D matrix. "
-				f"Input has {input_vals.ndim} dimensions."
+				"Input must be a vector or matrix. Input is a scalar."
 			)
+
+		if self.random_stream is not None:
+			noise = self.random_stream.draw('standard_normal', input_vals.shape)
+		else:
+			noise = np.random.normal(loc=0, scale=1, size=input_vals.shape)
+
+		mean, std = self.population_stats(input_vals)
+		return np.sqrt(self.heritability) * np.divide(
+			input_vals - mean,
+			std,
+			out=np.zeros(input_vals.shape, dtype=self.dtype_policy.float),
+			where=std != 0
+		) + np.sqrt(1 - self.heritability) * noise
 		
 
 if __name__ == "__main__":
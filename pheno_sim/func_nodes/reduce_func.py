@@ -25,6 +25,40 @@ Classes:
 import numpy as np
 
 from pheno_sim.base_nodes import AbstractBaseFunctionNode
+from pheno_sim.data_types import PackedValues
+
+
+_COMPARISONS = {
+	"ge": np.greater_equal,
+	"le": np.less_equal,
+	"gt": np.greater,
+	"lt": np.less,
+	"eq": np.equal,
+	"ne": np.not_equal,
+}
+
+
+def _get_comparison(comparison):
+	"""Return the numpy comparison function for a comparison name."""
+	if comparison not in _COMPARISONS:
+		raise ValueError(
+			"comparison must be one of 'ge', 'le', 'gt', 'lt', 'eq', or 'ne'"
+		)
+	return _COMPARISONS[comparison]
+
+
+def _packed_num_matching(input_vals, compare, threshold):
+	"""Return the number of features of each sample that meet a comparison
+	with a threshold, for PackedValues input.
+
+	Since packed values are all 0 or 1, the comparison is evaluated only for
+	0 and 1, and applied to the popcount of each sample's features.
+	"""
+	num_ones = input_vals.count()
+	return (
+		int(compare(1, threshold)) * num_ones
+		+ int(compare(0, threshold)) * (input_vals.n_feats - num_ones)
+	)
 
 
 class SumReduce(AbstractBaseFunctionNode):
@@ -33,6 +67,8 @@ class SumReduce(AbstractBaseFunctionNode):
 	For a Values matrix (num_feats, num_samples), returns a vector of
 	the sum of the feature values for each sample (a num_samples length
 	array).
+
+	PackedValues matrices are summed with a popcount, without unpacking.
 	
 	Example:
 	```python
@@ -40,6 +76,8 @@ class SumReduce(AbstractBaseFunctionNode):
 		array([ 5,  7,  9])
 	```
 	"""
+	supports_packed = True
+	sample_wise = True
 
 	def __init__(self, alias: str, input_alias: str):
 		"""Initialize SumReduce node.
@@ -53,6 +91,10 @@ class SumReduce(AbstractBaseFunctionNode):
 
 	def run(self, input_vals):
 		"""Return sum of each sample's feature values as the sample's value."""
+		if isinstance(input_vals, PackedValues):
+			if not input_vals.is_vector:
+				return input_vals.count()
+			input_vals = input_vals.unpack(self.dtype_policy.genotype)
 		return np.sum(input_vals, axis=0)
 
 
@@ -70,6 +112,8 @@ class ProductReduce(AbstractBaseFunctionNode):
 	```
 	"""
 
+	sample_wise = True
+
 	def __init__(self, alias: str, input_alias: str):
 		"""Initialize ProductReduce node.
 		
@@ -98,6 +142,8 @@ class MinReduce(AbstractBaseFunctionNode):
 		array([1, 2, 3])
 	```
 	"""
+
+	sample_wise = True
 	
 	def __init__(self, alias: str, input_alias: str):
 		"""Initialize MinReduce node.
@@ -127,6 +173,8 @@ class MaxReduce(AbstractBaseFunctionNode):
 		array([4, 5, 6])
 	```
 	"""
+
+	sample_wise = True
 	
 	def __init__(self, alias: str, input_alias: str):
 		"""Initialize MaxReduce node.
@@ -167,6 +215,8 @@ class MeanReduce(AbstractBaseFunctionNode):
 	```
 	"""
 
+	sample_wise = True
+
 	def __init__(
 		self, 
 		alias: str, 
@@ -190,8 +240,10 @@ class MeanReduce(AbstractBaseFunctionNode):
 		if self.mean_type == "arithmetic":
 			return np.mean(input_vals, axis=0)
 		elif self.mean_type == "geometric":
+			input_vals = self.dtype_policy.as_float(input_vals)
 			return np.exp(np.mean(np.log(input_vals), axis=0))
 		elif self.mean_type == "harmonic":
+			input_vals = self.dtype_policy.as_float(input_vals)
 			return 1 / np.mean(np.divide(1, input_vals), axis=0)
 		else:
 			raise ValueError(
@@ -218,6 +270,8 @@ class AnyReduce(AbstractBaseFunctionNode):
 		array([0, 1, 0])
 	```
 	"""
+	supports_packed = True
+	sample_wise = True
 
 	def __init__(
 		self,
@@ -243,22 +297,16 @@ class AnyReduce(AbstractBaseFunctionNode):
 
 	def run(self, input_vals):
 		"""Return 1 if any feature value is past a threshold, 0 otherwise."""
-		if self.comparison == "ge":
-			return np.any(input_vals >= self.threshold, axis=0).astype(int)
-		elif self.comparison == "le":
-			return np.any(input_vals <= self.threshold, axis=0).astype(int)
-		elif self.comparison == "gt":
-			return np.any(input_vals > self.threshold, axis=0).astype(int)
-		elif self.comparison == "lt":
-			return np.any(input_vals < self.threshold, axis=0).astype(int)
-		elif self.comparison == "eq":
-			return np.any(input_vals == self.threshold, axis=0).astype(int)
-		elif self.comparison == "ne":
-			return np.any(input_vals != self.threshold, axis=0).astype(int)
-		else:
-			raise ValueError(
-				"comparison must be one of 'ge', 'le', 'gt', 'lt', 'eq', or 'ne'"
-			)
+		compare = _get_comparison(self.comparison)
+		if isinstance(input_vals, PackedValues):
+			if not input_vals.is_vector:
+				return (_packed_num_matching(
+					input_vals, compare, self.threshold
+				) > 0).astype(self.dtype_policy.indicator)
+			input_vals = input_vals.unpack(self.dtype_policy.genotype)
+		return np.any(
+			compare(input_vals, self.threshold), axis=0
+		).astype(self.dtype_policy.indicator)
 		
 
 class AllReduce(AbstractBaseFunctionNode):
@@ -280,6 +328,8 @@ class AllReduce(AbstractBaseFunctionNode):
 		array([0, 0, 0])
 	```
 	"""
+	supports_packed = True
+	sample_wise = True
 
 	def __init__(
 		self,
@@ -305,22 +355,16 @@ class AllReduce(AbstractBaseFunctionNode):
 
 	def run(self, input_vals):
 		"""Return 1 if all feature values are past a threshold, 0 otherwise."""
-		if self.comparison == "ge":
-			return np.all(input_vals >= self.threshold, axis=0).astype(int)
-		elif self.comparison == "le":
-			return np.all(input_vals <= self.threshold, axis=0).astype(int)
-		elif self.comparison == "gt":
-			return np.all(input_vals > self.threshold, axis=0).astype(int)
-		elif self.comparison == "lt":
-			return np.all(input_vals < self.threshold, axis=0).astype(int)
-		elif self.comparison == "eq":
-			return np.all(input_vals == self.threshold, axis=0).astype(int)
-		elif self.comparison == "ne":
-			return np.all(input_vals != self.threshold, axis=0).astype(int)
-		else:
-			raise ValueError(
-				"comparison must be one of 'ge', 'le', 'gt', 'lt', 'eq', or 'ne'"
-			)
+		compare = _get_comparison(self.comparison)
+		if isinstance(input_vals, PackedValues):
+			if not input_vals.is_vector:
+				return (_packed_num_matching(
+					input_vals, compare, self.threshold
+				) == input_vals.n_feats).astype(self.dtype_policy.indicator)
+			input_vals = input_vals.unpack(self.dtype_policy.genotype)
+		return np.all(
+			compare(input_vals, self.threshold), axis=0
+		).astype(self.dtype_policy.indicator)
 
 
 
@@ -16,9 +16,9 @@ Classes:
 """
 
 import numpy as np
-from scipy.stats import iqr
 
 from pheno_sim.base_nodes import AbstractBaseFunctionNode
+from pheno_sim.population_stats import median_iqr
 
 
 class Clip(AbstractBaseFunctionNode):
@@ -56,6 +56,11 @@ class Clip(AbstractBaseFunctionNode):
 	```
 	"""
 
+	haplotype_vectorized = True
+	replicate_vectorized = True
+	constant_foldable = True
+	sample_wise = True
+
 	def __init__(
 		self,
 		alias: str,
@@ -118,6 +123,7 @@ class MinMaxScaler(AbstractBaseFunctionNode):
 			[0.75 , 0.875, 1.   ]])
 	```
 	"""
+	population_stat = 'min_max'
 	
 	def __init__(self, alias: str, input_alias: str, by_feat: bool = True):
 		"""Initialize MinMaxScaler node.
@@ -132,6 +138,10 @@ class MinMaxScaler(AbstractBaseFunctionNode):
 		self.inputs = input_alias
 		self.by_feat = by_feat
 
+	@property
+	def population_by_row(self):
+		return self.by_feat
+
 	def run(self, input_vals):
 		"""Return the input scaled to be between 0 and 1.
 		
@@ -143,12 +153,7 @@ class MinMaxScaler(AbstractBaseFunctionNode):
 		"""
 		if input_vals.ndim == 1:
 			input_vals = input_vals.reshape(1, -1)
-		if self.by_feat:
-			min_vals = input_vals.min(1, keepdims=True)
-			max_vals = input_vals.max(1, keepdims=True)
-		else:
-			min_vals = input_vals.min(keepdims=True)
-			max_vals = input_vals.max(keepdims=True)
+		min_vals, max_vals = self.population_stats(input_vals)
 		
 		# Avoid division by zero
 		ranges = max_vals - min_vals
@@ -202,6 +207,7 @@ class StandardScaler(AbstractBaseFunctionNode):
 		>>> all_out.std()
 		1.0
 	"""
+	population_stat = 'mean_std'
 
 	def __init__(self, alias: str, input_alias: str, by_feat: bool = True):
 		"""Initialize StandardScaler node.
@@ -216,16 +222,15 @@ class StandardScaler(AbstractBaseFunctionNode):
 		self.inputs = input_alias
 		self.by_feat = by_feat
 
+	@property
+	def population_by_row(self):
+		return self.by_feat
+
 	def run(self, input_vals):
 		"""Scale the input to have mean 0 and standard deviation 1."""
 		if input_vals.ndim == 1:
 			input_vals = input_vals.reshape(1, -1)
-		if self.by_feat:
-			mean_vals = input_vals.mean(1, keepdims=True)
-			std_vals = input_vals.std(1, keepdims=True)
-		else:
-			mean_vals = input_vals.mean(keepdims=True)
-			std_vals = input_vals.std(keepdims=True)
+		mean_vals, std_vals = self.population_stats(input_vals)
 
 		# Avoid division by zero
 		if np.any(std_vals == 0):
@@ -282,6 +287,7 @@ class RobustScaler(AbstractBaseFunctionNode):
 		array([0.608, 0.546, 0.528, 0.483, 0.571])
 	```
 	"""
+	population_stat = 'median_iqr'
 
 	def __init__(
 		self,
@@ -308,17 +314,15 @@ class RobustScaler(AbstractBaseFunctionNode):
 		self.out_iqr = out_iqr
 		self.out_median = out_median
 
+	@property
+	def population_by_row(self):
+		return self.by_feat
+
 	def run(self, input_vals):
 		"""Scale the input to have median 0 and interquartile range 1."""
 		if input_vals.ndim == 1:
 			input_vals = input_vals.reshape(1, -1)
-		
-		if self.by_feat:
-			medians = np.median(input_vals, axis=1, keepdims=True)
-			iqrs = iqr(input_vals, axis=1, keepdims=True)
-		else:
-			medians = np.median(input_vals, keepdims=True)
-			iqrs = iqr(input_vals, keepdims=True)
+		medians, iqrs = self.population_stats(input_vals)
 
 		# To avoid division by zero, replace zero IQRs with 1
 		iqrs = np.where(iqrs == 0, 1, iqrs)
@@ -367,8 +371,7 @@ if __name__ == "__main__":
 		"robust", "vals", out_iqr=.5, out_median=1
 	)
 	scaled_vals = robust_scaled(vals)
-	np.median(scaled_vals, axis=0)
-	iqr(scaled_vals, axis=0)
+	median_iqr(scaled_vals.T)
 
 
 	# Test Clip
@@ -54,6 +54,11 @@ class ReLU(AbstractBaseFunctionNode):
 	```
 	"""
 	
+	haplotype_vectorized = True
+	replicate_vectorized = True
+	constant_foldable = True
+	sample_wise = True
+
 	def __init__(
 		self,
 		alias: str,
@@ -101,6 +106,10 @@ class Sigmoid(AbstractBaseFunctionNode):
 	```
 	"""
 
+	haplotype_vectorized = True
+	replicate_vectorized = True
+	sample_wise = True
+
 	def __init__(self, alias: str, input_alias: str):
 		"""Initialize Sigmoid node.
 		
@@ -113,6 +122,7 @@ class Sigmoid(AbstractBaseFunctionNode):
 		
 	def run(self, input_vals):
 		"""Return the input with sigmoid applied."""
+		input_vals = self.dtype_policy.as_float(input_vals)
 		return 1 / (1 + np.exp(-input_vals))
 	
 
@@ -145,6 +155,8 @@ class Softmax(AbstractBaseFunctionNode):
 	```
 	"""
 
+	sample_wise = True
+
 	def __init__(self, alias: str, input_alias: str):
 		"""Initialize Softmax node.
 		
@@ -163,7 +175,7 @@ class Softmax(AbstractBaseFunctionNode):
 				"multiple values per sample)."
 			)
 
-		exp_vals = np.exp(input_vals)
+		exp_vals = np.exp(self.dtype_policy.as_float(input_vals))
 		return exp_vals / exp_vals.sum(0)
 
 
@@ -181,6 +193,10 @@ class Tanh(AbstractBaseFunctionNode):
 	```
 	"""
 
+	haplotype_vectorized = True
+	replicate_vectorized = True
+	sample_wise = True
+
 	def __init__(self, alias: str, input_alias: str):
 		"""Initialize Tanh node.
 		
@@ -193,7 +209,7 @@ class Tanh(AbstractBaseFunctionNode):
 		
 	def run(self, input_vals):
 		"""Return the input with tanh applied."""
-		return np.tanh(input_vals)
+		return np.tanh(self.dtype_policy.as_float(input_vals))
 	
 
 if __name__ == "__main__":
@@ -30,8 +30,13 @@ class Concatenate(AbstractBaseFunctionNode):
 			   [4, 5, 6],
 			   [7, 8, 9]])
 	```
+
+	Inputs are written directly into row slices of one preallocated output
+	array.
 	"""
 
+	sample_wise = True
+
 	def __init__(self, alias: str, input_aliases: list):
 		"""Initialize Concatenate node.
 
@@ -44,7 +49,27 @@ class Concatenate(AbstractBaseFunctionNode):
 
 	def run(self, *input_vals):
 		"""Return concatenated array of input values."""
-		return np.vstack(input_vals)
+		# Vectors are single rows, as with np.vstack
+		input_vals = [np.atleast_2d(vals) for vals in input_vals]
+
+		n_cols = {vals.shape[1] for vals in input_vals}
+		if len(n_cols) != 1:
+			raise ValueError(
+				"All inputs to Concatenate must have the same number of "
+				f"samples, got {sorted(n_cols)}."
+			)
+
+		concat_vals = np.empty(
+			(sum(vals.shape[0] for vals in input_vals), n_cols.pop()),
+			dtype=np.result_type(*input_vals)
+		)
+
+		row = 0
+		for vals in input_vals:
+			concat_vals[row:row + vals.shape[0]] = vals
+			row += vals.shape[0]
+
+		return concat_vals
 	
 
 if __name__ == "__main__":
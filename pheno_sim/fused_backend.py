@@ -0,0 +1,955 @@
+""" Fused, sample blocked backend for running an ExecutionPlan.
+
+Running a plan step by step streams each step's full (n_feats, n_samples)
+values through memory once per step. For deep chains of element-wise
+steps this is memory bound. A FusedPlan instead groups steps whose nodes
+have sample_wise set (and do not use random numbers) and runs each group
+one block of samples at a time, so a block's intermediate values stay in
+cache and only values used outside the group (or returned) are written to
+full size arrays. Other steps (e.g. random draws, scalers that use all
+samples, and compact constants) are run as usual between groups.
+
+Groups are run either by a generated Numba kernel or by the blocked NumPy
+fallback:
+
+	- Numba (used by default if installed): the source of a kernel that
+		loops over sample blocks in parallel (numba.prange) and computes
+		every step of the group for each block is generated from the
+		nodes, and compiled with njit(parallel=True, cache=True). Kernels
+		are written to '<cache dir>/codegen/<key>.py', where the cache dir
+		is as for DiskCache and the key is a hash of the source (which
+		depends on the nodes, their parameters, and the shapes and dtypes
+		of their values, but not the number of samples), so compiled
+		kernels are reused across runs and processes. Only nodes with a
+		kernel emitter (see _EMITTERS) are fused.
+	- Blocked NumPy: each node's run() is called on blocks of samples,
+		with blocks run concurrently in a thread pool.
+
+Values are the same as running the plan step by step, up to floating
+point rounding: Numba kernels compute element by element, so e.g.
+exponentials and means may differ in the last bits.
+
+Example:
+	plan = ExecutionPlan(sim.simulation_steps, outputs=['phenotype'])
+	fused_plan = FusedPlan(plan)
+	vals_dict = fused_plan.run(input_vals)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import importlib.util
+import os
+import sys
+import tempfile
+from typing import List
+
+import numpy as np
+
+from pheno_sim.base_nodes import AbstractBaseFunctionNode
+from pheno_sim.data_types import (
+	PackedValues, StackedHaplotypes, ValuesDict, select_samples,
+	stack_haplotypes
+)
+from pheno_sim.disk_cache import DEFAULT_CACHE_DIR, make_key
+from pheno_sim.execution_plan import (
+	ExecutionPlan, _KEYWORD, _NO_INPUTS, _POSITIONAL, _SINGLE,
+	_expand_compact, _RunState
+)
+from pheno_sim.func_nodes import (
+	AdditiveCombine, AllReduce, AnyReduce, Clip, Concatenate, Identity,
+	IfElse, MaxCombine, MaxReduce, MeanCombine, MeanReduce, MinCombine,
+	MinReduce, Product, ProductReduce, ReLU, Sigmoid, Sum, SumReduce, Tanh
+)
+from pheno_sim.population_stats import memoize
+
+
+# Default number of samples per block
+NUMBA_BLOCK_SIZE = 1024
+NUMPY_BLOCK_SIZE = 16384
+
+# Compiled kernels by source key
+_kernels = dict()
+
+
+class FusedPlan:
+	""" Runs an ExecutionPlan with sample-wise steps fused into groups that
+	are run one block of samples at a time.
+
+	Attributes:
+		plan: The ExecutionPlan.
+		use_numba: Whether groups are run by generated Numba kernels.
+		block_size: Number of samples per block.
+		stages: List of lists of step indices, in run order. Lists with
+			more than one step are fused groups.
+		peak_live_bytes: Peak total size in bytes of the values in the
+			ValuesDict during the last run (not including the values of a
+			block), or None if not run yet.
+
+	Args:
+		plan: ExecutionPlan to run.
+		use_numba (default None): Whether to run groups with Numba kernels.
+			If None, Numba is used if it is installed.
+		block_size (default None): Number of samples per block. If None,
+			NUMBA_BLOCK_SIZE or NUMPY_BLOCK_SIZE.
+
+	Methods:
+		run(vals_dict, release_inputs, max_workers): Runs the plan on
+			vals_dict, as ExecutionPlan.run.
+	"""
+
+	def __init__(
+		self,
+		plan: ExecutionPlan,
+		use_numba: bool = None,
+		block_size: int = None
+	):
+		if use_numba is None:
+			use_numba = importlib.util.find_spec('numba') is not None
+		elif use_numba and importlib.util.find_spec('numba') is None:
+			raise ImportError(
+				"numba is required to run fused steps with Numba kernels. "
+				"Install it with 'pip install numba'."
+			)
+		if block_size is None:
+			block_size = NUMBA_BLOCK_SIZE if use_numba else NUMPY_BLOCK_SIZE
+		if block_size < 1:
+			raise ValueError("block_size must be at least 1.")
+
+		self.plan = plan
+		self.use_numba = use_numba
+		self.block_size = block_size
+		self.peak_live_bytes = None
+
+		self.stages = self._get_stages()
+		self._materialized = self._get_materialized_aliases()
+
+	def _is_fusable(self, node: AbstractBaseFunctionNode) -> bool:
+		""" Returns whether a step can be run in a fused group. """
+		if (
+			not node.sample_wise
+			or node.uses_random
+			or node.alias in self.plan.compact_aliases
+		):
+			return False
+		return not self.use_numba or _get_emitter(node) is not None
+
+	def _get_stages(self) -> List[List[int]]:
+		""" Returns the steps grouped into stages.
+
+		Each step gets a level: a non-fusable step's level is the max level
+		of the steps it depends on, and a fusable step's level is also
+		more than that of the non-fusable steps it depends on. Each level
+		runs its fusable steps as one group, then its other steps in plan
+		order, so every step runs after the steps it depends on (including
+		the order of random draws, see ExecutionPlan).
+		"""
+		steps = self.plan.steps
+		fusable = [self._is_fusable(node) for node in steps]
+
+		levels = []
+		for i, deps in enumerate(self.plan._step_deps):
+			level = 0
+			for dep in deps:
+				if fusable[i] and not fusable[dep]:
+					level = max(level, levels[dep] + 1)
+				else:
+					level = max(level, levels[dep])
+			levels.append(level)
+
+		stages = []
+		for level in range(max(levels, default=-1) + 1):
+			group = [
+				i for i in range(len(steps))
+				if fusable[i] and levels[i] == level
+			]
+			if len(group) > 1:
+				stages.append(group)
+			else:
+				group = []
+			stages.extend(
+				[i] for i in range(len(steps))
+				if levels[i] == level and i not in group
+			)
+
+		return stages
+
+	def _get_materialized_aliases(self) -> set:
+		""" Returns the aliases of steps in fused groups whose values are
+		stored at full size: values used outside their group or returned.
+		"""
+		plan = self.plan
+		group_of = dict()
+		for stage_idx, stage in enumerate(self.stages):
+			for i in stage:
+				group_of[plan.steps[i].alias] = stage_idx
+
+		materialized = set()
+		for node in plan.steps:
+			for alias in plan.dependencies[node.alias]:
+				if alias in group_of and group_of[alias] != group_of[node.alias]:
+					materialized.add(alias)
+
+		for alias in group_of:
+			if (
+				plan.outputs is None
+				or alias in plan.outputs
+				or alias in plan._shared_aliases.values()
+			):
+				materialized.add(alias)
+
+		return materialized
+
+	def run(
+		self,
+		vals_dict: ValuesDict,
+		release_inputs: bool = False,
+		max_workers: int = 1,
+		stored_run=None
+	) -> ValuesDict:
+		""" Runs the steps of the plan, running fused groups block by block.
+
+		Steps that are not in fused groups run one at a time. Otherwise
+		the same as ExecutionPlan.run without replicates.
+
+		Args:
+			vals_dict: A ValuesDict containing (at least) the values of
+				the plan's required_inputs.
+			release_inputs (default False): See ExecutionPlan.run.
+			max_workers (default 1): Max number of blocks to run at once on
+				the blocked NumPy backend. If None, uses the number of
+				CPUs. Numba kernels use Numba's thread pool (see
+				NUMBA_NUM_THREADS).
+			stored_run (default None): See ExecutionPlan.run. Outputs of
+				steps in fused groups are always computed, and not stored.
+
+		Returns:
+			vals_dict, with the outputs of the function nodes run added.
+		"""
+		if max_workers is None:
+			max_workers = os.cpu_count() or 1
+
+		plan = self.plan
+		run_state = _RunState(plan, vals_dict, release_inputs)
+
+		with memoize():
+			for stage in self.stages:
+				if len(stage) > 1:
+					# Before the group's inputs may be released
+					if stored_run is not None:
+						for i in stage:
+							stored_run.add_fingerprint(i)
+					self._run_group(stage, vals_dict, run_state, max_workers)
+				else:
+					args, kwargs = plan._bind_inputs(stage[0], vals_dict)
+					run_state.step_done(
+						stage[0], plan._call_stored(
+							stage[0], args, kwargs, stored_run=stored_run
+						)
+					)
+
+		self.peak_live_bytes = run_state.peak_live_bytes
+
+		plan._share_duplicate_values(vals_dict)
+		plan._order_values(vals_dict)
+
+		return vals_dict
+
+	def _run_group(
+		self,
+		group: List[int],
+		vals_dict: ValuesDict,
+		run_state: _RunState,
+		max_workers: int
+	) -> None:
+		""" Runs a fused group of steps and stores the values of its
+		materialized steps.
+
+		The group is first run on a block of (up to) two samples, to get
+		the shapes and dtypes of its values. If these are not sample-wise,
+		the group's steps are run as usual instead.
+		"""
+		plan = self.plan
+		group_aliases = {plan.steps[i].alias for i in group}
+		inputs = {
+			alias: _expand_compact(vals_dict[alias])
+			for i in group
+			for alias in plan.dependencies[plan.steps[i].alias]
+			if alias not in group_aliases
+		}
+
+		n_samples = None
+		if len(inputs) > 0:
+			n_samples = _value_shape(next(iter(inputs.values())))[-1]
+
+		infos = None
+		if n_samples is not None and n_samples > 0:
+			n_infer = min(n_samples, 2)
+			block_vals = self._run_block(group, inputs, 0, n_infer)
+			infos = {
+				alias: _value_info(block_vals[alias], n_infer)
+				for alias in group_aliases
+			}
+			if any(info is None for info in infos.values()):
+				infos = None
+
+		if infos is None:
+			for i in group:
+				args, kwargs = plan._bind_inputs(i, vals_dict)
+				run_state.step_done(i, plan._call_step(i, args, kwargs))
+			return
+
+		outputs = dict()
+		for i in group:
+			alias = plan.steps[i].alias
+			if alias in self._materialized:
+				outputs[alias] = np.empty(
+					(
+						2 if infos[alias].haplotype else 1,
+						infos[alias].n_feats,
+						n_samples
+					),
+					dtype=infos[alias].dtype
+				)
+
+		kernel = None
+		if self.use_numba:
+			try:
+				kernel_inputs = {
+					alias: _KernelInput(vals) for alias, vals in inputs.items()
+				}
+				kernel = _load_kernel(self._kernel_source(
+					group, kernel_inputs, infos, outputs
+				))
+			except _Unsupported:
+				kernel = None
+
+		if kernel is not None:
+			kernel(
+				n_samples,
+				self.block_size,
+				*[kernel_input.arr for kernel_input in kernel_inputs.values()],
+				*outputs.values()
+			)
+		else:
+			def run_block(start):
+				stop = min(start + self.block_size, n_samples)
+				block_vals = self._run_block(group, inputs, start, stop)
+				for alias, output in outputs.items():
+					output[:, :, start:stop] = _as_3d(block_vals[alias])
+
+			starts = range(0, n_samples, self.block_size)
+			if max_workers <= 1 or len(starts) <= 1:
+				for start in starts:
+					run_block(start)
+			else:
+				with ThreadPoolExecutor(max_workers=max_workers) as pool:
+					list(pool.map(run_block, starts))
+
+		for i in group:
+			alias = plan.steps[i].alias
+			if alias in outputs:
+				run_state.step_done(i, _from_3d(outputs[alias], infos[alias]))
+			else:
+				run_state.release_inputs_of(i)
+
+	def _run_block(self, group: List[int], inputs: dict, start: int, stop: int):
+		""" Runs the steps of a group on samples start to stop of its
+		inputs, and returns a dict of the block values.
+		"""
+		block_vals = {
+			alias: _select_block(vals, start, stop)
+			for alias, vals in inputs.items()
+		}
+		for i in group:
+			args, kwargs = self.plan._bind_inputs(i, block_vals)
+			block_vals[self.plan.steps[i].alias] = self.plan.steps[i](
+				*args, **kwargs
+			)
+		return block_vals
+
+	def _kernel_source(
+		self,
+		group: List[int],
+		kernel_inputs: dict,
+		infos: dict,
+		outputs: dict
+	) -> str:
+		""" Returns the source of the Numba kernel running a group.
+
+		The kernel is called as kernel(n_samples, block_size, *inputs,
+		*outputs), with the arrays of _KernelInput and the (n_haps,
+		n_feats, n_samples) output arrays.
+
+		Raises:
+			_Unsupported: If a node or value cannot be run by a kernel.
+		"""
+		plan = self.plan
+
+		operands = dict()
+		for k, (alias, kernel_input) in enumerate(kernel_inputs.items()):
+			operands[alias] = _Operand(
+				f"x{k}", kernel_input.n_haps, kernel_input.n_feats,
+				kernel_input.dtype, 'j0 + ', kernel_input.packed
+			)
+		output_names = {alias: f"y{k}" for k, alias in enumerate(outputs)}
+
+		body = []
+		for k, i in enumerate(group):
+			node = plan.steps[i]
+			info = infos[node.alias]
+			if node.alias in outputs:
+				out = _Operand(
+					output_names[node.alias], 2 if info.haplotype else 1,
+					info.n_feats, info.dtype, 'j0 + '
+				)
+			else:
+				out = _Operand(
+					f"s{k}", 2 if info.haplotype else 1, info.n_feats,
+					info.dtype, ''
+				)
+				body.append(
+					f"{out.name} = np.empty(({out.n_haps}, {out.n_feats}, nb), "
+					f"dtype={_numba_type(out.dtype)})"
+				)
+
+			strategy, aliases = plan._bindings[i]
+			if strategy == _NO_INPUTS:
+				raise _Unsupported()
+			elif strategy == _SINGLE:
+				args, kwargs = [operands[aliases]], {}
+			elif strategy == _POSITIONAL:
+				args, kwargs = [operands[alias] for alias in aliases], {}
+			elif strategy == _KEYWORD:
+				if any(isinstance(alias, tuple) for _, alias in aliases):
+					raise _Unsupported()
+				args = []
+				kwargs = {name: operands[alias] for name, alias in aliases}
+
+			body.extend(_get_emitter(node)(node, out, args, kwargs))
+			operands[node.alias] = out
+
+		params = ', '.join(
+			[f"x{k}" for k in range(len(kernel_inputs))]
+			+ list(output_names.values())
+		)
+		lines = [
+			"@njit(parallel=True, cache=True)",
+			f"def kernel(n_samples, block_size, {params}):",
+			"\tn_blocks = (n_samples + block_size - 1) // block_size",
+			"\tfor b in prange(n_blocks):",
+			"\t\tj0 = b * block_size",
+			"\t\tnb = min(block_size, n_samples - j0)",
+		]
+		lines.extend('\t\t' + line for line in body)
+
+		return _KERNEL_HEADER + '\n\n' + '\n'.join(lines) + '\n'
+
+
+class _Unsupported(Exception):
+	""" Raised when a fused group cannot be run by a Numba kernel. """
+
+
+class _ValueInfo:
+	""" Shape and dtype of the values of a step in a fused group, apart
+	from the sample axis.
+	"""
+	__slots__ = ('haplotype', 'ndim', 'n_feats', 'dtype')
+
+	def __init__(self, haplotype, ndim, n_feats, dtype):
+		self.haplotype = haplotype
+		self.ndim = ndim
+		self.n_feats = n_feats
+		self.dtype = dtype
+
+
+class _KernelInput:
+	""" An input value of a Numba kernel as an (n_haps, n_feats,
+	n_samples) array, or for PackedValues, the (n_haps, n_bytes,
+	n_samples) array of packed bits.
+	"""
+	__slots__ = ('arr', 'n_haps', 'n_feats', 'dtype', 'packed')
+
+	def __init__(self, vals):
+		if isinstance(vals, PackedValues) or (
+			isinstance(vals, tuple)
+			and not isinstance(vals, StackedHaplotypes)
+			and all(isinstance(v, PackedValues) for v in vals)
+		):
+			packed_vals = vals if isinstance(vals, tuple) else (vals,)
+			self.arr = np.stack([v.bits for v in packed_vals])
+			self.n_feats = packed_vals[0].n_feats
+			self.dtype = np.dtype(int)
+			self.packed = True
+		else:
+			self.arr = _as_3d(vals)
+			self.n_feats = self.arr.shape[1]
+			self.dtype = self.arr.dtype
+			self.packed = False
+		self.n_haps = self.arr.shape[0]
+
+
+class _Operand:
+	""" A value in a generated kernel, and how to index it. """
+	__slots__ = ('name', 'n_haps', 'n_feats', 'dtype', 'offset', 'packed')
+
+	def __init__(self, name, n_haps, n_feats, dtype, offset, packed=False):
+		self.name = name
+		self.n_haps = n_haps
+		self.n_feats = n_feats
+		self.dtype = dtype
+		self.offset = offset
+		self.packed = packed
+
+	def at(self, h: str, f: str) -> str:
+		""" Returns the expression of the element at haplotype index h and
+		feature index f of sample j of the block. Size 1 axes are
+		broadcast.
+		"""
+		h = h if self.n_haps > 1 else '0'
+		f = f if self.n_feats > 1 else '0'
+		if self.packed:
+			return (
+				f"(({self.name}[{h}, ({f}) >> 3, {self.offset}j] "
+				f">> (7 - (({f}) & 7))) & 1)"
+			)
+		return f"{self.name}[{h}, {f}, {self.offset}j]"
+
+
+_KERNEL_HEADER = '''import numpy as np
+from numba import njit, prange
+
+
+# np.maximum and np.minimum, which return NaN if either value is NaN
+@njit(inline='always')
+def _maximum(a, b):
+	return a if (a >= b or a != a) else b
+
+
+@njit(inline='always')
+def _minimum(a, b):
+	return a if (a <= b or a != a) else b
+'''
+
+_COMPARISON_OPS = {
+	"ge": ">=",
+	"le": "<=",
+	"gt": ">",
+	"lt": "<",
+	"eq": "==",
+	"ne": "!=",
+}
+
+
+def _numba_type(dtype) -> str:
+	""" Returns the expression of a NumPy scalar type in kernel source. """
+	dtype = np.dtype(dtype)
+	if dtype.kind == 'b':
+		return 'np.bool_'
+	if dtype.kind not in 'iuf':
+		raise _Unsupported()
+	return f"np.{dtype.name}"
+
+
+def _cast(expr: str, dtype) -> str:
+	return f"{_numba_type(dtype)}({expr})"
+
+
+def _literal(value) -> str:
+	""" Returns the source of a scalar node parameter. """
+	if isinstance(value, (bool, np.bool_)):
+		return repr(bool(value))
+	if isinstance(value, (int, np.integer)):
+		return repr(int(value))
+	if isinstance(value, (float, np.floating)):
+		if np.isnan(value):
+			return 'np.nan'
+		if np.isinf(value):
+			return 'np.inf' if value > 0 else '-np.inf'
+		return repr(float(value))
+	raise _Unsupported()
+
+
+def _comparison(node, operand: _Operand, h: str, f: str) -> str:
+	if node.comparison not in _COMPARISON_OPS:
+		raise _Unsupported()
+	return (
+		f"{operand.at(h, f)} {_COMPARISON_OPS[node.comparison]} "
+		f"{_literal(node.threshold)}"
+	)
+
+
+def _elementwise(out: _Operand, expr) -> List[str]:
+	""" Returns kernel lines setting each element of out to expr(h, f). """
+	return [
+		f"for h in range({out.n_haps}):",
+		f"\tfor f in range({out.n_feats}):",
+		"\t\tfor j in range(nb):",
+		f"\t\t\t{out.at('h', 'f')} = {expr('h', 'f')}",
+	]
+
+
+def _reduce(out: _Operand, x: _Operand, init, update, final=None):
+	""" Returns kernel lines reducing x over features into out, with
+	init(value), update(acc, value), and optionally final(acc).
+	"""
+	acc = out.at('h', '0')
+	lines = [
+		f"for h in range({out.n_haps}):",
+		"\tfor j in range(nb):",
+		f"\t\t{acc} = {init(x.at('h', '0'))}",
+		f"\tfor f in range(1, {x.n_feats}):",
+		"\t\tfor j in range(nb):",
+		f"\t\t\t{acc} = {update(acc, x.at('h', 'f'))}",
+	]
+	if final is not None:
+		lines.extend([
+			"\tfor j in range(nb):",
+			f"\t\t{acc} = {final(acc)}",
+		])
+	return lines
+
+
+def _haplotype_operand(args) -> _Operand:
+	""" Returns the HaplotypeValues input of a combine node. """
+	x, = args
+	if x.n_haps != 2:
+		raise _Unsupported()
+	return x
+
+
+def _emit_identity(node, out, args, kwargs):
+	x, = args
+	return _elementwise(out, lambda h, f: _cast(x.at(h, f), out.dtype))
+
+
+def _emit_sum(node, out, args, kwargs):
+	return _elementwise(out, lambda h, f: ' + '.join(
+		_cast(x.at(h, f), out.dtype) for x in args
+	))
+
+
+def _emit_product(node, out, args, kwargs):
+	return _elementwise(out, lambda h, f: ' * '.join(
+		_cast(x.at(h, f), out.dtype) for x in args
+	))
+
+
+def _emit_clip(node, out, args, kwargs):
+	x, = args
+
+	def expr(h, f):
+		val = _cast(x.at(h, f), out.dtype)
+		if node.min_val is not None:
+			val = f"_maximum({val}, {_cast(_literal(node.min_val), out.dtype)})"
+		if node.max_val is not None:
+			val = f"_minimum({val}, {_cast(_literal(node.max_val), out.dtype)})"
+		return val
+
+	return _elementwise(out, expr)
+
+
+def _emit_relu(node, out, args, kwargs):
+	x, = args
+	pos_slope = _cast(_literal(node.pos_slope), out.dtype)
+	neg_slope = _cast(_literal(node.neg_slope), out.dtype)
+	return _elementwise(out, lambda h, f: (
+		f"({_cast(x.at(h, f), out.dtype)} * {pos_slope}) "
+		f"if {x.at(h, f)} > {_literal(node.threshold)} "
+		f"else ({_cast(x.at(h, f), out.dtype)} * {neg_slope})"
+	))
+
+
+def _emit_sigmoid(node, out, args, kwargs):
+	x, = args
+	one = _cast('1', out.dtype)
+	return _elementwise(out, lambda h, f: (
+		f"{one} / ({one} + np.exp(-{_cast(x.at(h, f), out.dtype)}))"
+	))
+
+
+def _emit_tanh(node, out, args, kwargs):
+	x, = args
+	return _elementwise(
+		out, lambda h, f: f"np.tanh({_cast(x.at(h, f), out.dtype)})"
+	)
+
+
+def _emit_if_else(node, out, args, kwargs):
+	cond, if_vals, else_vals = (
+		kwargs['cond_vals'], kwargs['if_vals'], kwargs['else_vals']
+	)
+	return _elementwise(out, lambda h, f: (
+		f"{_cast(if_vals.at(h, f), out.dtype)} "
+		f"if {_comparison(node, cond, h, f)} "
+		f"else {_cast(else_vals.at(h, f), out.dtype)}"
+	))
+
+
+def _emit_additive_combine(node, out, args, kwargs):
+	x = _haplotype_operand(args)
+	return _elementwise(out, lambda h, f: (
+		f"{_cast(x.at('0', f), out.dtype)} + {_cast(x.at('1', f), out.dtype)}"
+	))
+
+
+def _emit_max_combine(node, out, args, kwargs):
+	x = _haplotype_operand(args)
+	return _elementwise(out, lambda h, f: (
+		f"_maximum({_cast(x.at('0', f), out.dtype)}, "
+		f"{_cast(x.at('1', f), out.dtype)})"
+	))
+
+
+def _emit_min_combine(node, out, args, kwargs):
+	x = _haplotype_operand(args)
+	return _elementwise(out, lambda h, f: (
+		f"_minimum({_cast(x.at('0', f), out.dtype)}, "
+		f"{_cast(x.at('1', f), out.dtype)})"
+	))
+
+
+def _emit_mean_combine(node, out, args, kwargs):
+	x = _haplotype_operand(args)
+	return _elementwise(out, lambda h, f: (
+		f"({_cast(x.at('0', f), out.dtype)} + "
+		f"{_cast(x.at('1', f), out.dtype)}) / {_cast('2', out.dtype)}"
+	))
+
+
+def _emit_sum_reduce(node, out, args, kwargs):
+	x, = args
+	return _reduce(
+		out, x,
+		lambda val: _cast(val, out.dtype),
+		lambda acc, val: f"{acc} + {_cast(val, out.dtype)}"
+	)
+
+
+def _emit_product_reduce(node, out, args, kwargs):
+	x, = args
+	return _reduce(
+		out, x,
+		lambda val: _cast(val, out.dtype),
+		lambda acc, val: f"{acc} * {_cast(val, out.dtype)}"
+	)
+
+
+def _emit_min_reduce(node, out, args, kwargs):
+	x, = args
+	return _reduce(
+		out, x,
+		lambda val: _cast(val, out.dtype),
+		lambda acc, val: f"_minimum({acc}, {_cast(val, out.dtype)})"
+	)
+
+
+def _emit_max_reduce(node, out, args, kwargs):
+	x, = args
+	return _reduce(
+		out, x,
+		lambda val: _cast(val, out.dtype),
+		lambda acc, val: f"_maximum({acc}, {_cast(val, out.dtype)})"
+	)
+
+
+def _emit_mean_reduce(node, out, args, kwargs):
+	x, = args
+	return _reduce(
+		out, x,
+		lambda val: _cast(val, out.dtype),
+		lambda acc, val: f"{acc} + {_cast(val, out.dtype)}",
+		lambda acc: f"{acc} / {_cast(x.n_feats, out.dtype)}"
+	)
+
+
+def _emit_any_reduce(node, out, args, kwargs):
+	x, = args
+	one, zero = _cast('1', out.dtype), _cast('0', out.dtype)
+	op = _COMPARISON_OPS.get(node.comparison)
+	if op is None:
+		raise _Unsupported()
+	threshold = _literal(node.threshold)
+	return _reduce(
+		out, x,
+		lambda val: f"{one} if {val} {op} {threshold} else {zero}",
+		lambda acc, val: f"{one} if {val} {op} {threshold} else {acc}"
+	)
+
+
+def _emit_all_reduce(node, out, args, kwargs):
+	x, = args
+	one, zero = _cast('1', out.dtype), _cast('0', out.dtype)
+	op = _COMPARISON_OPS.get(node.comparison)
+	if op is None:
+		raise _Unsupported()
+	threshold = _literal(node.threshold)
+	return _reduce(
+		out, x,
+		lambda val: f"{one} if {val} {op} {threshold} else {zero}",
+		lambda acc, val: f"{acc} if {val} {op} {threshold} else {zero}"
+	)
+
+
+def _emit_concatenate(node, out, args, kwargs):
+	lines = []
+	row = 0
+	for x in args:
+		lines.extend([
+			f"for h in range({out.n_haps}):",
+			f"\tfor f in range({x.n_feats}):",
+			"\t\tfor j in range(nb):",
+			f"\t\t\t{out.at('h', f'{row} + f')} = "
+			f"{_cast(x.at('h', 'f'), out.dtype)}",
+		])
+		row += x.n_feats
+	return lines
+
+
+# Kernel source emitters by node class. An emitter is called as
+# emitter(node, out, args, kwargs) with _Operand values, and returns the
+# kernel lines computing the node's values for a block of nb samples.
+_EMITTERS = {
+	Identity: _emit_identity,
+	Sum: _emit_sum,
+	Product: _emit_product,
+	Clip: _emit_clip,
+	ReLU: _emit_relu,
+	Sigmoid: _emit_sigmoid,
+	Tanh: _emit_tanh,
+	IfElse: _emit_if_else,
+	AdditiveCombine: _emit_additive_combine,
+	MaxCombine: _emit_max_combine,
+	MinCombine: _emit_min_combine,
+	MeanCombine: _emit_mean_combine,
+	SumReduce: _emit_sum_reduce,
+	ProductReduce: _emit_product_reduce,
+	MinReduce: _emit_min_reduce,
+	MaxReduce: _emit_max_reduce,
+	MeanReduce: _emit_mean_reduce,
+	AnyReduce: _emit_any_reduce,
+	AllReduce: _emit_all_reduce,
+	Concatenate: _emit_concatenate,
+}
+
+
+def _get_emitter(node: AbstractBaseFunctionNode):
+	""" Returns the kernel emitter of a node, or None if it has none.
+	Subclasses do not use their parent's emitter, as they may override
+	run().
+	"""
+	if isinstance(node, (MeanCombine, MeanReduce)):
+		if node.mean_type != 'arithmetic':
+			return None
+	return _EMITTERS.get(type(node))
+
+
+def _load_kernel(source: str):
+	""" Returns the compiled kernel of the source, writing it to the
+	codegen cache directory and importing it if it is not loaded yet.
+	"""
+	key = make_key('fused_kernel', source)
+	if key in _kernels:
+		return _kernels[key]
+
+	codegen_dir = os.path.join(
+		os.path.expanduser(
+			os.environ.get('CITRUS_CACHE_DIR', DEFAULT_CACHE_DIR)
+		),
+		'codegen'
+	)
+	file_path = os.path.join(codegen_dir, f"{key}.py")
+
+	if not os.path.exists(file_path):
+		os.makedirs(codegen_dir, exist_ok=True)
+		fd, tmp_path = tempfile.mkstemp(dir=codegen_dir, suffix='.tmp')
+		with os.fdopen(fd, 'w') as f:
+			f.write(source)
+		os.replace(tmp_path, file_path)
+
+	spec = importlib.util.spec_from_file_location(
+		f"citrus_kernel_{key}", file_path
+	)
+	module = importlib.util.module_from_spec(spec)
+	# Numba imports the module by name when loading cached kernels
+	sys.modules[spec.name] = module
+	spec.loader.exec_module(module)
+
+	_kernels[key] = module.kernel
+	return module.kernel
+
+
+def _value_shape(vals) -> tuple:
+	""" Returns the shape of Values or PackedValues, or of each
+	haplotype's array of HaplotypeValues.
+	"""
+	if isinstance(vals, tuple):
+		return tuple(vals[0].shape)
+	return tuple(vals.shape)
+
+
+def _value_info(vals, n_samples: int) -> _ValueInfo:
+	""" Returns the _ValueInfo of a step's values for a block of
+	n_samples, or None if they are not Values or HaplotypeValues arrays
+	with the sample axis last.
+	"""
+	if isinstance(vals, tuple):
+		if (
+			len(vals) != 2
+			or not all(isinstance(v, np.ndarray) for v in vals)
+			or vals[0].shape != vals[1].shape
+			or vals[0].dtype != vals[1].dtype
+		):
+			return None
+		haplotype, arr = True, vals[0]
+	elif isinstance(vals, np.ndarray):
+		haplotype, arr = False, vals
+	else:
+		return None
+
+	if arr.ndim not in (1, 2) or arr.shape[-1] != n_samples:
+		return None
+
+	return _ValueInfo(
+		haplotype, arr.ndim, arr.shape[0] if arr.ndim == 2 else 1, arr.dtype
+	)
+
+
+def _select_block(vals, start: int, stop: int):
+	""" Returns samples start to stop of Values, HaplotypeValues, or
+	PackedValues, as views.
+	"""
+	if isinstance(vals, PackedValues):
+		return PackedValues(
+			vals.bits[..., start:stop], vals.n_feats, vals.is_vector
+		)
+	if isinstance(vals, tuple) and not isinstance(vals, StackedHaplotypes):
+		return tuple(_select_block(v, start, stop) for v in vals)
+	return select_samples(vals, slice(start, stop))
+
+
+def _as_3d(vals) -> np.ndarray:
+	""" Returns Values or HaplotypeValues as an (n_haps, n_feats,
+	n_samples) array, as a view where possible.
+	"""
+	if isinstance(vals, tuple):
+		arr = stack_haplotypes(vals)
+	elif isinstance(vals, np.ndarray):
+		arr = vals[None]
+	else:
+		raise _Unsupported()
+
+	if arr.ndim == 2:
+		return arr[:, None, :]
+	if arr.ndim != 3:
+		raise _Unsupported()
+	return arr
+
+
+def _from_3d(arr: np.ndarray, info: _ValueInfo):
+	""" Returns an (n_haps, n_feats, n_samples) array as the Values or
+	HaplotypeValues described by info.
+	"""
+	if info.ndim == 1:
+		arr = arr[:, 0]
+	if info.haplotype:
+		return StackedHaplotypes(arr)
+	return arr[0]
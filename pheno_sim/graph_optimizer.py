@@ -0,0 +1,190 @@
+""" Optimization passes over the simulation steps of a PhenoSimulation.
+
+optimize_graph is run by ExecutionPlan (unless it is built with
+optimize=False) on the topologically ordered function nodes. It does not
+modify the nodes, but returns a GraphOptimization describing how the plan
+runs them. All passes keep the simulated values bit-for-bit the same as
+running every step as given:
+
+	1. Identity elimination: steps that take input from an Identity node
+		use the Identity's input value instead. Identity nodes are only
+		run if their own values are returned.
+	2. Common subexpression elimination: steps of the same class, with the
+		same parameters and the same inputs, compute the same values, so
+		only the first is run and the values of the others are shared with
+		it. Nodes that use random numbers are never merged.
+	3. Lazy broadcasting and constant folding: nodes with broadcast_constant
+		set (Constant and RandomConstant) output values that only vary
+		along the feature axis. They are computed in compact form, with
+		size 1 axes in place of broadcast axes (e.g. (n_feats, 1) instead of
+		(n_feats, n_samples)). Steps with constant_foldable set whose
+		inputs are all compact are run on the compact values, so subgraphs
+		that only depend on constants are folded to n_feats sized arrays.
+		Compact values are broadcast to their full shape (as views, without
+		copying) only when used by another step or returned.
+
+Example:
+	optimization = optimize_graph(steps, dependencies, outputs=['phenotype'])
+	optimization.replaced_aliases	# e.g. {'beta_copy': 'beta'}
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+from pheno_sim.base_nodes import AbstractBaseFunctionNode
+from pheno_sim.func_nodes import Identity
+
+
+class GraphOptimization:
+	""" How an ExecutionPlan runs optimized simulation steps.
+
+	Attributes:
+		steps: List of the function nodes to run, in the order given to
+			optimize_graph.
+		replaced_aliases: Dict mapping aliases of function nodes whose
+			values steps do not take as input (Identity nodes and
+			duplicates) to the alias of the value used in their place.
+		shared_aliases: Dict mapping aliases of duplicate function nodes
+			that are not run, but whose values are returned, to the alias
+			of the step whose values they share.
+		compact_aliases: Set of the aliases of the steps computed in
+			compact form.
+	"""
+
+	def __init__(
+		self,
+		steps: List[AbstractBaseFunctionNode],
+		replaced_aliases: Dict[str, str],
+		shared_aliases: Dict[str, str],
+		compact_aliases: set
+	):
+		self.steps = steps
+		self.replaced_aliases = replaced_aliases
+		self.shared_aliases = shared_aliases
+		self.compact_aliases = compact_aliases
+
+
+def optimize_graph(
+	simulation_steps: List[AbstractBaseFunctionNode],
+	dependencies: Dict[str, List[str]],
+	outputs: List[str] = None
+) -> GraphOptimization:
+	""" Runs the optimization passes over the simulation steps.
+
+	Args:
+		simulation_steps: List of function nodes, ordered so each node
+			comes after the nodes it takes input from.
+		dependencies: Dict mapping each function node alias to the list of
+			aliases it takes as input (see ExecutionPlan.get_input_aliases).
+		outputs (default None): Aliases of the values that are returned.
+			If None, the values of all function nodes are returned.
+
+	Returns:
+		A GraphOptimization.
+	"""
+	def is_returned(alias):
+		return outputs is None or alias in outputs
+
+	replaced = dict()
+	shared = dict()
+	steps = []
+	step_keys = dict()	# structural key -> alias of the step computing it
+
+	for node in simulation_steps:
+		input_aliases = [
+			replaced.get(alias, alias) for alias in dependencies[node.alias]
+		]
+
+		if isinstance(node, Identity) and len(input_aliases) == 1:
+			replaced[node.alias] = input_aliases[0]
+			if is_returned(node.alias):
+				steps.append(node)
+			continue
+
+		if not node.uses_random:
+			key = _node_key(node, replaced)
+			if key is not None:
+				if key in step_keys:
+					replaced[node.alias] = step_keys[key]
+					if is_returned(node.alias):
+						shared[node.alias] = step_keys[key]
+					continue
+				step_keys[key] = node.alias
+
+		steps.append(node)
+
+	compact = set()
+	for node in steps:
+		input_aliases = [
+			replaced.get(alias, alias) for alias in dependencies[node.alias]
+		]
+		if node.broadcast_constant or (
+			node.constant_foldable
+			and len(input_aliases) > 0
+			and all(alias in compact for alias in input_aliases)
+		):
+			compact.add(node.alias)
+
+	return GraphOptimization(steps, replaced, shared, compact)
+
+
+def _node_key(node: AbstractBaseFunctionNode, replaced: Dict[str, str]):
+	""" Returns a hashable key that is the same for function nodes that
+	compute the same values, or None if the node's parameters cannot be
+	compared.
+	"""
+	params = {
+		name: value for name, value in vars(node).items()
+		if name not in ('alias', 'inputs')
+	}
+
+	try:
+		return (
+			type(node),
+			_freeze_inputs(node.inputs, replaced),
+			_freeze(params)
+		)
+	except TypeError:
+		return None
+
+
+def _freeze_inputs(inputs, replaced: Dict[str, str]):
+	""" Returns a node's inputs attribute as a hashable value, with input
+	aliases replaced by the aliases used in their place.
+	"""
+	if inputs is None:
+		return None
+	if isinstance(inputs, str):
+		return replaced.get(inputs, inputs)
+	if isinstance(inputs, list):
+		return tuple(_freeze_inputs(alias, replaced) for alias in inputs)
+	if isinstance(inputs, dict):
+		return tuple(sorted(
+			(name, _freeze_inputs(alias, replaced))
+			for name, alias in inputs.items()
+		))
+	raise TypeError(f"Unsupported node inputs: {inputs!r}")
+
+
+def _freeze(value):
+	""" Returns a hashable representation of a node parameter value. Values
+	compare equal only if they have the same type and contents (so 1 and
+	1.0 differ). Objects that are not hashable are compared by identity.
+	"""
+	if isinstance(value, np.ndarray):
+		return (np.ndarray, value.dtype.str, value.shape, value.tobytes())
+	if isinstance(value, (list, tuple)):
+		return (type(value), tuple(_freeze(v) for v in value))
+	if isinstance(value, dict):
+		return (dict, tuple(sorted(
+			(_freeze(k), _freeze(v)) for k, v in value.items()
+		)))
+	if isinstance(value, (set, frozenset)):
+		return (type(value), frozenset(_freeze(v) for v in value))
+
+	try:
+		hash(value)
+	except TypeError:
+		return ('id', id(value))
+	return (type(value), value)
@@ -3,8 +3,6 @@ Estimates broad-sense (H^2) and narrow-sense (h^2) heritability
 for a given phenotype simulation.
 """
 
-import copy
-
 import numpy as np
 import pandas as pd
 import scipy.stats as stats
@@ -12,6 +10,8 @@ from sklearn import linear_model
 from sklearn import model_selection
 from tqdm.autonotebook import tqdm, trange
 
+from pheno_sim.data_types import ReadOnlyValuesDict, select_samples
+
 
 def sample_vals_dict(vals_dict, n_samples=1.0):
 	"""Subsample individuals in vals dict.
@@ -27,9 +27,11 @@ def sample_vals_dict(vals_dict, n_samples=1.0):
 			equal to 1, will use that fraction of samples. If value is
 			greater than 1, will use that number of samples. Samples
 			will be randomly selected from the input samples.
+
+	Returns:
+		ReadOnlyValuesDict of the selected samples' values. Input values
+		are not copied unless samples are selected.
 	"""
-	vals_dict = copy.deepcopy(vals_dict)
-	
 	# Get number of sample in input.
 	input_item = vals_dict[list(vals_dict.keys())[0]]
 	if isinstance(input_item, tuple):
@@ -44,30 +46,20 @@ def sample_vals_dict(vals_dict, n_samples=1.0):
 			n_samples,
 			replace=False
 		)
-		
-		for key, val in vals_dict.items():
-			if isinstance(val, tuple):
-				vals_dict[key] = (
-					val[0][..., selected_idx], val[1][..., selected_idx]
-				)
-			else:
-				vals_dict[key] = val[..., selected_idx]
 	elif n_samples < 1:
 		selected_idx = np.random.choice(
 			n_input_samples,
 			int(n_samples * n_input_samples),
 			replace=False
 		)
-		
-		for key, val in vals_dict.items():
-			if isinstance(val, tuple):
-				vals_dict[key] = (
-					val[0][..., selected_idx], val[1][..., selected_idx]
-				)
-			else:
-				vals_dict[key] = val[..., selected_idx]
+	else:
+		# Values are read-only, so they are shared instead of copied
+		return ReadOnlyValuesDict(vals_dict)
 
-	return vals_dict
+	return ReadOnlyValuesDict({
+		key: select_samples(val, selected_idx)
+		for key, val in vals_dict.items()
+	})
 
 
 def sum_dataframe_haplotypes(vals_df):
@@ -199,17 +191,16 @@ def narrow_sense_heritability(
 		# Subsample individuals if n_samples is not 1
 		iter_input_vals = sample_vals_dict(input_vals, n_samples)
 
-		# Simulate phenotypes to create labels, tracking genotype
-		pheno_vals = []
-		geno_idx = []
-
-		for i in range(n_pheno_per_geno):
-			gen_phenos = sim.run_simulation_steps(
-				copy.deepcopy(iter_input_vals)
-			)[phenotype_alias]
+		# Simulate phenotypes to create labels, tracking genotype. All
+		# n_pheno_per_geno replicates are simulated as one batch.
+		gen_phenos = sim.run_simulation_steps(
+			iter_input_vals.copy(),
+			outputs=[phenotype_alias],
+			n_replicates=n_pheno_per_geno
+		)[phenotype_alias]
 
-			pheno_vals.extend(gen_phenos)
-			geno_idx.extend(list(range(len(gen_phenos))))
+		pheno_vals = gen_phenos.ravel()
+		geno_idx = np.tile(np.arange(gen_phenos.shape[-1]), n_pheno_per_geno)
 
 		# Convert input values to a dataframe and stack to match n_pheno_per_geno
 		input_df = sim.vals_dict_to_dataframe(iter_input_vals)
@@ -313,18 +304,13 @@ def broad_sense_heritability(
 		# Subsample individuals if n_samples is not 1
 		iter_input_vals = sample_vals_dict(input_vals, n_samples)
 
-		# Step 1: Simulate for each genotype n_pheno_per_geno times
-		pheno_vals = []
-
-		for i in range(n_pheno_per_geno):
-			pheno_vals.append(
-				sim.run_simulation_steps(
-					copy.deepcopy(iter_input_vals)
-				)[phenotype_alias]
-			)
-
-		# Convert to matrix where columns are samples and rows are replicates
-		pheno_vals = np.vstack(pheno_vals).astype(float)
+		# Step 1: Simulate for each genotype n_pheno_per_geno times, as one
+		# batch. Matrix where columns are samples and rows are replicates.
+		pheno_vals = sim.run_simulation_steps(
+			iter_input_vals.copy(),
+			outputs=[phenotype_alias],
+			n_replicates=n_pheno_per_geno
+		)[phenotype_alias].astype(float)
 
 		# Step 2: Compute total variance
 		total_var = np.var(pheno_vals)
@@ -1,3 +1,14 @@
 from .base_input_source import BaseInputSource
-from .hail_input import HailInputSource
-from .input_runner import InputRunner
\ No newline at end of file
+from .native_input import NativeInputSource
+from .plink_input import PlinkInputSource
+from .bgen_input import BGENInputSource
+from .input_runner import InputRunner
+
+
+def __getattr__(name):
+	# Hail is only imported when the hail engine is used, so the other
+	# engines work without Hail or a JVM installed.
+	if name == 'HailInputSource':
+		from .hail_input import HailInputSource
+		return HailInputSource
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,8 +3,17 @@ which will be used to create input nodes for the simulation.
 """
 
 from abc import ABC, abstractmethod
+import os
 
 import numpy as np
+import pandas as pd
+
+from pheno_sim.data_types import (
+	DTypePolicy, PackedValues, StackedHaplotypes, stack_haplotypes
+)
+from pheno_sim.disk_cache import file_identity, make_key
+from pheno_sim.input_nodes.input_node_types import BaseInputNode
+from pheno_sim.input_nodes.tabix_reader import find_index_file
 
 
 class BaseInputSource(ABC):
@@ -12,8 +21,10 @@ class BaseInputSource(ABC):
 	which will be used to create input nodes for the simulation.
 	
 	The class implements two main functions:
-		- load_inputs(): Loads the input data from the source file and sets
-			the input_nodes and input_sample_ids attributes.
+		- load_inputs(cache, input_aliases): Loads the input data from the
+			source file (or the cache) and sets the input_sample_ids
+			attribute. Engines implement load_haplotypes(required_loci),
+			typically using gt_codes_to_haplotypes().
 		- subset_and_order_samples(sample_ids): Subsets data in input_nodes
 			and input_sample_ids to just the sample ids in sample_ids and in
 			the same order as sample_ids. Used to get corresponding sample ids
@@ -29,30 +40,363 @@ class BaseInputSource(ABC):
 			reproducibility.
 		input_nodes: A list of input nodes that use the input source.
 		input_sample_ids: A list of sample ids from the input source.
+		dtype_policy: DTypePolicy whose genotype dtype input node
+			haplotype values are returned as.
 		
 	Methods:
-		load_inputs(): Loads the input data from the source file and sets
-			the input_nodes and input_sample_ids attributes.
+		load_inputs(cache, input_aliases): Loads the input data from the
+			source file (or the cache) and sets the input_sample_ids
+			attribute.
+		load_haplotypes(required_loci): Loads haplotype values for the
+			required loci. Implemented by each engine.
+		get_source_files(): Returns the local files read by the source.
+		get_cache_key(required_loci): Returns the input cache key of the
+			source's extracted haplotype values.
 		subset_and_order_samples(sample_ids): Subsets data in input_nodes
 			and input_sample_ids to just the sample ids in sample_ids and in
 			the same order as sample_ids. Used to get corresponding sample ids
 			and data from multiple input sources.
 		get_input_source(input_config): Returns the appropriate input source
 			class based on the dict from the input config.
+		get_input_nodes(input_aliases): Returns the input nodes with the
+			given aliases.
+		get_required_loci(input_nodes): Returns the unique loci required by
+			the input nodes.
+		get_input_node_vals(hap_vals, required_loci, input_nodes): Returns
+			the values of input nodes from haplotype values of all required
+			loci.
+		gt_codes_to_haplotypes(locus_gt_codes, required_loci): Builds
+			haplotype values from per-locus GT codes.
+		set_unphased_het_defaults(): Sets defaults for the 'unphased_het'
+			input config keys of engines that read unphased calls.
+		assign_unphased_hets(gt_codes, unphased_het): Assigns the alternate
+			allele of unphased heterozygous calls to a haplotype.
 	"""
 	
-	def __init__(self, input_config):
+	# Whether loading inputs uses a JVM (e.g. Hail). Such sources are loaded
+	# concurrently in threads sharing one JVM instead of in processes.
+	requires_jvm = False
+
+	def __init__(self, input_config, dtype_policy=None):
 		self.input_config = input_config
-		self.input_nodes = None
 		self.input_sample_ids = None
+		self.dtype_policy = DTypePolicy.from_config(dtype_policy)
+
+		# Create input nodes
+		self.input_nodes = [
+			BaseInputNode.create_input_node(input_node_config)
+			for input_node_config in self.input_config.get('input_nodes', [])
+		]
 	
+	def load_inputs(self, cache=None, input_aliases=None):
+		""" Loads the input data from the source file and sets the
+		input_sample_ids attribute.
+
+		If cache is given, haplotype values and sample ids previously
+		extracted for the same source files, required loci, and input
+		config are loaded from the cache instead of the source files.
+
+		Args:
+			cache (default None): DiskCache to read extracted haplotype
+				values from and write them to. If None, no cache is used.
+			input_aliases (default None): Aliases of the input nodes to
+				load values for. Loci only used by other input nodes are
+				not read. If None, all input nodes are loaded. Sample ids
+				are always loaded.
+
+		Returns:
+			Dict mapping input node aliases to their values.
+		"""
+		input_nodes = self.get_input_nodes(input_aliases)
+		required_loci = self.get_required_loci(input_nodes)
+		cache_key = None if cache is None else self.get_cache_key(
+			required_loci
+		)
+
+		cached = None if cache_key is None else cache.get(cache_key)
+
+		if cached is not None:
+			arrays, cached_config = cached
+			stacked_haps = arrays['haps']
+			self.input_sample_ids = arrays['sample_ids']
+
+			# Restore config defaults set when the values were extracted
+			self.input_config.update(cached_config)
+		else:
+			# Both haplotypes are kept in one (2, n_loci, n_samples) array,
+			# so input node values are views that stack without copying
+			stacked_haps = np.stack(self.load_haplotypes(required_loci))
+
+			if cache_key is not None:
+				cache.put(
+					cache_key,
+					{
+						'haps': stacked_haps,
+						'sample_ids': np.asarray(
+							self.input_sample_ids, dtype=str
+						),
+					},
+					metadata={
+						k: v for k, v in self.input_config.items()
+						if k != 'input_nodes'
+					}
+				)
+
+		stacked_haps = stacked_haps.astype(
+			self.dtype_policy.genotype, copy=False
+		)
+		hap_vals = StackedHaplotypes(stacked_haps)
+
+		return self.get_input_node_vals(hap_vals, required_loci, input_nodes)
+
 	@abstractmethod
-	def load_inputs(self):
-		""" Loads the input data from the source file and sets the input_nodes
-		and input_sample_ids attributes.
+	def load_haplotypes(self, required_loci):
+		""" Loads haplotype values for the required loci from the source
+		file and sets the input_sample_ids attribute.
+
+		Args:
+			required_loci: List of unique (chromosome (str), position (int))
+				tuples (see get_required_loci).
+
+		Returns:
+			HaplotypeValues tuple of (n_loci, n_samples) arrays with rows
+			in the order of required_loci.
 		"""
 		pass
+
+	def get_source_files(self):
+		""" Returns the paths of the local files the input source reads
+		(data files and their indexes), or None if the source does not
+		only read local files (e.g. hadoop glob patterns).
+
+		Used to identify the input data for caching. Engines reading files
+		other than 'file' extend this.
+		"""
+		files = self.input_config.get('file')
+		if isinstance(files, str):
+			files = [files]
+		if not files or not all(os.path.isfile(f) for f in files):
+			return None
+
+		index_files = [find_index_file(f) for f in files]
+
+		return files + [f for f in index_files if f is not None]
+
+	def get_cache_key(self, required_loci):
+		""" Returns the key of the input source's extracted haplotype values
+		in the input cache, or None if they should not be cached.
+
+		The key is made from the identity (path, size, and modification
+		time) of the source files, the required loci, the input config
+		(except for input nodes), and the input source class.
+
+		Values are not cached when the source files are not all local, or
+		when unphased heterozygous calls are assigned randomly without a
+		seed.
+		"""
+		if (
+			self.input_config.get('unphased_het') == 'random'
+			and 'unphased_het_seed' not in self.input_config
+		):
+			return None
+
+		source_files = self.get_source_files()
+		if source_files is None:
+			return None
+
+		file_ids = [file_identity(f) for f in source_files]
+		if None in file_ids:
+			return None
+
+		return make_key(
+			'input_haplotypes',
+			type(self).__name__,
+			file_ids,
+			required_loci,
+			{k: v for k, v in self.input_config.items() if k != 'input_nodes'}
+		)
+
+	def get_input_nodes(self, input_aliases=None):
+		""" Returns the input nodes with aliases in input_aliases, or all
+		input nodes if input_aliases is None.
+		"""
+		if input_aliases is None:
+			return self.input_nodes
+
+		input_aliases = set(input_aliases)
+		return [
+			input_node for input_node in self.input_nodes
+			if input_node.alias in input_aliases
+		]
+
+	def get_required_loci(self, input_nodes=None):
+		""" Returns the unique loci required by the input nodes.
+
+		Loci are kept in the order they are first required so that each
+		node's rows are contiguous where possible.
+
+		Args:
+			input_nodes (default None): Input nodes to get the loci of. If
+				None, all input nodes of the source are used.
+
+		Returns:
+			List of (chromosome (str), position (int)) tuples.
+		"""
+		if input_nodes is None:
+			input_nodes = self.input_nodes
+
+		return list(dict.fromkeys(
+			locus
+			for input_node in input_nodes
+			for locus in input_node.get_required_loci()
+		))
+
+	def get_input_node_vals(self, hap_vals, required_loci, input_nodes=None):
+		""" Returns the values of every input node from the haplotype values
+		extracted for all required loci.
+
+		Args:
+			hap_vals: HaplotypeValues tuple of (n_loci, n_samples) arrays
+				with rows in the order of required_loci.
+			required_loci: List of unique (chromosome (str), position (int))
+				tuples (see get_required_loci).
+			input_nodes (default None): Input nodes to get the values of.
+				If None, all input nodes of the source are used.
+
+		If the 'bit_packed' input config key is True, each node's
+		haplotype values are bit-packed (see PackedValues).
+
+		Returns:
+			Dict mapping input node aliases to their values.
+		"""
+		if input_nodes is None:
+			input_nodes = self.input_nodes
+
+		locus_index = {locus: i for i, locus in enumerate(required_loci)}
+
+		input_node_vals = {
+			input_node.alias: input_node.get_node_values(hap_vals, locus_index)
+			for input_node in input_nodes
+		}
+
+		if self.input_config.get('bit_packed', False):
+			input_node_vals = {
+				alias: tuple(PackedValues.pack(vals) for vals in node_vals)
+				for alias, node_vals in input_node_vals.items()
+			}
+
+		return input_node_vals
+
+	@staticmethod
+	def gt_codes_to_haplotypes(locus_gt_codes, required_loci):
+		""" Builds haplotype values from per-locus GT codes.
+
+		Each call is encoded as a small integer GT code, where bit 0 is set
+		if the first haplotype is non-reference, bit 1 is set if the second
+		haplotype is non-reference, bit 2 is set if the call is unphased,
+		and -1 means the call is missing.
+
+		Checks that every required locus matches exactly one record and
+		that all calls are present and phased.
+
+		Args:
+			locus_gt_codes: Iterable of ((chromosome (str), position (int)),
+				GT codes array with one value per sample) pairs, one per
+				record read from the file.
+			required_loci: List of unique (chromosome (str), position (int))
+				tuples.
+
+		Returns:
+			HaplotypeValues tuple of (n_loci, n_samples) int8 numpy arrays
+			with rows in the order of required_loci.
+		"""
+		# Map each locus to the record(s) it matched
+		locus_rows = dict()
+		for locus, gt_codes in locus_gt_codes:
+			locus_rows.setdefault(locus, []).append(gt_codes)
+
+		for locus in required_loci:
+			row_count = len(locus_rows.get(locus, []))
+			if row_count > 1:
+				raise ValueError(
+					f"{locus[0]}:{locus[1]} has "
+					f"{row_count} rows. Can only have one row."
+				)
+			if row_count == 0:
+				raise ValueError(
+					f"{locus[0]}:{locus[1]} has no rows."
+				)
+
+		if len(required_loci) == 0:
+			return (np.zeros((0, 0), np.int8), np.zeros((0, 0), np.int8))
+
+		gt_codes = np.vstack([locus_rows[locus][0] for locus in required_loci])
+
+		# Assert all calls are present and phased
+		for bad_mask, problem in [
+			(gt_codes < 0, 'missing'), ((gt_codes & 4) > 0, 'unphased')
+		]:
+			bad_rows = np.flatnonzero(bad_mask.any(axis=1))
+			if len(bad_rows) > 0:
+				raise ValueError(
+					f"{len(bad_rows)} loci have {problem} calls, including "
+					f"{required_loci[bad_rows[0]][0]}:"
+					f"{required_loci[bad_rows[0]][1]}."
+				)
+
+		return (
+			(gt_codes & 1).astype(np.int8),
+			((gt_codes >> 1) & 1).astype(np.int8)
+		)
 	
+	def set_unphased_het_defaults(self):
+		""" Sets defaults for the input config keys controlling how unphased
+		heterozygous calls are assigned to haplotypes (see
+		assign_unphased_hets).
+
+		If 'unphased_het' is 'random' and no 'unphased_het_seed' is given,
+		a seed is drawn and added to the input config for reproducibility.
+		"""
+		if 'unphased_het' not in self.input_config:
+			self.input_config['unphased_het'] = 'first'
+
+		if self.input_config['unphased_het'] not in ('first', 'second', 'random'):
+			raise ValueError(
+				"unphased_het must be one of 'first', 'second', or 'random'. "
+				f"Got: {self.input_config['unphased_het']}"
+			)
+		if (
+			self.input_config['unphased_het'] == 'random'
+			and 'unphased_het_seed' not in self.input_config
+		):
+			self.input_config['unphased_het_seed'] = int(
+				np.random.randint(0, 2**31 - 1)
+			)
+
+	def assign_unphased_hets(self, gt_codes, unphased_het):
+		""" Assigns the alternate allele of unphased heterozygous calls to a
+		haplotype (in place) based on the 'unphased_het' input config key:
+
+			- 'first': The first haplotype.
+			- 'second': The second haplotype.
+			- 'random': A random haplotype for each call, using
+				'unphased_het_seed'.
+
+		Args:
+			gt_codes: Array of GT codes (see gt_codes_to_haplotypes).
+			unphased_het: Boolean mask of the same shape as gt_codes that is
+				True for unphased heterozygous calls.
+		"""
+		if self.input_config['unphased_het'] == 'first':
+			gt_codes[unphased_het] = 1
+		elif self.input_config['unphased_het'] == 'second':
+			gt_codes[unphased_het] = 2
+		else:
+			rng = np.random.default_rng(self.input_config['unphased_het_seed'])
+			gt_codes[unphased_het] = rng.integers(
+				1, 3, size=int(unphased_het.sum()), dtype=gt_codes.dtype
+			)
+
 	def subset_and_order_samples(self, sample_ids, input_node_vals):
 		""" Subsets data in input_nodes and input_sample_ids to just the sample
 		ids in sample_ids and in the same order as sample_ids. Used to get
@@ -65,34 +409,57 @@ class BaseInputSource(ABC):
 				dimension of each value should be the same length as
 				self.input_sample_ids with corresponding values.
 
+		Sample ids are matched with a hash based index, and each value is
+		reordered with a single take, so this is linear in the number of
+		samples.
+
 		Returns:
 			dict input_node_vals with the last dimension of each value subset
 			to just the sample ids in sample_ids and in the same order as
 			sample_ids.
 		"""
-		subset_idx = [
-			np.where(self.input_sample_ids == sid)[0][0] for sid in sample_ids
-		]
+		source_ids = pd.Index(self.input_sample_ids)
+		if not source_ids.is_unique:
+			raise ValueError(
+				"Input source has duplicate sample ids, including "
+				f"{source_ids[source_ids.duplicated()][0]}."
+			)
+
+		subset_idx = source_ids.get_indexer(sample_ids)
+
+		missing = np.flatnonzero(subset_idx < 0)
+		if len(missing) > 0:
+			raise ValueError(
+				f"{len(missing)} sample ids are not in the input source, "
+				f"including {sample_ids[missing[0]]}."
+			)
+
+		# Already in the requested order
+		if len(subset_idx) == len(source_ids) and np.array_equal(
+			subset_idx, np.arange(len(subset_idx))
+		):
+			return input_node_vals
 
 		for key in input_node_vals.keys():
-			if isinstance(input_node_vals[key], np.ndarray):
-				if input_node_vals[key].ndim == 1:
-					input_node_vals[key] = input_node_vals[key][subset_idx]
-				else:
-					input_node_vals[key] = input_node_vals[key][:, subset_idx]
+			if isinstance(input_node_vals[key], (np.ndarray, PackedValues)):
+				input_node_vals[key] = np.take(
+					input_node_vals[key], subset_idx, axis=-1
+				)
 			elif isinstance(input_node_vals[key], tuple):
-				original_vals = input_node_vals[key]
-
-				if original_vals[0].ndim == 1:
-					input_node_vals[key] = (
-						original_vals[0][subset_idx],
-						original_vals[1][subset_idx]
+				if any(
+					isinstance(vals, PackedValues)
+					for vals in input_node_vals[key]
+				):
+					# Packed haplotypes cannot be stacked
+					input_node_vals[key] = tuple(
+						np.take(vals, subset_idx, axis=-1)
+						for vals in input_node_vals[key]
 					)
 				else:
-					input_node_vals[key] = (
-						original_vals[0][:, subset_idx],
-						original_vals[1][:, subset_idx]
-					)
+					input_node_vals[key] = StackedHaplotypes(np.take(
+						stack_haplotypes(input_node_vals[key]),
+						subset_idx, axis=-1
+					))
 			else:
 				raise ValueError(
 					'Invalid input node value type: ' + str(type(input_node_vals[key]))
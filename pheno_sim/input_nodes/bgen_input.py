@@ -0,0 +1,407 @@
+""" Input source object for BGEN files.
+
+Reads BGEN (layout 2) files without Hail or a JVM. The .bgi index (as
+written by bgenix) is used to find the file offsets of the required loci,
+so only those variant blocks are read and decompressed.
+
+zlib compressed files are supported out of the box. zstd compressed files
+require the optional zstandard package (pip install zstandard).
+
+Probabilities are converted to hard calls. For phased data, a haplotype
+carries a non-reference allele if the probability of the reference (first)
+allele is below 0.5. For unphased data, the most probable genotype is
+called and the alternate allele of heterozygous calls is assigned to a
+haplotype as set by the 'unphased_het' input config key.
+
+Includes following input nodes types:
+	- SNP (see input_node_types.py)
+
+Combatibile with the following file formats:
+	- bgen (layout 2, with a .bgi index)
+"""
+
+import os
+import sqlite3
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from pheno_sim.input_nodes import BaseInputSource
+
+
+# Max number of positions per SQLite query (below SQLite's variable limit)
+_INDEX_QUERY_BATCH_SIZE = 500
+
+
+class BGENInputSource(BaseInputSource):
+	""" BGEN input source object.
+
+	Attributes:
+		input_config: The dictionary from the input section of the simulation
+			config file that defines this input source. If 'unphased_het'
+			is 'random' and no 'unphased_het_seed' is given, the seed used
+			is added for reproducibility.
+		input_nodes: A list of input nodes that use the input source.
+		input_sample_ids: A list of sample ids from the input source.
+
+	Input config keys:
+		file: Path to the BGEN file.
+		file_format: The file format of the input file. Defaults to 'bgen'.
+			Must be 'bgen'.
+		input_nodes: A list of dictionaries defining the input nodes that use
+			this input source. See input_nodes_README.md for more details.
+		index_file: Path to the .bgi index. Defaults to '{file}.bgi'.
+		sample_file: Path to an Oxford format .sample file with the sample
+			ids. Only used, and then required, if the BGEN file does not
+			contain sample ids. Defaults to the BGEN path with its '.bgen'
+			extension replaced by '.sample'.
+		sample_id_field: Column of the .sample file to use as sample ids.
+			Defaults to 'ID_1'.
+		unphased_het: Which haplotype the alternate allele of unphased
+			heterozygous calls is assigned to. One of 'first', 'second',
+			or 'random' (each call independently). Defaults to 'first'.
+			See BaseInputSource.assign_unphased_hets.
+		unphased_het_seed: Seed for the 'random' unphased_het assignment.
+
+	Methods:
+		__init__(input_config): Constructor (see BaseInputSource).
+		load_inputs(cache, input_aliases): See BaseInputSource.
+		load_haplotypes(required_loci): Loads haplotype values for the
+			required loci from the source file and sets the
+			input_sample_ids attribute.
+		get_source_files(): Returns the paths of the BGEN file, its index,
+			and its .sample file.
+		subset_and_order_samples(sample_ids): See BaseInputSource.
+	"""
+
+	def load_haplotypes(self, required_loci):
+		"""Loads haplotype values for the required loci from the source file
+		and sets the input_sample_ids attribute.
+
+		Args:
+			required_loci: List of unique (chromosome (str), position (int))
+				tuples.
+
+		Returns:
+			HaplotypeValues tuple of (n_loci, n_samples) arrays with rows
+			in the order of required_loci.
+		"""
+		self._set_config_defaults()
+
+		variant_offsets = self.query_index(
+			self.input_config['index_file'], required_loci
+		)
+
+		with open(self.input_config['file'], 'rb') as f:
+			n_samples, compression, sample_ids = self.read_header(f)
+
+			if sample_ids is None:
+				sample_ids = self.read_sample_file(
+					self.input_config['sample_file'],
+					self.input_config['sample_id_field']
+				)
+				if len(sample_ids) != n_samples:
+					raise ValueError(
+						f"{self.input_config['sample_file']} has "
+						f"{len(sample_ids)} samples, but "
+						f"{self.input_config['file']} has {n_samples}."
+					)
+			self.input_sample_ids = np.array(sample_ids)
+
+			locus_gt_codes = []
+			for locus, file_start, size in variant_offsets:
+				f.seek(file_start)
+				gt_codes, unphased_het = self.decode_variant(
+					f.read(size), n_samples, compression
+				)
+				self.assign_unphased_hets(gt_codes, unphased_het)
+				locus_gt_codes.append((locus, gt_codes))
+
+		return self.gt_codes_to_haplotypes(locus_gt_codes, required_loci)
+
+	def _set_config_defaults(self):
+		""" Sets defaults for the optional input config keys. """
+		if 'file_format' not in self.input_config:
+			self.input_config['file_format'] = 'bgen'
+		if self.input_config['file_format'].lower() != 'bgen':
+			raise ValueError(
+				'Invalid file format for bgen engine: {}'.format(
+					self.input_config['file_format']
+				)
+			)
+
+		if 'index_file' not in self.input_config:
+			self.input_config['index_file'] = self._default_index_file()
+		if 'sample_file' not in self.input_config:
+			self.input_config['sample_file'] = self._default_sample_file()
+		if 'sample_id_field' not in self.input_config:
+			self.input_config['sample_id_field'] = 'ID_1'
+
+		self.set_unphased_het_defaults()
+
+	def _default_index_file(self):
+		return self.input_config['file'] + '.bgi'
+
+	def _default_sample_file(self):
+		root, ext = os.path.splitext(self.input_config['file'])
+		return (
+			root if ext.lower() == '.bgen' else self.input_config['file']
+		) + '.sample'
+
+	def get_source_files(self):
+		""" Returns the paths of the BGEN file, its index, and its .sample
+		file (if it exists). See BaseInputSource.get_source_files.
+		"""
+		sample_file = self.input_config.get(
+			'sample_file', self._default_sample_file()
+		)
+
+		return [
+			self.input_config['file'],
+			self.input_config.get('index_file', self._default_index_file()),
+		] + ([sample_file] if os.path.exists(sample_file) else [])
+
+	@staticmethod
+	def query_index(index_path, required_loci):
+		""" Looks up the file offsets of the variants at the required loci
+		in a .bgi index.
+
+		Args:
+			index_path: Path to the .bgi index.
+			required_loci: List of (chromosome (str), position (int)) tuples.
+
+		Returns:
+			List of ((chromosome, position), file start position, size in
+			bytes) tuples sorted by file start position. Loci with multiple
+			variants appear multiple times.
+		"""
+		if not os.path.exists(index_path):
+			raise ValueError(f"BGEN index not found: {index_path}")
+
+		positions_by_chrom = dict()
+		for chrom, pos in required_loci:
+			positions_by_chrom.setdefault(chrom, []).append(pos)
+
+		variant_offsets = []
+		conn = sqlite3.connect(f'file:{index_path}?mode=ro', uri=True)
+		try:
+			for chrom, positions in positions_by_chrom.items():
+				for i in range(0, len(positions), _INDEX_QUERY_BATCH_SIZE):
+					batch = positions[i:i + _INDEX_QUERY_BATCH_SIZE]
+					rows = conn.execute(
+						'SELECT position, file_start_position, size_in_bytes '
+						'FROM Variant WHERE chromosome = ? AND position IN '
+						f"({', '.join('?' * len(batch))})",
+						[chrom, *batch]
+					)
+					variant_offsets.extend(
+						((chrom, pos), file_start, size)
+						for pos, file_start, size in rows
+					)
+		finally:
+			conn.close()
+
+		return sorted(variant_offsets, key=lambda x: x[1])
+
+	@staticmethod
+	def read_header(f):
+		""" Reads the header block and sample identifier block of a BGEN.
+
+		Args:
+			f: BGEN file opened in binary mode.
+
+		Returns:
+			Tuple of:
+				- Number of samples.
+				- Compression type (0: none, 1: zlib, 2: zstd).
+				- List of sample ids, or None if the file has none.
+		"""
+		f.seek(0)
+		_, header_length, _, n_samples, magic = struct.unpack(
+			'<IIII4s', f.read(20)
+		)
+		if magic not in (b'bgen', b'\x00\x00\x00\x00'):
+			raise ValueError("File is not a BGEN file.")
+
+		f.seek(4 + header_length - 4)
+		flags, = struct.unpack('<I', f.read(4))
+
+		compression = flags & 3
+		layout = (flags >> 2) & 15
+		if layout != 2:
+			raise ValueError(
+				f"BGEN layout {layout} is not supported. Only layout 2 is."
+			)
+
+		sample_ids = None
+		if flags >> 31:
+			_, n_ids = struct.unpack('<II', f.read(8))
+			sample_ids = []
+			for _ in range(n_ids):
+				id_length, = struct.unpack('<H', f.read(2))
+				sample_ids.append(f.read(id_length).decode())
+
+		return n_samples, compression, sample_ids
+
+	@staticmethod
+	def read_sample_file(sample_path, sample_id_field='ID_1'):
+		""" Reads sample ids from an Oxford format .sample file. """
+		sample_table = pd.read_csv(
+			sample_path, sep=r'\s+', dtype=str, keep_default_na=False,
+			skiprows=[1]
+		)
+		if sample_id_field not in sample_table.columns:
+			raise ValueError(
+				f"sample_id_field '{sample_id_field}' not in columns of "
+				f"{sample_path}: {list(sample_table.columns)}."
+			)
+		return sample_table[sample_id_field].tolist()
+
+	@staticmethod
+	def decode_variant(variant_block, n_samples, compression):
+		""" Decodes a layout 2 variant data block into GT codes.
+
+		Args:
+			variant_block: Bytes of the variant data block (identifying data
+				and genotype data).
+			n_samples: Number of samples in the BGEN.
+			compression: Compression type from the BGEN header.
+
+		Returns:
+			Tuple of:
+				- int8 array of GT codes (see
+					BaseInputSource.gt_codes_to_haplotypes) for the samples.
+					Unphased heterozygous calls must be assigned.
+				- Boolean mask of unphased heterozygous calls.
+		"""
+		# Skip variant identifying data
+		pos = 0
+		for _ in range(3):	# Variant id, rsid, chromosome
+			field_length, = struct.unpack_from('<H', variant_block, pos)
+			pos += 2 + field_length
+		pos += 4	# Position
+		n_alleles, = struct.unpack_from('<H', variant_block, pos)
+		pos += 2
+		for _ in range(n_alleles):
+			allele_length, = struct.unpack_from('<I', variant_block, pos)
+			pos += 4 + allele_length
+
+		# Decompress genotype data
+		data_length, = struct.unpack_from('<I', variant_block, pos)
+		pos += 4
+		if compression == 0:
+			data = variant_block[pos:pos + data_length]
+		else:
+			uncompressed_length, = struct.unpack_from('<I', variant_block, pos)
+			compressed = variant_block[pos + 4:pos + data_length]
+			data = _decompress(compressed, compression, uncompressed_length)
+
+		# Parse probability data header
+		n, n_alleles, _, max_ploidy = struct.unpack_from('<IHBB', data, 0)
+		if n != n_samples:
+			raise ValueError(
+				f"Variant has {n} samples, but BGEN has {n_samples}."
+			)
+		ploidy_missing = np.frombuffer(data, dtype=np.uint8, count=n, offset=8)
+		phased, n_bits = struct.unpack_from('<BB', data, 8 + n)
+
+		missing = (ploidy_missing & 0x80) > 0
+		if max_ploidy != 2 or np.any((ploidy_missing & 0x3f) != 2):
+			raise ValueError(
+				"Only diploid calls are supported in BGEN files."
+			)
+
+		# Values stored per sample
+		if phased:
+			# P(allele) for all but the last allele, for each haplotype
+			n_vals = 2 * (n_alleles - 1)
+		else:
+			# P(genotype) for all but the last genotype
+			n_vals = n_alleles * (n_alleles + 1) // 2 - 1
+
+		probs = _unpack_bits(
+			data[10 + n:], n_bits, n * n_vals
+		).reshape(n, n_vals)
+		max_val = (1 << n_bits) - 1
+
+		if phased:
+			# First value of each haplotype is P(reference allele)
+			hap_0_alt = 2 * probs[:, 0] < max_val
+			hap_1_alt = 2 * probs[:, n_alleles - 1] < max_val
+			gt_codes = (
+				hap_0_alt.astype(np.int8) + 2 * hap_1_alt.astype(np.int8)
+			)
+			unphased_het = np.zeros(n, dtype=bool)
+		else:
+			# Call most likely genotype, then count non-reference alleles.
+			# Genotypes are ordered with ref/ref first and the allele
+			# counts of the rest follow from the BGEN genotype ordering.
+			all_probs = np.column_stack([
+				probs, max_val - probs.sum(axis=1, dtype=np.int64)
+			])
+			alt_counts = _genotype_alt_counts(n_alleles)[
+				np.argmax(all_probs, axis=1)
+			]
+			gt_codes = np.where(alt_counts == 2, 3, alt_counts).astype(np.int8)
+			unphased_het = alt_counts == 1
+
+		gt_codes[missing] = -1
+		unphased_het &= ~missing
+
+		return gt_codes, unphased_het
+
+
+def _decompress(compressed, compression, uncompressed_length):
+	""" Decompresses BGEN genotype data. """
+	if compression == 1:
+		return zlib.decompress(compressed)
+
+	if compression == 2:
+		try:
+			import zstandard
+		except ImportError:
+			raise ImportError(
+				"zstandard is required to read zstd compressed BGEN files. "
+				"Install it with 'pip install zstandard'."
+			)
+		return zstandard.ZstdDecompressor().decompress(
+			compressed, max_output_size=uncompressed_length
+		)
+
+	raise ValueError(f"Invalid BGEN compression type: {compression}")
+
+
+def _unpack_bits(data, n_bits, n_values):
+	""" Unpacks n_values little-endian n_bits-bit unsigned integers. """
+	if n_bits == 8:
+		return np.frombuffer(data, dtype=np.uint8, count=n_values).astype(
+			np.int64
+		)
+	if n_bits == 16:
+		return np.frombuffer(data, dtype='<u2', count=n_values).astype(
+			np.int64
+		)
+
+	n_bytes = (n_values * n_bits + 7) // 8
+	bits = np.unpackbits(
+		np.frombuffer(data, dtype=np.uint8, count=n_bytes),
+		bitorder='little'
+	)[:n_values * n_bits].reshape(n_values, n_bits)
+
+	return bits.astype(np.int64) @ (np.int64(1) << np.arange(n_bits))
+
+
+def _genotype_alt_counts(n_alleles):
+	""" Number of non-reference alleles of each diploid genotype, in the BGEN
+	(colex) genotype order: 0/0, 0/1, 1/1, 0/2, 1/2, 2/2, ...
+	"""
+	return np.array(
+		[
+			int(a > 0) + int(b > 0)
+			for b in range(n_alleles)
+			for a in range(b + 1)
+		],
+		dtype=np.int8
+	)
@@ -7,14 +7,19 @@ Combatibile with the following file formats:
 	- VCF
 """
 
-from abc import ABC
 import inspect
+import os
+import tempfile
 
 import numpy as np
 import hail as hl
 
 from pheno_sim.input_nodes import BaseInputSource
-from pheno_sim.data_types import Values, HaplotypeValues
+from pheno_sim.input_nodes.tabix_reader import (
+	TabixIndexedFile,
+	collapse_loci_to_intervals,
+	find_index_file,
+)
 
 
 class HailInputSource(BaseInputSource):
@@ -37,31 +42,28 @@ class HailInputSource(BaseInputSource):
 			this input source. See input_nodes_README.md for more details.
 		force_bgz: If True, forces hail to read the input file(s) as bgzipped
 			files despite thier extension. Defaults to False.
+		use_index: If True and the input file is a single local bgzipped VCF
+			with a .tbi or .csi index, only the records at required loci are
+			read from the file. Defaults to True.
 		reference_genome: The reference genome to use. Defaults to 'GRCh38'.
 		sample_id_field: The name of the sample ID field in the file(s).
 			Defaults to 's'.
 
 	Methods:
-		__init__(input_config): Constructor. Ignores the 'engine' key in the
-			input_source_config dictionary and uses hail.
-		load_inputs(): Loads the input data from the source file and sets
-			the input_nodes and input_sample_ids attributes.
+		__init__(input_config): Constructor (see BaseInputSource). Ignores
+			the 'engine' key in the input_source_config dictionary and uses
+			hail.
+		load_inputs(cache, input_aliases): See BaseInputSource.
+		load_haplotypes(required_loci): Loads haplotype values for the
+			required loci from the source file and sets the
+			input_sample_ids attribute.
 		subset_and_order_samples(sample_ids): See BaseInputSource.		
 	"""
 
-	def __init__(self, input_config):
-		super().__init__(input_config)
-
-		# Create input nodes
-		self.input_nodes = []
-
-		for input_node_config in self.input_config['input_nodes']:
-			self.input_nodes.append(
-				BaseHailInputNode.create_input_node(input_node_config)
-			)
+	requires_jvm = True
 
 	@staticmethod
-	def load_matrix_table(input_config):
+	def load_matrix_table(input_config, required_loci=None, tmp_dir=None):
 		"""Load file as a hail MatrixTable object.
 
 		Defines following defaults for loading:
@@ -72,10 +74,24 @@ class HailInputSource(BaseInputSource):
 		VCF specifc defaults:
 
 		- 'force_bgz': False
+		- 'use_index': True
+
+		If required_loci is given, the MatrixTable is filtered to intervals
+		covering just those loci. When the input is a single local bgzipped
+		VCF with a .tbi or .csi index, 'use_index' is True, and tmp_dir is
+		given, only the records at the required loci are read (using the
+		index) and written to a VCF in tmp_dir which is then imported, so
+		only BGZF blocks holding required variants are decompressed.
 		
 		Args:
 			input_config: The dictionary from the input section of the
 				simulation config file that defines this input source.
+			required_loci (default None): List of (chromosome (str),
+				position (int)) tuples to subset to. If None, the whole file
+				is loaded.
+			tmp_dir (default None): Directory to write the subset VCF to
+				when reading with the index. Must exist until the returned
+				MatrixTable is no longer used.
 		
 		Returns:
 			A hail MatrixTable object.
@@ -91,14 +107,28 @@ class HailInputSource(BaseInputSource):
 		if input_config['file_format'].lower() == 'vcf':
 			if 'force_bgz' not in input_config:
 				input_config['force_bgz'] = False
+			if 'use_index' not in input_config:
+				input_config['use_index'] = True
 
 		# Load and retrun data as a MatrixTable
 		if input_config['file_format'].lower() == 'vcf':
 			possible_kwargs = set(
 				inspect.signature(hl.import_vcf).parameters.keys()
 			).difference('path')
-			return hl.import_vcf(
-				input_config['file'],
+			vcf_path = input_config['file']
+
+			if (
+				required_loci is not None
+				and tmp_dir is not None
+				and input_config['use_index']
+				and find_index_file(vcf_path) is not None
+			):
+				vcf_path = HailInputSource.write_indexed_subset(
+					vcf_path, required_loci, tmp_dir
+				)
+
+			geno_data = hl.import_vcf(
+				vcf_path,
 				**{k: v for k, v in input_config.items() if k in possible_kwargs}
 			)
 		else:
@@ -106,20 +136,76 @@ class HailInputSource(BaseInputSource):
 				'Invalid file format: {}'.format(input_config['file_format'])
 			)
 
-	def load_inputs(self):
-		"""Loads the input data from the source file and sets the input_nodes
-		and input_sample_ids attributes.
+		if required_loci is not None:
+			geno_data = hl.filter_intervals(
+				geno_data,
+				[
+					hl.Interval(
+						hl.Locus(
+							chrom, start,
+							reference_genome=input_config['reference_genome']
+						),
+						hl.Locus(
+							chrom, end,
+							reference_genome=input_config['reference_genome']
+						),
+						includes_end=True
+					)
+					for chrom, start, end in collapse_loci_to_intervals(
+						required_loci
+					)
+				]
+			)
+
+		return geno_data
+
+	@staticmethod
+	def write_indexed_subset(vcf_path, required_loci, tmp_dir):
+		"""Write the records of a tabix indexed VCF at the required loci to
+		a new (uncompressed) VCF.
+
+		Args:
+			vcf_path: Path to a bgzipped VCF with a .tbi or .csi index.
+			required_loci: List of (chromosome (str), position (int)) tuples.
+			tmp_dir: Directory to write the subset VCF to.
+
+		Returns:
+			Path to the subset VCF.
 		"""
-		geno_data = self.load_matrix_table(self.input_config)
+		indexed_vcf = TabixIndexedFile(vcf_path)
+		subset_path = os.path.join(tmp_dir, 'input_subset.vcf')
+
+		with open(subset_path, 'wb') as f:
+			for line in indexed_vcf.read_header_lines():
+				f.write(line.encode() + b'\n')
+			for _, line in indexed_vcf.fetch_loci(required_loci):
+				f.write(line + b'\n')
+
+		return subset_path
+
+	def load_haplotypes(self, required_loci):
+		"""Loads haplotype values for the required loci from the source file
+		and sets the input_sample_ids attribute.
 
+		Only the intervals containing required loci are imported (see
+		load_matrix_table). Genotypes for all required loci are then
+		extracted with a single collect of the filtered MatrixTable.
+		"""
 		if 'sample_id_field' not in self.input_config:
 			self.input_config['sample_id_field'] = 's'
-		
-		# Subset to loci required by input nodes
-		required_loci = []
-		for input_node in self.input_nodes:
-			required_loci.extend(input_node.get_required_loci())
 
+		with tempfile.TemporaryDirectory() as tmp_dir:
+			return self._load_haplotypes(required_loci, tmp_dir)
+
+	def _load_haplotypes(self, required_loci, tmp_dir):
+		"""Loads haplotype values for the required loci. See
+		load_haplotypes.
+		"""
+		geno_data = self.load_matrix_table(
+			self.input_config, required_loci, tmp_dir
+		)
+
+		# Subset to exactly the loci required by input nodes
 		required_set = hl.literal(set(required_loci))
 
 		geno_data = geno_data.filter_rows(
@@ -136,188 +222,48 @@ class HailInputSource(BaseInputSource):
 			geno_data[self.input_config['sample_id_field']].collect()
 		).astype(str)
 
-		# Get input node values
-		input_node_vals = dict()
-
-		for input_node in self.input_nodes:
-			input_node_vals[input_node.alias] = input_node.get_node_values(
-				geno_data
-			)
-
-		return input_node_vals
-
+		# Get haplotype values for all required loci
+		return self.extract_haplotypes(geno_data, required_loci)
 
-class BaseHailInputNode(ABC):
-	""" Base input node class.
-
-	Attributes:
-		alias: The alias of the input node.
-		
-	Methods:
-		__init__(alias, **kwargs): Constructor.
-		required_loci(): Returns a list of the required loci for this
-			input node. Used by the HailInputSource object to load subset
-			of the input data.
-		get_node_values(geno_data): Returns the input node values
-			from the geno_data hail MatrixTable object.
-
-	Class methods:
-		create_input_node(input_node_config): Returns an input node object
-			given a dictionary defining the input node. This function
-			will return the proper subclass of BaseHailInputNode initialized
-			with the key-value pairs from the input_node_config dictionary
-			(except for the 'type' key) as its keyword arguments.
-	"""
-
-	def __init__(self, alias, **kwargs):
-		self.alias = alias
-
-	def get_required_loci(self):
-		""" Returns a list of the required loci for this input node. Used by
-		the HailInputSource object to load subset of the input data.
-		"""
-		pass
-
-	def get_node_values(self, geno_data):
-		""" Returns the input node values from the geno_data hail
-		MatrixTable object.
-		"""
-		pass
-
-	@classmethod
-	def create_input_node(cls, input_node_config):
-		""" Returns an input node object given a dictionary defining the
-		input node. This function will return the proper subclass of
-		BaseHailInputNode initialized with the key-value pairs from the
-		input_node_config dictionary (except for the 'type' key) as its
-		keyword arguments.
-
-		Currently supported input node types (case insensitive):
-			- 'SNP'
-		"""
-		input_node_config = input_node_config.copy()
-		
-		input_node_type = input_node_config.pop('type').lower()
-
-		if input_node_type == 'snp':
-			return SNPInputNode(**input_node_config)
-		else:
-			raise ValueError(f"Invalid input node type: {input_node_type}")
-
-
-class SNPInputNode(BaseHailInputNode):
-	""" Class defining SNP(s) from a file loaded with Hail that will
-	be part of one input node.
-
-	See BaseHailInputNode.
-
-	Attributes:
-		alias: The alias of the input node.
-		required_loci_list: A list of tuples of (chromosome (str), position
-			(int)) representing the required loci for this input node.
-
-	Args:
-		alias: The alias of the input node.
-		chr: The chromosome of the SNP(s). May be a string or integer 
-			representing a single chromosome all positions in 'pos' are on,
-			or a list of strings or integers representing multiple
-			chromosomes. If a list, the length of the list must be the same
-			as the length of 'pos'.
-		pos: The position(s) of the SNP(s). May either be:
-			- An integer representing a single position on 'chr'.
-			- A list of integers representing multiple positions on 'chr'
-				if 'chr' is a single chromosome.
-			- A list of integers the same length as 'chr' if 'chr' is a list
-				of chromosomes, such that each position in 'pos' is on the
-				corresponding chromosome in 'chr'.
-	"""
+	@staticmethod
+	def extract_haplotypes(geno_data, required_loci):
+		"""Extract haplotype values for the required loci in one pass.
 
-	def __init__(self, alias, chr, pos):
-		super().__init__(alias)
-		
-		# Set attribute of position(s) required for this input node as a list
-		# of tuples of (chromosome (str), position (int)).
-
-		# If chr is a list, pos must be a list of the same length
-		if isinstance(chr, list):
-			if not isinstance(pos, list):
-				raise ValueError(f"pos must be a list if chr is a list.")
-			if len(chr) != len(pos):
-				raise ValueError(
-					f"chr and pos must be the same length if chr is a list."
-				)
-			
-			# Cast chr to str
-			self.required_loci_list = list(zip(map(str, chr), pos))
-		elif isinstance(pos, list):
-			self.required_loci_list = [(str(chr), p) for p in pos]
-		else:
-			self.required_loci_list = [(str(chr), pos)]
-
-	def get_required_loci(self):
-		""" Returns a list of the required loci for this input node. Used by
-		the HailInputSource object to load subset of the input data.
-		"""
-		return self.required_loci_list
-	
-	def get_node_values(self, geno_data) -> HaplotypeValues:
-		""" Get values for the input node from the geno_data MatrixTable.
+		Each call is encoded as a GT code (see
+		BaseInputSource.gt_codes_to_haplotypes) so the whole filtered
+		MatrixTable can be collected as one ndarray per row in a single
+		Spark job.
 
 		Args:
-			geno_data: The (optimally filtered and persisted) geno_data
-				MatrixTable object.
+			geno_data: MatrixTable filtered to (at least) the required loci.
+			required_loci: List of unique (chromosome (str), position (int))
+				tuples.
 
 		Returns:
-			HaplotypeValues object containing the values for the input node.
-			HaplotypeValues are length 2 tuples of numpy arrays.
+			HaplotypeValues tuple of (n_loci, n_samples) numpy arrays with
+			rows in the order of required_loci.
 		"""
-
-		hap_1_rows = []
-		hap_2_rows = []
-
-		for locus in self.required_loci_list:
-			# Filter to row
-			row_data = geno_data.filter_rows(
-				(geno_data.locus.contig == locus[0]) 
-				& (geno_data.locus.position == locus[1])
-			)
-
-			# Assert only one row
-			row_count = row_data.count_rows()
-			if row_count > 1:
-				raise ValueError(
-					f"{locus[0]}:{locus[1]} has "
-					f"{row_data.count_rows()} rows. Can only have one row."
-				)
-			if row_count == 0:
-				raise ValueError(
-					f"{locus[0]}:{locus[1]} has no rows."
-				)
-
-			# Assert all calls are phased
-			assert np.all(
-				row_data.GT.phased.collect()
-			)
-
-			# Get values for each haplotype
-			hap_1_rows.append(
-				(np.array(row_data.GT[0].collect()) >= 1).astype(int)
-			)
-			hap_2_rows.append(
-				(np.array(row_data.GT[1].collect()) >= 1).astype(int)
-			)
-
-		# If more that one locus, stack the rows and return as a tuple
-		if len(self.required_loci_list) > 1:
-			return (
-				np.vstack(hap_1_rows),
-				np.vstack(hap_2_rows)
-			)
-		else:
-			return (
-				hap_1_rows[0],
-				hap_2_rows[0]
+		gt = geno_data.GT
+		geno_data = geno_data.select_entries(
+			gt_code=hl.or_else(
+				hl.int32(gt[0] >= 1)
+				+ 2 * hl.int32(gt[1] >= 1)
+				+ hl.if_else(gt.phased, 0, 4),
+				-1
 			)
+		)
+
+		rows = geno_data.localize_entries('entries')
+		rows = rows.select(
+			contig=hl.str(rows.locus.contig),
+			position=rows.locus.position,
+			gt_codes=hl.nd.array(rows.entries.map(lambda e: e.gt_code))
+		).collect()
+
+		return BaseInputSource.gt_codes_to_haplotypes(
+			[((row.contig, row.position), row.gt_codes) for row in rows],
+			required_loci
+		)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+""" Input node types shared by all input source engines.
+
+Input nodes define which values are taken from an input source. The input
+source extracts haplotype values for all loci its input nodes require and
+each input node then selects its own values from them.
+
+Includes following input nodes types:
+	- SNP
+"""
+
+from abc import ABC
+
+from pheno_sim.data_types import (
+	HaplotypeValues, StackedHaplotypes, stack_haplotypes
+)
+
+
+class BaseInputNode(ABC):
+	""" Base input node class.
+
+	Attributes:
+		alias: The alias of the input node.
+		
+	Methods:
+		__init__(alias, **kwargs): Constructor.
+		required_loci(): Returns a list of the required loci for this
+			input node. Used by the input source object to load subset
+			of the input data.
+		get_node_values(hap_vals, locus_index): Returns the input node
+			values from the haplotype values extracted by the input
+			source object.
+
+	Class methods:
+		create_input_node(input_node_config): Returns an input node object
+			given a dictionary defining the input node. This function
+			will return the proper subclass of BaseInputNode initialized
+			with the key-value pairs from the input_node_config dictionary
+			(except for the 'type' key) as its keyword arguments.
+	"""
+
+	def __init__(self, alias, **kwargs):
+		self.alias = alias
+
+	def get_required_loci(self):
+		""" Returns a list of the required loci for this input node. Used by
+		the input source object to load subset of the input data.
+		"""
+		pass
+
+	def get_node_values(self, hap_vals, locus_index):
+		""" Returns the input node values from the haplotype values
+		extracted for all of the input source's required loci.
+		"""
+		pass
+
+	@classmethod
+	def create_input_node(cls, input_node_config):
+		""" Returns an input node object given a dictionary defining the
+		input node. This function will return the proper subclass of
+		BaseInputNode initialized with the key-value pairs from the
+		input_node_config dictionary (except for the 'type' key) as its
+		keyword arguments.
+
+		Currently supported input node types (case insensitive):
+			- 'SNP'
+		"""
+		input_node_config = input_node_config.copy()
+		
+		input_node_type = input_node_config.pop('type').lower()
+
+		if input_node_type == 'snp':
+			return SNPInputNode(**input_node_config)
+		else:
+			raise ValueError(f"Invalid input node type: {input_node_type}")
+
+
+class SNPInputNode(BaseInputNode):
+	""" Class defining SNP(s) from an input source file that will be part
+	of one input node.
+
+	See BaseInputNode.
+
+	Attributes:
+		alias: The alias of the input node.
+		required_loci_list: A list of tuples of (chromosome (str), position
+			(int)) representing the required loci for this input node.
+
+	Args:
+		alias: The alias of the input node.
+		chr: The chromosome of the SNP(s). May be a string or integer 
+			representing a single chromosome all positions in 'pos' are on,
+			or a list of strings or integers representing multiple
+			chromosomes. If a list, the length of the list must be the same
+			as the length of 'pos'.
+		pos: The position(s) of the SNP(s). May either be:
+			- An integer representing a single position on 'chr'.
+			- A list of integers representing multiple positions on 'chr'
+				if 'chr' is a single chromosome.
+			- A list of integers the same length as 'chr' if 'chr' is a list
+				of chromosomes, such that each position in 'pos' is on the
+				corresponding chromosome in 'chr'.
+	"""
+
+	def __init__(self, alias, chr, pos):
+		super().__init__(alias)
+		
+		# Set attribute of position(s) required for this input node as a list
+		# of tuples of (chromosome (str), position (int)).
+
+		# If chr is a list, pos must be a list of the same length
+		if isinstance(chr, list):
+			if not isinstance(pos, list):
+				raise ValueError(f"pos must be a list if chr is a list.")
+			if len(chr) != len(pos):
+				raise ValueError(
+					f"chr and pos must be the same length if chr is a list."
+				)
+			
+			# Cast chr to str
+			self.required_loci_list = list(zip(map(str, chr), pos))
+		elif isinstance(pos, list):
+			self.required_loci_list = [(str(chr), p) for p in pos]
+		else:
+			self.required_loci_list = [(str(chr), pos)]
+
+	def get_required_loci(self):
+		""" Returns a list of the required loci for this input node. Used by
+		the input source object to load subset of the input data.
+		"""
+		return self.required_loci_list
+	
+	def get_node_values(self, hap_vals, locus_index) -> HaplotypeValues:
+		""" Get values for the input node from the extracted haplotypes.
+
+		Rows are returned as views of hap_vals when this node's loci are
+		contiguous in hap_vals (always the case for a single locus),
+		otherwise they are copied.
+
+		Args:
+			hap_vals: HaplotypeValues tuple of (n_loci, n_samples) arrays
+				for all loci required by the input source.
+			locus_index: Dict mapping (chromosome (str), position (int))
+				tuples to row indices in hap_vals.
+
+		Returns:
+			StackedHaplotypes object containing the values for the input
+			node. StackedHaplotypes are HaplotypeValues (length 2 tuples of
+			numpy arrays) that are views of one stacked array.
+		"""
+		row_idx = [locus_index[locus] for locus in self.required_loci_list]
+		stacked_haps = stack_haplotypes(hap_vals)
+
+		# If only one locus, return vectors
+		if len(row_idx) == 1:
+			return StackedHaplotypes(stacked_haps[:, row_idx[0]])
+
+		# Rows contiguous and in order can be sliced as views
+		if row_idx == list(range(row_idx[0], row_idx[0] + len(row_idx))):
+			rows = slice(row_idx[0], row_idx[-1] + 1)
+		else:
+			rows = row_idx
+
+		return StackedHaplotypes(stacked_haps[:, rows])
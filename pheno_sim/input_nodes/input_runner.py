@@ -52,23 +52,60 @@ Example:
 
 """
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import os
 from typing import Any
+
 import numpy as np
+import pandas as pd
 
-from pheno_sim.input_nodes import BaseInputSource, HailInputSource
+from pheno_sim.data_types import DTypePolicy
+from pheno_sim.disk_cache import DiskCache
+from pheno_sim.input_nodes import (
+	BaseInputSource,
+	NativeInputSource,
+	PlinkInputSource,
+	BGENInputSource,
+)
 
 
 class InputRunner:
 	""" Steps up and runs the input nodes step of the simulation.
 	"""
 	
-	def __init__(self, input_config):
+	def __init__(
+		self,
+		input_config,
+		input_cache=True,
+		max_workers=None,
+		dtype_policy=None
+	):
 		""" Initializes the input runner.
 		
 		Args:
 			input_config: List of dicts defining input sources and their
 				respective input nodes. See input_nodes_README.md for more.
+			input_cache (default True): Cache for haplotype values extracted
+				from input sources, so repeated runs over the same files and
+				loci skip reading them. True uses a DiskCache with the
+				default location and size, False or None disables caching,
+				or a DiskCache object may be given.
+			max_workers (default None): Max number of input sources to load
+				concurrently. If None, uses the number of CPUs. If 1, input
+				sources are loaded one after another.
+			dtype_policy (default None): DTypePolicy, or its config, for
+				the input node values. If None, the 'wide' preset is used.
 		"""
+		self.max_workers = max_workers
+		self.dtype_policy = DTypePolicy.from_config(dtype_policy)
+
+		if input_cache is True:
+			self.input_cache = DiskCache()
+		elif input_cache is False:
+			self.input_cache = None
+		else:
+			self.input_cache = input_cache
 	
 		self.input_sources = []
 
@@ -77,19 +114,48 @@ class InputRunner:
 				'engine' not in input_source_config
 				or input_source_config['engine'] == 'hail'
 			):
+				from pheno_sim.input_nodes.hail_input import HailInputSource
+
+				self.input_sources.append(
+					HailInputSource(
+						input_source_config, self.dtype_policy
+					)
+				)
+			elif input_source_config['engine'] == 'native':
 				self.input_sources.append(
-					HailInputSource(input_source_config)
+					NativeInputSource(
+						input_source_config, self.dtype_policy
+					)
+				)
+			elif input_source_config['engine'] == 'plink':
+				self.input_sources.append(
+					PlinkInputSource(
+						input_source_config, self.dtype_policy
+					)
+				)
+			elif input_source_config['engine'] == 'bgen':
+				self.input_sources.append(
+					BGENInputSource(
+						input_source_config, self.dtype_policy
+					)
 				)
 			else:
 				raise ValueError(
 					'Invalid input engine: ' + input_source_config['engine']
 				)
 			
-	def __call__(self):
+	def __call__(self, input_aliases=None):
 		""" Runs the input nodes for the simulation.
 		
 		Loads the input data and subsets the sample ids to those that are
-		present in all input data files.
+		present in all input data files, in the order of the first input
+		data file.
+
+		Args:
+			input_aliases (default None): Aliases of the input nodes to load
+				values for. If None, all input nodes are loaded. Sample ids
+				are loaded from every input source either way, so the
+				samples are the same as when loading all input nodes.
 		
 		Returns:
 			A tuple of:
@@ -99,35 +165,126 @@ class InputRunner:
 					aliases and the values are numpy arrays of the input
 					node values.
 		"""
+		if input_aliases is not None:
+			known_aliases = {
+				input_node.alias
+				for input_source in self.input_sources
+				for input_node in input_source.input_nodes
+			}
+			unknown_aliases = [
+				alias for alias in input_aliases if alias not in known_aliases
+			]
+			if unknown_aliases:
+				raise ValueError(
+					f"Unknown input node aliases: {unknown_aliases}"
+				)
+
 		print('Loading input data...')
 		
 		# Simple case of only one input source file
 		if len(self.input_sources) == 1:
-			input_node_vals = self.input_sources[0].load_inputs()
+			input_node_vals = self.input_sources[0].load_inputs(
+				cache=self.input_cache, input_aliases=input_aliases
+			)
 			sample_ids = self.input_sources[0].input_sample_ids.copy()
 		else:
 			# Load all values
-			input_vals = []
-			for input_source in self.input_sources:
-				input_vals.append(input_source.load_inputs())
+			input_vals = self._load_all_inputs(input_aliases)
 
-			# Get common subset of sample ids
-			sample_ids = set()
-			for input_source in self.input_sources:
-				sample_ids |= set(input_source.input_sample_ids)
-			sample_ids = list(sample_ids)
+			# Get sample ids present in all sources, in the order of the
+			# first source
+			sample_ids = pd.Index(self.input_sources[0].input_sample_ids)
+			for input_source in self.input_sources[1:]:
+				sample_ids = sample_ids[
+					sample_ids.isin(input_source.input_sample_ids)
+				]
+			sample_ids = sample_ids.to_numpy()
 
 			# Subset input values to common sample ids
 			input_node_vals = {}
 
-			for input_source in self.input_sources:
+			for input_source, source_vals in zip(
+				self.input_sources, input_vals
+			):
 				input_node_vals.update(
-					input_source.subset_inputs(sample_ids, input_vals)
+					input_source.subset_and_order_samples(
+						sample_ids, source_vals
+					)
 				)
 			
 		# Return input data
 		return sample_ids, input_node_vals
 	
+	def _load_all_inputs(self, input_aliases=None):
+		""" Loads the inputs of all input sources concurrently.
+
+		Sources that use a JVM (i.e. Hail) are loaded in threads sharing
+		one Hail context. Other sources are loaded in separate processes,
+		and the sample ids and updated input config of each are copied back
+		to the input source objects. At most max_workers sources are loaded
+		at once.
+
+		Args:
+			input_aliases (default None): See __call__.
+
+		Returns:
+			List of the input node values dicts of each input source.
+		"""
+		max_workers = self.max_workers
+		if max_workers is None:
+			max_workers = os.cpu_count() or 1
+		max_workers = min(max_workers, len(self.input_sources))
+
+		if max_workers <= 1:
+			return [
+				input_source.load_inputs(
+					cache=self.input_cache, input_aliases=input_aliases
+				)
+				for input_source in self.input_sources
+			]
+
+		jvm_sources = [
+			i for i, input_source in enumerate(self.input_sources)
+			if input_source.requires_jvm
+		]
+		other_sources = [
+			i for i, input_source in enumerate(self.input_sources)
+			if not input_source.requires_jvm
+		]
+
+		futures = dict()
+		with ThreadPoolExecutor(
+			max_workers=max(1, min(max_workers, len(jvm_sources)))
+		) as thread_pool, ProcessPoolExecutor(
+			max_workers=max(1, min(max_workers, len(other_sources))),
+			mp_context=_process_pool_context()
+		) as process_pool:
+			for i in jvm_sources:
+				futures[i] = thread_pool.submit(
+					self.input_sources[i].load_inputs,
+					cache=self.input_cache,
+					input_aliases=input_aliases
+				)
+			for i in other_sources:
+				futures[i] = process_pool.submit(
+					_load_inputs_in_process,
+					self.input_sources[i],
+					self.input_cache,
+					input_aliases
+				)
+
+			input_vals = []
+			for i, input_source in enumerate(self.input_sources):
+				if i in jvm_sources:
+					input_vals.append(futures[i].result())
+				else:
+					source_vals, sample_ids, source_config = futures[i].result()
+					input_source.input_sample_ids = sample_ids
+					input_source.input_config.update(source_config)
+					input_vals.append(source_vals)
+
+		return input_vals
+
 	def get_config(self):
 		""" Returns the input config for the simulation.
 		
@@ -141,6 +298,37 @@ class InputRunner:
 		]
 	
 
+def _process_pool_context():
+	""" Returns the multiprocessing context used to start worker processes.
+
+	Forking after Numba has started its parallel threads (e.g. in an
+	earlier run with the fused backend) can deadlock the process, so
+	workers are started by a fork server where the platform supports it.
+	"""
+	if 'forkserver' in multiprocessing.get_all_start_methods():
+		return multiprocessing.get_context('forkserver')
+	return None
+
+
+def _load_inputs_in_process(input_source, input_cache, input_aliases=None):
+	""" Loads the inputs of an input source in a worker process.
+
+	Returns:
+		Tuple of the input node values, sample ids, and input config of the
+		input source, since changes to the input source object are not
+		seen by the parent process.
+	"""
+	input_node_vals = input_source.load_inputs(
+		cache=input_cache, input_aliases=input_aliases
+	)
+
+	return (
+		input_node_vals,
+		input_source.input_sample_ids,
+		input_source.input_config
+	)
+
+
 if __name__ == '__main__':
 
 	# For testing
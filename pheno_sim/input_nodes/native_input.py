@@ -0,0 +1,267 @@
+""" Input source object using the native (pure Python and NumPy) engine.
+
+Reads bgzipped VCFs directly, without Hail or a JVM. When the VCF has a
+tabix (.tbi or .csi) index, only the BGZF blocks containing required loci
+are decompressed. Phased GT fields are decoded into HaplotypeValues with
+vectorized NumPy operations.
+
+Includes following input nodes types:
+	- SNP (see input_node_types.py)
+
+Combatibile with the following file formats:
+	- VCF (bgzipped, gzipped, or uncompressed)
+"""
+
+import gzip
+
+import numpy as np
+
+from pheno_sim.input_nodes import BaseInputSource
+from pheno_sim.input_nodes.tabix_reader import (
+	TabixIndexedFile,
+	find_index_file,
+)
+
+
+_TAB = ord('\t')
+_COLON = ord(':')
+_PHASED_SEP = ord('|')
+_UNPHASED_SEP = ord('/')
+_MISSING = ord('.')
+_ZERO = ord('0')
+
+
+class NativeInputSource(BaseInputSource):
+	""" Native input source object.
+
+	Attributes:
+		input_config: The dictionary from the input section of the simulation
+			config file that defines this input source.
+		input_nodes: A list of input nodes that use the input source.
+		input_sample_ids: A list of sample ids from the input source.
+
+	Input config keys:
+		file: Path to the VCF file.
+		file_format: The file format of the input file. Defaults to 'vcf'.
+			Must be 'vcf'.
+		input_nodes: A list of dictionaries defining the input nodes that use
+			this input source. See input_nodes_README.md for more details.
+		use_index: If True and the input file is bgzipped with a .tbi or
+			.csi index, only the records at required loci are read from the
+			file. Otherwise the whole file is scanned. Defaults to True.
+
+	Methods:
+		__init__(input_config): Constructor (see BaseInputSource).
+		load_inputs(cache, input_aliases): See BaseInputSource.
+		load_haplotypes(required_loci): Loads haplotype values for the
+			required loci from the source file and sets the
+			input_sample_ids attribute.
+		subset_and_order_samples(sample_ids): See BaseInputSource.
+	"""
+
+	def load_haplotypes(self, required_loci):
+		"""Loads haplotype values for the required loci from the source file
+		and sets the input_sample_ids attribute.
+
+		Args:
+			required_loci: List of unique (chromosome (str), position (int))
+				tuples.
+
+		Returns:
+			HaplotypeValues tuple of (n_loci, n_samples) arrays with rows
+			in the order of required_loci.
+		"""
+		if 'file_format' not in self.input_config:
+			self.input_config['file_format'] = 'vcf'
+		if 'use_index' not in self.input_config:
+			self.input_config['use_index'] = True
+
+		if self.input_config['file_format'].lower() != 'vcf':
+			raise ValueError(
+				'Invalid file format for native engine: {}'.format(
+					self.input_config['file_format']
+				)
+			)
+
+		header_lines, records = self.read_vcf_records(
+			self.input_config['file'],
+			required_loci,
+			use_index=self.input_config['use_index']
+		)
+
+		# Get sample ids from the #CHROM header line
+		chrom_line = [
+			line for line in header_lines if line.startswith('#CHROM')
+		]
+		if len(chrom_line) != 1:
+			raise ValueError(
+				f"{self.input_config['file']} has no #CHROM header line."
+			)
+		self.input_sample_ids = np.array(
+			chrom_line[0].rstrip('\r').split('\t')[9:]
+		)
+		n_samples = len(self.input_sample_ids)
+
+		return self.gt_codes_to_haplotypes(
+			[
+				(locus, self.decode_gt_codes(line, n_samples))
+				for locus, line in records
+			],
+			required_loci
+		)
+
+	@staticmethod
+	def read_vcf_records(vcf_path, required_loci, use_index=True):
+		""" Reads the header and the records at the required loci of a VCF.
+
+		Args:
+			vcf_path: Path to the VCF.
+			required_loci: List of (chromosome (str), position (int)) tuples.
+			use_index (default True): If True and a .tbi or .csi index is
+				found, the index is used to read only blocks containing
+				required loci.
+
+		Returns:
+			Tuple of:
+				- List of header lines (str, without newlines).
+				- List of ((chromosome, position), line) tuples for records
+					at required loci, where lines are bytes without newlines.
+		"""
+		if use_index and find_index_file(vcf_path) is not None:
+			indexed_vcf = TabixIndexedFile(vcf_path)
+			return (
+				indexed_vcf.read_header_lines(),
+				list(indexed_vcf.fetch_loci(required_loci))
+			)
+
+		wanted = set(required_loci)
+		header_lines = []
+		records = []
+
+		opener = gzip.open if _is_gzipped(vcf_path) else open
+		with opener(vcf_path, 'rb') as f:
+			for line in f:
+				line = line.rstrip(b'\r\n')
+				if line.startswith(b'#'):
+					header_lines.append(line.decode())
+					continue
+
+				chrom, pos, _ = line.split(b'\t', 2)
+				locus = (chrom.decode(), int(pos))
+				if locus in wanted:
+					records.append((locus, line))
+
+		return header_lines, records
+
+	@staticmethod
+	def decode_gt_codes(line, n_samples):
+		""" Decodes the GT fields of a VCF record into GT codes.
+
+		GT codes are as described in BaseInputSource.gt_codes_to_haplotypes.
+		Calls of the form 'a|b' or 'a/b' with single digit alleles, the
+		usual case, are decoded for all samples at once from the raw bytes.
+		Any other calls (e.g. multi-digit alleles or GT not being the first
+		FORMAT field) fall back to parsing the field as a string.
+
+		Args:
+			line: VCF record line (bytes, without newline).
+			n_samples: Number of samples in the VCF.
+
+		Returns:
+			Numpy int8 array of GT codes with one value per sample.
+		"""
+		# Pad with a tab so the byte after each sample's GT always exists
+		buf = np.frombuffer(line.rstrip(b'\r') + b'\t', dtype=np.uint8)
+		tabs = np.flatnonzero(buf == _TAB)
+
+		if len(tabs) != 9 + n_samples:
+			raise ValueError(
+				f"Record {_record_locus(line)} has {len(tabs) - 9} sample "
+				f"columns, expected {n_samples}."
+			)
+
+		format_keys = line[tabs[7] + 1:tabs[8]].split(b':')
+		if b'GT' not in format_keys:
+			raise ValueError(f"Record {_record_locus(line)} has no GT field.")
+
+		if format_keys[0] != b'GT':
+			return NativeInputSource._decode_gt_codes_slow(
+				line, format_keys.index(b'GT')
+			)
+
+		starts = tabs[8:-1] + 1
+		allele_0 = buf[np.minimum(starts, len(buf) - 1)]
+		sep = buf[np.minimum(starts + 1, len(buf) - 1)]
+		allele_1 = buf[np.minimum(starts + 2, len(buf) - 1)]
+		after = buf[np.minimum(starts + 3, len(buf) - 1)]
+
+		allele_0_digit = (allele_0 - np.uint8(_ZERO)) <= 9
+		allele_1_digit = (allele_1 - np.uint8(_ZERO)) <= 9
+
+		gt_codes = (
+			(allele_0_digit & (allele_0 != _ZERO)).astype(np.int8)
+			+ 2 * (allele_1_digit & (allele_1 != _ZERO)).astype(np.int8)
+			+ 4 * (sep == _UNPHASED_SEP).astype(np.int8)
+		)
+
+		# Missing calls
+		gt_codes[(allele_0 == _MISSING) | (allele_1 == _MISSING)] = -1
+
+		# Calls that are not two single character alleles
+		simple = (
+			(allele_0_digit | (allele_0 == _MISSING))
+			& (allele_1_digit | (allele_1 == _MISSING))
+			& ((sep == _PHASED_SEP) | (sep == _UNPHASED_SEP))
+			& ((after == _TAB) | (after == _COLON))
+			& (starts + 3 < len(buf))
+		)
+
+		if not simple.all():
+			fields = line.rstrip(b'\r').split(b'\t')[9:]
+			for i in np.flatnonzero(~simple):
+				gt_codes[i] = _parse_gt(fields[i].split(b':', 1)[0], line)
+
+		return gt_codes
+
+	@staticmethod
+	def _decode_gt_codes_slow(line, gt_idx):
+		""" Decodes GT codes by parsing each sample field as a string. """
+		return np.array(
+			[
+				_parse_gt(field.split(b':')[gt_idx], line)
+				for field in line.rstrip(b'\r').split(b'\t')[9:]
+			],
+			dtype=np.int8
+		)
+
+
+def _parse_gt(gt, line):
+	""" Returns the GT code of a single GT string (bytes). """
+	phased = b'|' in gt
+	alleles = gt.split(b'|' if phased else b'/')
+
+	if len(alleles) != 2:
+		raise ValueError(
+			f"Record {_record_locus(line)} has non-diploid call "
+			f"'{gt.decode()}'. Only diploid calls are supported."
+		)
+	if b'.' in alleles:
+		return -1
+
+	return (
+		int(int(alleles[0]) >= 1)
+		+ 2 * int(int(alleles[1]) >= 1)
+		+ (0 if phased else 4)
+	)
+
+
+def _record_locus(line):
+	""" Returns 'chromosome:position' of a VCF record line for messages. """
+	chrom, pos, _ = line.split(b'\t', 2)
+	return f"{chrom.decode()}:{pos.decode()}"
+
+
+def _is_gzipped(file_path):
+	""" Returns True if the file starts with the gzip magic bytes. """
+	with open(file_path, 'rb') as f:
+		return f.read(2) == b'\x1f\x8b'
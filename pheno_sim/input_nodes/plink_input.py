@@ -0,0 +1,399 @@
+""" Input source object for PLINK filesets.
+
+Reads PLINK 1 (.bed/.bim/.fam) and PLINK 2 (.pgen/.pvar/.psam) filesets
+without Hail or a JVM. Only the variant rows required by the input nodes
+are decoded.
+
+.bed files are memory-mapped and their 2-bit packed genotypes decoded with
+NumPy. .pgen files are read with the optional pgenlib package
+(pip install pgenlib).
+
+.bed files only store unphased genotypes, and .pgen files may contain
+unphased calls, so the alternate allele of an unphased heterozygous call is
+assigned to a haplotype as set by the 'unphased_het' input config key.
+
+Includes following input nodes types:
+	- SNP (see input_node_types.py)
+
+Combatibile with the following file formats:
+	- bed (PLINK 1 binary fileset)
+	- pgen (PLINK 2 binary fileset)
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from pheno_sim.input_nodes import BaseInputSource
+
+
+# .bed 2-bit code -> number of A1 alleles (-1 is missing)
+_BED_A1_COUNTS = np.array([2, -1, 1, 0], dtype=np.int8)
+
+# Byte value -> its four 2-bit genotype codes, lowest bits first
+_BED_BYTE_CODES = (
+	np.arange(256, dtype=np.uint8)[:, None] >> np.array([0, 2, 4, 6])
+) & 3
+
+
+class PlinkInputSource(BaseInputSource):
+	""" PLINK input source object.
+
+	Attributes:
+		input_config: The dictionary from the input section of the simulation
+			config file that defines this input source. If 'unphased_het'
+			is 'random' and no 'unphased_het_seed' is given, the seed used
+			is added for reproducibility.
+		input_nodes: A list of input nodes that use the input source.
+		input_sample_ids: A list of sample ids from the input source.
+		fileset_prefix: Path of the fileset without extension. Set when
+			inputs are loaded.
+
+	Input config keys:
+		file: Path to the .bed or .pgen file, or the fileset prefix (path
+			without extension).
+		file_format: 'bed' or 'pgen'. Defaults to the extension of 'file',
+			or if 'file' is a prefix, to 'bed' if '{file}.bed' exists and
+			otherwise 'pgen'.
+		input_nodes: A list of dictionaries defining the input nodes that use
+			this input source. See input_nodes_README.md for more details.
+		sample_id_field: Column of the .fam/.psam to use as sample ids.
+			Defaults to 'IID'.
+		alt_allele: For .bed files, which of the .bim allele columns is
+			treated as the non-reference allele, 'A1' (the 5th column, the
+			allele counted by PLINK) or 'A2' (the 6th column). Defaults to
+			'A1'.
+		unphased_het: Which haplotype the alternate allele of unphased
+			heterozygous calls is assigned to. One of 'first', 'second',
+			or 'random' (each call independently). Defaults to 'first'.
+			See BaseInputSource.assign_unphased_hets.
+		unphased_het_seed: Seed for the 'random' unphased_het assignment.
+
+	Methods:
+		__init__(input_config): Constructor (see BaseInputSource).
+		load_inputs(cache, input_aliases): See BaseInputSource.
+		load_haplotypes(required_loci): Loads haplotype values for the
+			required loci from the source file and sets the
+			input_sample_ids attribute.
+		get_source_files(): Returns the paths of the fileset's files.
+		subset_and_order_samples(sample_ids): See BaseInputSource.
+	"""
+
+	def load_haplotypes(self, required_loci):
+		"""Loads haplotype values for the required loci from the source file
+		and sets the input_sample_ids attribute.
+
+		Args:
+			required_loci: List of unique (chromosome (str), position (int))
+				tuples.
+
+		Returns:
+			HaplotypeValues tuple of (n_loci, n_samples) arrays with rows
+			in the order of required_loci.
+		"""
+		self._set_config_defaults()
+
+		prefix = self.fileset_prefix
+		file_format = self.input_config['file_format']
+
+		if file_format == 'bed':
+			sample_path = prefix + '.fam'
+			variant_path = prefix + '.bim'
+		else:
+			sample_path = prefix + '.psam'
+			variant_path = prefix + '.pvar'
+
+		sample_table = self.read_sample_table(sample_path)
+		if self.input_config['sample_id_field'] not in sample_table.columns:
+			raise ValueError(
+				f"sample_id_field '{self.input_config['sample_id_field']}' "
+				f"not in columns of {sample_path}: "
+				f"{list(sample_table.columns)}."
+			)
+		self.input_sample_ids = sample_table[
+			self.input_config['sample_id_field']
+		].to_numpy()
+
+		variant_idx = self.find_variant_indices(variant_path, required_loci)
+
+		if file_format == 'bed':
+			gt_codes, unphased_het = self.read_bed_gt_codes(
+				prefix + '.bed',
+				variant_idx[:, 1],
+				len(self.input_sample_ids),
+				alt_allele=self.input_config['alt_allele']
+			)
+		else:
+			gt_codes, unphased_het = self.read_pgen_gt_codes(
+				prefix + '.pgen',
+				variant_idx[:, 1],
+				len(self.input_sample_ids)
+			)
+
+		self.assign_unphased_hets(gt_codes, unphased_het)
+
+		return self.gt_codes_to_haplotypes(
+			[
+				(required_loci[locus_i], gt_codes[i])
+				for i, locus_i in enumerate(variant_idx[:, 0])
+			],
+			required_loci
+		)
+
+	def _set_config_defaults(self):
+		""" Sets defaults for the optional input config keys and the
+		fileset_prefix attribute.
+		"""
+		prefix, default_format = self._get_prefix_and_default_format()
+
+		if 'file_format' not in self.input_config:
+			self.input_config['file_format'] = default_format
+		self.input_config['file_format'] = self.input_config[
+			'file_format'
+		].lower()
+		if self.input_config['file_format'] not in ('bed', 'pgen'):
+			raise ValueError(
+				'Invalid file format for plink engine: {}'.format(
+					self.input_config['file_format']
+				)
+			)
+
+		self.fileset_prefix = prefix
+
+		if 'sample_id_field' not in self.input_config:
+			self.input_config['sample_id_field'] = 'IID'
+		if 'alt_allele' not in self.input_config:
+			self.input_config['alt_allele'] = 'A1'
+		self.set_unphased_het_defaults()
+
+	def _get_prefix_and_default_format(self):
+		""" Returns the fileset prefix and the default file format based on
+		the 'file' input config key.
+		"""
+		file_path = str(self.input_config['file'])
+		prefix, ext = os.path.splitext(file_path)
+
+		if ext.lower() in ('.bed', '.pgen'):
+			return prefix, ext.lower()[1:]
+
+		return (
+			file_path,
+			'bed' if os.path.exists(file_path + '.bed') else 'pgen'
+		)
+
+	def get_source_files(self):
+		""" Returns the paths of the fileset's files. See
+		BaseInputSource.get_source_files.
+		"""
+		prefix, file_format = self._get_prefix_and_default_format()
+		file_format = self.input_config.get('file_format', file_format).lower()
+
+		if file_format == 'bed':
+			return [prefix + ext for ext in ('.bed', '.bim', '.fam')]
+		return [prefix + ext for ext in ('.pgen', '.pvar', '.psam')]
+
+	@staticmethod
+	def read_sample_table(sample_path):
+		""" Reads a .fam or .psam file.
+
+		Returns:
+			pandas DataFrame with one row per sample. .fam files and .psam
+			files without a header line have columns FID, IID, PAT, MAT,
+			SEX, and PHENO1. Otherwise columns are from the header line
+			(without the leading '#').
+		"""
+		with open(sample_path) as f:
+			first_line = f.readline()
+
+		if first_line.startswith('#'):
+			sample_table = pd.read_csv(
+				sample_path, sep='\t', dtype=str, keep_default_na=False
+			)
+			sample_table.columns = [
+				col.lstrip('#') for col in sample_table.columns
+			]
+		else:
+			sample_table = pd.read_csv(
+				sample_path, sep=r'\s+', header=None, dtype=str,
+				keep_default_na=False
+			)
+			sample_table.columns = [
+				'FID', 'IID', 'PAT', 'MAT', 'SEX', 'PHENO1'
+			][:sample_table.shape[1]]
+
+		return sample_table
+
+	@staticmethod
+	def find_variant_indices(variant_path, required_loci):
+		""" Finds the row indices of the required loci in a .bim or .pvar.
+
+		Args:
+			variant_path: Path to the .bim or .pvar file.
+			required_loci: List of unique (chromosome (str), position (int))
+				tuples.
+
+		Returns:
+			(n_matches, 2) int64 array of (index into required_loci,
+			variant index in the fileset) rows, sorted by variant index.
+			Loci with multiple variants appear multiple times.
+		"""
+		# Skip '##' meta lines and find the header line (if any)
+		n_meta_lines = 0
+		header = None
+		with open(variant_path) as f:
+			for line in f:
+				if line.startswith('##'):
+					n_meta_lines += 1
+					continue
+				if line.startswith('#'):
+					header = line[1:].rstrip('\r\n').split('\t')
+				break
+
+		if header is None:
+			# .bim format (also allowed for .pvar)
+			chrom_col, pos_col = 0, 3
+			sep = r'\s+'
+			skiprows = n_meta_lines
+		else:
+			chrom_col, pos_col = header.index('CHROM'), header.index('POS')
+			sep = '\t'
+			skiprows = n_meta_lines + 1
+
+		variants = pd.read_csv(
+			variant_path,
+			sep=sep,
+			header=None,
+			skiprows=skiprows,
+			usecols=[chrom_col, pos_col],
+			dtype={chrom_col: str, pos_col: np.int64},
+			comment=None,
+		)
+		variants.columns = ['chrom', 'pos']
+
+		locus_index = {locus: i for i, locus in enumerate(required_loci)}
+		variants = variants[
+			variants.chrom.isin({chrom for chrom, _ in required_loci})
+			& variants.pos.isin({pos for _, pos in required_loci})
+		]
+
+		variant_idx = [
+			(locus_index[(chrom, pos)], idx)
+			for idx, chrom, pos in zip(
+				variants.index, variants.chrom, variants.pos
+			)
+			if (chrom, pos) in locus_index
+		]
+
+		return np.array(variant_idx, dtype=np.int64).reshape(-1, 2)
+
+	@staticmethod
+	def read_bed_gt_codes(bed_path, variant_idx, n_samples, alt_allele='A1'):
+		""" Decodes the genotypes of a .bed file's variants into GT codes.
+
+		The .bed file is memory-mapped and only the bytes of the requested
+		variants are read.
+
+		Args:
+			bed_path: Path to the .bed file. Must be variant-major (the
+				PLINK default).
+			variant_idx: Array of variant indices to read.
+			n_samples: Number of samples in the .fam file.
+			alt_allele (default 'A1'): 'A1' or 'A2', the allele that is
+				treated as non-reference.
+
+		Returns:
+			Tuple of:
+				- (n_variants, n_samples) int8 array of GT codes (see
+					BaseInputSource.gt_codes_to_haplotypes) for phased calls.
+					Unphased heterozygous calls must be assigned.
+				- Boolean mask of unphased heterozygous calls.
+		"""
+		if alt_allele not in ('A1', 'A2'):
+			raise ValueError(f"alt_allele must be 'A1' or 'A2'. Got: {alt_allele}")
+
+		bed = np.memmap(bed_path, dtype=np.uint8, mode='r')
+
+		if bed.shape[0] < 3 or bed[0] != 0x6c or bed[1] != 0x1b:
+			raise ValueError(f"{bed_path} is not a PLINK .bed file.")
+		if bed[2] != 0x01:
+			raise ValueError(
+				f"{bed_path} is sample-major. Only variant-major .bed files "
+				"are supported."
+			)
+
+		bytes_per_variant = (n_samples + 3) // 4
+		n_variants = (bed.shape[0] - 3) // bytes_per_variant
+		variant_bytes = bed[3:3 + n_variants * bytes_per_variant].reshape(
+			n_variants, bytes_per_variant
+		)
+
+		codes = _BED_BYTE_CODES[variant_bytes[np.asarray(variant_idx)]]
+		a1_counts = _BED_A1_COUNTS[
+			codes.reshape(len(variant_idx), -1)[:, :n_samples]
+		]
+
+		if alt_allele == 'A1':
+			alt_counts = a1_counts
+		else:
+			alt_counts = np.where(a1_counts < 0, a1_counts, 2 - a1_counts)
+
+		# Homozygous alt calls to GT code 3, het calls assigned later
+		gt_codes = np.where(alt_counts == 2, 3, alt_counts).astype(np.int8)
+
+		return gt_codes, alt_counts == 1
+
+	@staticmethod
+	def read_pgen_gt_codes(pgen_path, variant_idx, n_samples):
+		""" Decodes the genotypes of a .pgen file's variants into GT codes.
+
+		Requires pgenlib. Alleles other than the reference (allele 0) are all
+		treated as non-reference.
+
+		Args:
+			pgen_path: Path to the .pgen file.
+			variant_idx: Array of variant indices to read.
+			n_samples: Number of samples in the .psam file.
+
+		Returns:
+			Tuple of:
+				- (n_variants, n_samples) int8 array of GT codes (see
+					BaseInputSource.gt_codes_to_haplotypes) for phased calls.
+					Unphased heterozygous calls must be assigned.
+				- Boolean mask of unphased heterozygous calls.
+		"""
+		try:
+			import pgenlib
+		except ImportError:
+			raise ImportError(
+				"pgenlib is required to read .pgen files. Install it with "
+				"'pip install pgenlib'."
+			)
+
+		variant_idx = np.asarray(variant_idx, dtype=np.uint32)
+		alleles = np.empty((len(variant_idx), 2 * n_samples), dtype=np.int32)
+		phase_present = np.empty((len(variant_idx), n_samples), dtype=np.uint8)
+
+		if len(variant_idx) > 0:
+			with pgenlib.PgenReader(
+				pgen_path.encode(), raw_sample_ct=n_samples
+			) as reader:
+				reader.read_alleles_and_phasepresent_list(
+					variant_idx, alleles, phase_present
+				)
+
+		# Alleles are interleaved by sample, -9 is missing
+		allele_0 = alleles[:, 0::2]
+		allele_1 = alleles[:, 1::2]
+
+		gt_codes = (
+			(allele_0 >= 1).astype(np.int8)
+			+ 2 * (allele_1 >= 1).astype(np.int8)
+		)
+		gt_codes[(allele_0 < 0) | (allele_1 < 0)] = -1
+
+		unphased_het = (
+			((gt_codes == 1) | (gt_codes == 2)) & (phase_present == 0)
+		)
+
+		return gt_codes, unphased_het
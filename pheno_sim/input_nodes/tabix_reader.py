@@ -0,0 +1,415 @@
+""" Random access to bgzipped, tabix indexed (.tbi or .csi) files.
+
+Used by input sources to read only the BGZF blocks that contain the loci
+required by their input nodes instead of decompressing and parsing whole
+files.
+
+Functions:
+	collapse_loci_to_intervals(loci, max_gap): Collapses (chromosome,
+		position) loci into sorted, non-overlapping intervals.
+	find_index_file(file_path): Returns the path of a .tbi or .csi index
+		for a file, or None if there is no index.
+
+Classes:
+	BGZFReader: Reads decompressed data between BGZF virtual offsets.
+	TabixIndex: Parsed .tbi or .csi index.
+	TabixIndexedFile: Fetches the records at some loci from a bgzipped,
+		tabix indexed file.
+"""
+
+import gzip
+import os
+import struct
+import zlib
+
+
+def collapse_loci_to_intervals(loci, max_gap=1):
+	""" Collapses loci into sorted, non-overlapping intervals.
+
+	Args:
+		loci: Iterable of (chromosome (str), position (int)) tuples.
+		max_gap (default 1): Positions on the same chromosome at most this
+			many base pairs apart are placed in the same interval.
+
+	Returns:
+		List of (chromosome (str), start (int), end (int)) tuples, where
+		start and end are 1-based and inclusive. Intervals are sorted by
+		chromosome (in order of first appearance) and then by start.
+	"""
+	positions_by_chrom = dict()
+	for chrom, pos in loci:
+		positions_by_chrom.setdefault(str(chrom), set()).add(int(pos))
+
+	intervals = []
+	for chrom, positions in positions_by_chrom.items():
+		positions = sorted(positions)
+		start = end = positions[0]
+		for pos in positions[1:]:
+			if pos - end <= max_gap:
+				end = pos
+			else:
+				intervals.append((chrom, start, end))
+				start = end = pos
+		intervals.append((chrom, start, end))
+
+	return intervals
+
+
+def find_index_file(file_path):
+	""" Returns the path of the .tbi or .csi index for file_path, or None
+	if file_path is not a local file with an index next to it.
+	"""
+	if not isinstance(file_path, str) or not os.path.isfile(file_path):
+		return None
+
+	for ext in ('.tbi', '.csi'):
+		if os.path.isfile(file_path + ext):
+			return file_path + ext
+
+	return None
+
+
+class BGZFReader:
+	""" Reads decompressed data from a BGZF file between virtual offsets.
+
+	A virtual offset is (compressed block offset << 16) | offset within the
+	decompressed block.
+	"""
+
+	def __init__(self, file_path):
+		self.file_path = file_path
+		self._file = open(file_path, 'rb')
+
+	def close(self):
+		self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def read_block(self, block_offset):
+		""" Reads the BGZF block starting at compressed offset block_offset.
+
+		Returns:
+			Tuple of (decompressed block data (bytes), offset of the next
+			block). Data is empty at the end of the file.
+		"""
+		self._file.seek(block_offset)
+		header = self._file.read(12)
+
+		if len(header) < 12:
+			return b'', block_offset
+
+		if header[:4] != b'\x1f\x8b\x08\x04':
+			raise ValueError(
+				f"{self.file_path} is not a BGZF file (bad block header at "
+				f"offset {block_offset})."
+			)
+
+		# Find the BSIZE ('BC') subfield in the extra field
+		xlen = struct.unpack('<H', header[10:12])[0]
+		extra = self._file.read(xlen)
+		block_size = None
+		i = 0
+		while i < xlen:
+			sub_len = struct.unpack('<H', extra[i + 2:i + 4])[0]
+			if extra[i:i + 2] == b'BC':
+				block_size = struct.unpack('<H', extra[i + 4:i + 6])[0] + 1
+			i += 4 + sub_len
+
+		if block_size is None:
+			raise ValueError(
+				f"{self.file_path} is not a BGZF file (no block size at "
+				f"offset {block_offset})."
+			)
+
+		# Compressed data is followed by CRC32 and ISIZE
+		cdata = self._file.read(block_size - 12 - xlen - 8)
+		return zlib.decompress(cdata, -15), block_offset + block_size
+
+	def read(self, start_voffset, end_voffset):
+		""" Returns the decompressed data in [start_voffset, end_voffset). """
+		block_offset = start_voffset >> 16
+		end_block = end_voffset >> 16
+		chunks = []
+
+		while block_offset < end_block or (
+			block_offset == end_block and end_voffset & 0xFFFF
+		):
+			data, next_offset = self.read_block(block_offset)
+			if not data and next_offset == block_offset:
+				break
+
+			stop = (end_voffset & 0xFFFF) if block_offset == end_block else None
+			chunks.append(data[:stop])
+			block_offset = next_offset
+
+		if chunks:
+			chunks[0] = chunks[0][start_voffset & 0xFFFF:]
+
+		return b''.join(chunks)
+
+	def iter_lines_from_start(self):
+		""" Yields decompressed lines (bytes, without newline) from the start
+		of the file.
+		"""
+		block_offset = 0
+		remainder = b''
+
+		while True:
+			data, next_offset = self.read_block(block_offset)
+			if not data:
+				if next_offset == block_offset:
+					break
+				block_offset = next_offset
+				continue
+
+			lines = (remainder + data).split(b'\n')
+			remainder = lines.pop()
+			yield from lines
+			block_offset = next_offset
+
+		if remainder:
+			yield remainder
+
+
+class TabixIndex:
+	""" Parsed tabix (.tbi) or coordinate-sorted (.csi) index.
+
+	Attributes:
+		min_shift: Size (log2) of the smallest bins.
+		depth: Number of levels in the binning scheme.
+		names: List of sequence (chromosome) names.
+		bins: List (per sequence) of dicts mapping bin numbers to lists of
+			(start voffset, end voffset) chunks.
+		min_offsets: List (per sequence) of either a tabix linear index
+			(list of voffsets) or a dict mapping CSI bins to their
+			minimum voffsets.
+		meta_char: Comment character for header lines.
+		skip: Number of header lines to skip.
+	"""
+
+	def __init__(self, index_path):
+		with open(index_path, 'rb') as f:
+			data = gzip.decompress(f.read())
+
+		self._data = data
+		self._pos = 0
+
+		magic = self._read(4)
+		if magic == b'TBI\x01':
+			self.is_csi = False
+			self.min_shift = 14
+			self.depth = 5
+			n_ref = self._unpack('<i')
+			self._parse_tabix_header()
+		elif magic == b'CSI\x01':
+			self.is_csi = True
+			self.min_shift = self._unpack('<i')
+			self.depth = self._unpack('<i')
+			l_aux = self._unpack('<i')
+			aux_end = self._pos + l_aux
+			if l_aux >= 28:
+				self._parse_tabix_header()
+			else:
+				self.names = []
+			self._pos = aux_end
+			n_ref = self._unpack('<i')
+		else:
+			raise ValueError(f"{index_path} is not a .tbi or .csi index.")
+
+		self.bins = []
+		self.min_offsets = []
+
+		for _ in range(n_ref):
+			ref_bins = dict()
+			ref_bin_offsets = dict()
+
+			for _ in range(self._unpack('<i')):
+				bin_num = self._unpack('<I')
+				if self.is_csi:
+					ref_bin_offsets[bin_num] = self._unpack('<Q')
+				n_chunk = self._unpack('<i')
+				chunks = struct.unpack_from(f'<{2 * n_chunk}Q', data, self._pos)
+				self._pos += 16 * n_chunk
+				ref_bins[bin_num] = list(zip(chunks[::2], chunks[1::2]))
+
+			if not self.is_csi:
+				n_intv = self._unpack('<i')
+				ref_linear = struct.unpack_from(f'<{n_intv}Q', data, self._pos)
+				self._pos += 8 * n_intv
+				self.min_offsets.append(ref_linear)
+			else:
+				self.min_offsets.append(ref_bin_offsets)
+
+			self.bins.append(ref_bins)
+
+		del self._data
+
+	def _read(self, n):
+		out = self._data[self._pos:self._pos + n]
+		self._pos += n
+		return out
+
+	def _unpack(self, fmt):
+		val = struct.unpack_from(fmt, self._data, self._pos)[0]
+		self._pos += struct.calcsize(fmt)
+		return val
+
+	def _parse_tabix_header(self):
+		""" Parses the format, column, and sequence name fields shared by
+		.tbi headers and .csi aux data.
+		"""
+		(
+			self.format, self.col_seq, self.col_beg, self.col_end,
+			meta, self.skip, l_nm
+		) = struct.unpack_from('<7i', self._data, self._pos)
+		self._pos += 28
+		self.meta_char = chr(meta)
+		self.names = [
+			name.decode() for name in self._read(l_nm).split(b'\x00') if name
+		]
+
+	def _reg2bins(self, beg, end):
+		""" Bins overlapping the 0-based, half-open region [beg, end). """
+		bins = []
+		end -= 1
+		shift = self.min_shift + 3 * self.depth
+		offset = 0
+		for level in range(self.depth + 1):
+			bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+			shift -= 3
+			offset += 1 << (3 * level)
+		return bins
+
+	def _min_offset(self, ref_id, beg):
+		""" Smallest voffset that can contain records overlapping beg. """
+		if not self.is_csi:
+			linear = self.min_offsets[ref_id]
+			if not linear:
+				return 0
+			return linear[min(beg >> self.min_shift, len(linear) - 1)]
+
+		# For CSI, use the offset of the smallest indexed bin containing beg
+		bin_offsets = self.min_offsets[ref_id]
+		bin_num = self._reg2bins(beg, beg + 1)[-1]
+		while bin_num > 0 and bin_num not in bin_offsets:
+			bin_num = (bin_num - 1) >> 3
+		return bin_offsets.get(bin_num, 0)
+
+	def query_chunks(self, chrom, start, end):
+		""" Returns the sorted, merged (start voffset, end voffset) chunks
+		that may contain records overlapping the 1-based, inclusive interval
+		chrom:start-end.
+		"""
+		if chrom not in self.names:
+			return []
+
+		ref_id = self.names.index(chrom)
+		beg = max(start - 1, 0)
+		min_off = self._min_offset(ref_id, beg)
+
+		chunks = sorted(
+			chunk
+			for bin_num in self._reg2bins(beg, end)
+			for chunk in self.bins[ref_id].get(bin_num, [])
+			if chunk[1] > min_off
+		)
+
+		return _merge_chunks(chunks)
+
+
+def _merge_chunks(chunks):
+	""" Merges sorted (start voffset, end voffset) chunks that overlap. """
+	merged = []
+	for chunk_start, chunk_end in chunks:
+		if merged and chunk_start <= merged[-1][1]:
+			merged[-1] = (merged[-1][0], max(merged[-1][1], chunk_end))
+		else:
+			merged.append((chunk_start, chunk_end))
+	return merged
+
+
+class TabixIndexedFile:
+	""" A bgzipped, tabix indexed file (e.g. a .vcf.gz with a .tbi).
+
+	Args:
+		file_path: Path to the bgzipped file.
+		index_path (default None): Path to the .tbi or .csi index. If None,
+			'{file_path}.tbi' or '{file_path}.csi' is used.
+	"""
+
+	def __init__(self, file_path, index_path=None):
+		if index_path is None:
+			index_path = find_index_file(file_path)
+			if index_path is None:
+				raise ValueError(f"No .tbi or .csi index found for {file_path}")
+
+		self.file_path = file_path
+		self.index = TabixIndex(index_path)
+
+	def read_header_lines(self):
+		""" Returns the header lines (str, without newlines) of the file. """
+		meta_char = getattr(self.index, 'meta_char', '#').encode()
+		header = []
+
+		with BGZFReader(self.file_path) as reader:
+			for line in reader.iter_lines_from_start():
+				if not line.startswith(meta_char):
+					break
+				header.append(line.decode())
+
+		return header
+
+	def fetch_loci(self, loci):
+		""" Yields ((chromosome, position), line) for every record starting
+		at one of the loci.
+
+		Only the BGZF blocks indexed as overlapping the loci are read. Each
+		record is yielded at most once, in file order. Lines are bytes
+		without newlines.
+
+		Args:
+			loci: Iterable of (chromosome (str), position (int)) tuples.
+		"""
+		wanted = dict()
+		for chrom, pos in loci:
+			wanted.setdefault(str(chrom), set()).add(int(pos))
+
+		chrom_col = self.index.col_seq - 1
+		pos_col = self.index.col_beg - 1
+		max_split = max(chrom_col, pos_col) + 1
+
+		# Merge chunks across all intervals on a chromosome so each block
+		# is decompressed and each record is parsed once.
+		intervals = collapse_loci_to_intervals(
+			(chrom, pos) for chrom, positions in wanted.items()
+			for pos in positions
+		)
+		chunks_by_chrom = dict()
+		for chrom, start, end in intervals:
+			if chrom in self.index.names:
+				chunks_by_chrom.setdefault(chrom, []).extend(
+					self.index.query_chunks(chrom, start, end)
+				)
+
+		with BGZFReader(self.file_path) as reader:
+			for chrom in sorted(
+				chunks_by_chrom,
+				key=lambda c: self.index.names.index(c)
+			):
+				positions = wanted[chrom]
+				for chunk_start, chunk_end in _merge_chunks(
+					sorted(chunks_by_chrom[chrom])
+				):
+					for line in reader.read(chunk_start, chunk_end).split(b'\n'):
+						if not line:
+							continue
+						fields = line.split(b'\t', max_split)
+						if fields[chrom_col].decode() != chrom:
+							continue
+						pos = int(fields[pos_col])
+						if pos in positions:
+							yield (chrom, pos), line
@@ -22,34 +22,64 @@ Methods:
 		Alternative constructor. Creates a PhenoSimulation object from a
 			simulation configuration JSON file. Class method.
 			
-	run_input_step(self) -> ValuesDict
+	compile(self, outputs=None) -> ExecutionPlan
+		Returns the (cached) execution plan of the simulation steps needed
+			to compute outputs.
+
+	validate(self, outputs=None) -> Dict[str, ValueSpec]
+		Checks the simulation steps and infers the shapes and dtypes of
+			all values, without loading input data.
+
+	run_input_step(self, input_aliases=None) -> ValuesDict
 		Run the input step and return the ValuesDict to be passed to the
 			simulation steps.
 			
 	run_simulation_steps(
-		self, input_values: ValuesDict, run_output_step=True
+		self, input_values: ValuesDict, outputs=None
 	) -> ValuesDict
-		Run the simulation steps and optionally the output step. Returns
-			whatever is returned by the last step run.
+		Run the simulation steps needed for outputs (or all steps).
 	
-	run_simulation(
-		self, input_file_map: None (default) or Dict[str, str]
-	) -> ValuesDict
-		Run the simulation. Returns whatever is returned by the last step.
+	run_simulation(self, outputs=None) -> ValuesDict
+		Run the simulation. Only the input nodes and steps needed for
+			outputs are loaded and run.
+
+	run_simulation_chunked(
+		self, outputs=None, chunk_size=DEFAULT_CHUNK_SIZE
+	) -> Iterator[Tuple[slice, ValuesDict]]
+		Run the simulation on chunks of samples, yielding the outputs of
+			each chunk.
+
+	update_node(self, alias: str, **params) -> None
+		Update parameters of a simulation step for the next rerun.
+
+	rerun(self, outputs=None) -> ValuesDict
+		Run the simulation, only rerunning steps affected by update_node
+			calls since the last rerun.
 """
 
-import copy
+from collections import Counter
 import json
 import os
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
 
 import numpy as np
 import pandas as pd
 
-from pheno_sim.data_types import ValuesDict
+from pheno_sim.data_types import (
+	DTypePolicy, PackedValues, ReadOnlyValuesDict, ValuesDict, select_samples
+)
 from pheno_sim.base_nodes import AbstractBaseFunctionNode
+from pheno_sim.chunking import (
+	DEFAULT_CHUNK_SIZE, population_passes, sample_chunks
+)
+from pheno_sim.execution_plan import ExecutionPlan
 from pheno_sim.func_nodes import FunctionNodeBuilder
+from pheno_sim.fused_backend import FusedPlan
 from pheno_sim.input_nodes import InputRunner
+from pheno_sim.population_stats import StatsAccumulator
+from pheno_sim.random_streams import RandomStream
+from pheno_sim.result_store import ResultStore
+from pheno_sim.shape_inference import ValueSpec, check_simulation
 
 
 class PhenoSimulation:
@@ -58,7 +88,19 @@ class PhenoSimulation:
 	Designed to be constructed from a JSON/dict simulation configuration.
 	"""
 	
-	def __init__(self, config_dict: Dict, custom_func_node_classes=[]) -> None:
+	def __init__(
+		self,
+		config_dict: Dict,
+		custom_func_node_classes=[],
+		input_cache=True,
+		input_workers=None,
+		dtype_policy=None,
+		sim_workers=1,
+		optimize=True,
+		backend='numpy',
+		seed=None,
+		result_store=False
+	) -> None:
 		""" Initializes the PhenoSimulation object. This object will create the
 		input step, the simulation steps, and the output step from the
 		simulation configuration dict.
@@ -69,12 +111,82 @@ class PhenoSimulation:
 				format.
 			custom_func_node_classes (default []): A list of custom function
 				node classes that can be used in the simulation.
+			input_cache (default True): Whether to cache haplotype values
+				extracted from input sources on disk, or a DiskCache object
+				to use. See InputRunner.
+			input_workers (default None): Max number of input sources to
+				load concurrently. If None, uses the number of CPUs. See
+				InputRunner.
+			dtype_policy (default None): DTypePolicy, preset name, or
+				policy config dict for the dtypes of simulation values.
+				If None, the 'dtype_policy' key of config_dict is used, or
+				the 'wide' preset if it is not set.
+			sim_workers (default 1): Max number of simulation steps to run
+				concurrently in threads. Independent branches of the
+				simulation (e.g. one per gene) then run in parallel. If
+				None, uses the number of CPUs. See ExecutionPlan.run.
+			optimize (default True): Whether to run the graph optimizer
+				on the simulation steps when compiling them (see
+				graph_optimizer). Simulated values are the same either
+				way.
+			backend (default 'numpy'): How simulation steps are run.
+				'numpy' runs one step at a time. 'fused' runs groups of
+				sample-wise steps one block of samples at a time, with
+				generated Numba kernels if Numba is installed, and
+				'blocked' does so with NumPy only (see fused_backend).
+				Runs with n_replicates set always use 'numpy'.
+			seed (default None): Non-negative int seed of the random
+				numbers drawn by simulation steps. Each step draws from its
+				own stream (see random_streams), so results are the same
+				for any sim_workers or backend. If None, the 'seed' key of
+				config_dict is used, and if it is not set, steps use
+				NumPy's global random state (or unseeded generators).
+			result_store (default False): Whether to store the outputs of
+				simulation steps on disk and load them in later runs with
+				the same configuration, input values, and seed, instead of
+				computing them (see result_store). True uses a ResultStore
+				in the input cache (or in a DiskCache with the default
+				location and size if input_cache is not a DiskCache), or a
+				ResultStore object may be given.
 		"""
-		self._setup_input(config_dict)
+		if backend not in ('numpy', 'fused', 'blocked'):
+			raise ValueError(
+				"backend must be one of 'numpy', 'fused', or 'blocked'."
+			)
+
+		self.sim_workers = sim_workers
+		self.optimize = optimize
+		self.backend = backend
+
+		if dtype_policy is None:
+			dtype_policy = config_dict.get('dtype_policy')
+		self._dtype_policy = DTypePolicy.from_config(dtype_policy)
+
+		if seed is None:
+			seed = config_dict.get('seed')
+		self._seed = seed
+
+		self._setup_input(config_dict, input_cache, input_workers)
 		self._setup_simulation_steps(config_dict, custom_func_node_classes)
 
+		if result_store is True:
+			result_store = ResultStore(self.input_runner.input_cache)
+		self.result_store = result_store or None
+
 	@classmethod
-	def from_JSON_file(cls, file_path: str, custom_func_node_classes=[]):
+	def from_JSON_file(
+		cls,
+		file_path: str,
+		custom_func_node_classes=[],
+		input_cache=True,
+		input_workers=None,
+		dtype_policy=None,
+		sim_workers=1,
+		optimize=True,
+		backend='numpy',
+		seed=None,
+		result_store=False
+	):
 		""" Alternative constructor. Creates a PhenoSimulation object from a
 		simulation configuration JSON file. Class method.
 		
@@ -82,6 +194,14 @@ class PhenoSimulation:
 			file_path: Path to the simulation configuration JSON file.
 			custom_func_node_classes (default []): A list of custom function
 				node classes to be used in the simulation.
+			input_cache (default True): See __init__.
+			input_workers (default None): See __init__.
+			dtype_policy (default None): See __init__.
+			sim_workers (default 1): See __init__.
+			optimize (default True): See __init__.
+			backend (default 'numpy'): See __init__.
+			seed (default None): See __init__.
+			result_store (default False): See __init__.
 			
 		Returns:
 			A PhenoSimulation object.
@@ -92,51 +212,108 @@ class PhenoSimulation:
 			config_dict = json.load(f)
 		
 		# Create PhenoSimulation object from dict.
-		return cls(config_dict, custom_func_node_classes)
+		return cls(
+			config_dict,
+			custom_func_node_classes,
+			input_cache,
+			input_workers,
+			dtype_policy,
+			sim_workers,
+			optimize,
+			backend,
+			seed,
+			result_store
+		)
 	
 	@classmethod
 	def from_sim_steps_list(
 		cls,
 		sim_steps: List[AbstractBaseFunctionNode],
-		input_config: Dict = None,
-		output_config: Dict = None
+		input_config: List[Dict] = None,
+		output_config: Dict = None,
+		input_cache=True,
+		input_workers=None,
+		dtype_policy=None,
+		sim_workers=1,
+		optimize=True,
+		backend='numpy',
+		seed=None,
+		result_store=False
 	):
 		""" Alternative constructor. Creates a PhenoSimulation object from a
 		list of simulation steps. Class method.
 		
 		Args:
 			sim_steps: A list of simulation steps.
-			input_config (default {}): A dict containing the input configuration.
+			input_config (default []): A list containing the input
+				configuration.
 			output_config (default {}): A dict containing the output
 				configuration.
+			input_cache (default True): See __init__.
+			input_workers (default None): See __init__.
+			dtype_policy (default None): See __init__. Also applied to
+				sim_steps.
+			sim_workers (default 1): See __init__.
+			optimize (default True): See __init__.
+			backend (default 'numpy'): See __init__.
+			seed (default None): See __init__.
+			result_store (default False): See __init__.
 			
 		Returns:
 			A PhenoSimulation object.
 		"""
 		
 		# Create PhenoSimulation object from dict.
-		sim_obj = cls({
-			'input': input_config,
-			'output': output_config
-		})
+		sim_obj = cls(
+			{
+				'input': [] if input_config is None else input_config,
+				'output': {} if output_config is None else output_config,
+				'simulation_steps': []
+			},
+			input_cache=input_cache,
+			input_workers=input_workers,
+			dtype_policy=dtype_policy,
+			sim_workers=sim_workers,
+			optimize=optimize,
+			backend=backend,
+			seed=seed,
+			result_store=result_store
+		)
 
-		# Set the simulation steps.
-		sim_obj.simulation_steps = sim_steps
+		# Set the simulation steps as if they were built from the config.
+		sim_obj.simulation_steps = list(sim_steps)
+		sim_obj.sim_config = [
+			{'type': type(step).__name__, 'alias': step.alias}
+			for step in sim_steps
+		]
+		for step in sim_obj.simulation_steps:
+			step.dtype_policy = sim_obj.dtype_policy
+		sim_obj._version_aliases()
+		sim_obj._set_random_streams()
 
 		return sim_obj
 	
-	def _setup_input(self, config_dict: Dict) -> None:
+	def _setup_input(
+		self,
+		config_dict: Dict,
+		input_cache=True,
+		input_workers=None
+	) -> None:
 		""" Sets up the input step from the simulation configuration dict.
 		
 		Args:
 			config_dict: A dict containing the simulation configuration.
 				See the documentation for the simulation configuration
 				format.
+			input_cache (default True): See __init__.
+			input_workers (default None): See __init__.
 		"""
 		
 		self.input_config = config_dict['input']
 
-		self.input_runner = InputRunner(self.input_config)
+		self.input_runner = InputRunner(
+			self.input_config, input_cache, input_workers, self.dtype_policy
+		)
 
 	def _setup_simulation_steps(
 		self,
@@ -165,26 +342,194 @@ class PhenoSimulation:
 				self.simulation_steps.append(
 					self.func_node_builder.create_node(node_type, **step_config)
 				)
+				self.simulation_steps[-1].dtype_policy = self.dtype_policy
+
+		self._version_aliases()
+		self._set_random_streams()
 
 		# Track whether the simulation has been run and self.sim_config has
 		# been updated.
 		self.sim_config_updated = False
+		self._config_updated_steps = set()
+
+		# Compiled execution plans by requested outputs
+		self._plans = dict()
+
+		# FusedPlans of compiled execution plans, for the fused backends
+		self._fused_plans = dict()
+
+		# Peak size in bytes of the values held by the last run of the
+		# simulation steps
+		self.peak_live_bytes = None
+
+		# ValueSpecs of the values, set by validate
+		self.value_specs = None
+
+		# Values of the last rerun, the index of the run that drew their
+		# random numbers, and aliases of the steps updated since
+		self._session_vals = None
+		self._session_run_index = None
+		self._stale_aliases = set()
+
+	def _version_aliases(self) -> None:
+		""" Renames simulation steps that are redefined by later steps with
+		the same alias.
+
+		Steps run as if in config order: each step takes input from the
+		latest earlier definition of an alias, and the last definition is
+		the one returned. Earlier definitions are renamed '{alias}#{n}'
+		for the n-th definition, the inputs of the steps using them are
+		renamed to match, and their values are not returned by runs of all
+		steps. Aliases are taken from self.sim_config, so steps rebuilt
+		from their configuration (see update_node) are renamed the same
+		way.
+		"""
+		n_defs = Counter(step_config['alias'] for step_config in self.sim_config)
+		n_seen = Counter()
+		latest = dict()	# alias -> alias of its latest definition so far
+		self._superseded_aliases = set()
+
+		for step, step_config in zip(self.simulation_steps, self.sim_config):
+			step.inputs = _rename_inputs(step.inputs, latest)
+
+			alias = step_config['alias']
+			n_seen[alias] += 1
+			if n_seen[alias] < n_defs[alias]:
+				step.alias = f"{alias}#{n_seen[alias]}"
+				self._superseded_aliases.add(step.alias)
+			latest[alias] = step.alias
+
+	@property
+	def dtype_policy(self) -> DTypePolicy:
+		""" DTypePolicy used for the dtypes of input and function node
+		values. May be set to a DTypePolicy, preset name, or policy config
+		dict, which updates the input sources and simulation steps.
+		"""
+		return self._dtype_policy
+
+	@dtype_policy.setter
+	def dtype_policy(self, dtype_policy) -> None:
+		self._dtype_policy = DTypePolicy.from_config(dtype_policy)
+
+		self.input_runner.dtype_policy = self._dtype_policy
+		for input_source in self.input_runner.input_sources:
+			input_source.dtype_policy = self._dtype_policy
+		for step in self.simulation_steps:
+			step.dtype_policy = self._dtype_policy
+
+		self._session_vals = None
+
+	@property
+	def seed(self):
+		""" Seed of the random numbers drawn by simulation steps, or None.
+		Setting it gives each step that uses random numbers a new stream,
+		so the next run draws the same values as the first run of a new
+		simulation with that seed.
+		"""
+		return self._seed
+
+	@seed.setter
+	def seed(self, seed) -> None:
+		self._seed = seed
+		self._set_random_streams()
+
+		# Plans only order steps that draw from NumPy's global random state
+		self._plans = dict()
+		self._fused_plans = dict()
+		self._session_vals = None
+
+	def _set_random_streams(self) -> None:
+		""" Sets the random_stream of the simulation steps that use random
+		numbers from the seed, and resets the run count.
+		"""
+		for step in self.simulation_steps:
+			if step.uses_random:
+				step.random_stream = (
+					None if self._seed is None
+					else RandomStream(self._seed, step.alias)
+				)
+		self._run_index = 0
+
+	def compile(self, outputs: List[str] = None) -> ExecutionPlan:
+		""" Returns the execution plan of the simulation steps.
+
+		Plans are cached, so compiling again with the same outputs and
+		simulation steps returns the same plan.
+
+		Args:
+			outputs (default None): Aliases of the values to compute. If
+				None, the plan runs all simulation steps.
+
+		Returns:
+			An ExecutionPlan. Its required_inputs are the input node
+			aliases needed to compute outputs.
+		"""
+		if isinstance(outputs, str):
+			outputs = [outputs]
+
+		plan_key = (
+			None if outputs is None else tuple(outputs),
+			tuple(id(step) for step in self.simulation_steps),
+			self.optimize
+		)
 
-	def run_input_step(self) -> ValuesDict:
+		if plan_key not in self._plans:
+			self._plans[plan_key] = ExecutionPlan(
+				self.simulation_steps, outputs, optimize=self.optimize
+			)
+
+		return self._plans[plan_key]
+
+	def validate(self, outputs: List[str] = None) -> Dict[str, ValueSpec]:
+		""" Checks the simulation steps against the input node definitions,
+		without loading input data (see shape_inference).
+
+		Sets the value_specs attribute to the result.
+
+		Args:
+			outputs (default None): Aliases of the values to compute. If
+				None, all steps are checked.
+
+		Returns:
+			Dict of the aliases of all input nodes and checked steps to
+			ValueSpecs of their shapes (without the sample axis) and
+			dtypes.
+
+		Raises:
+			ValueError: Listing every problem found, e.g. unknown aliases
+				or values whose shapes do not broadcast.
+		"""
+		if isinstance(outputs, str):
+			outputs = [outputs]
+
+		self.value_specs = check_simulation(
+			self.input_runner.input_sources, self.simulation_steps, outputs
+		)
+		return self.value_specs
+
+	def run_input_step(self, input_aliases: List[str] = None) -> ValuesDict:
 		""" Run the input step and return the ValuesDict to be passed to the
 		simulation steps.
 
 		Sets the sample_ids attribute to the sample IDs from the input step.
 
+		Args:
+			input_aliases (default None): Aliases of the input nodes to load.
+				If None, all input nodes are loaded.
+
 		Returns:
-			A ValuesDict containing the input values.
+			A ReadOnlyValuesDict containing the input values. It can be
+			copied (without copying the values) to run the simulation
+			steps on the same input values multiple times.
 		"""	
 		if self.input_config is None:
 			self.sample_ids = None
-			return dict()
+			return ReadOnlyValuesDict()
 		else:
-			self.sample_ids, input_node_vals = self.input_runner()
-			return input_node_vals
+			self.sample_ids, input_node_vals = self.input_runner(
+				input_aliases
+			)
+			return ReadOnlyValuesDict(input_node_vals)
 
 	@staticmethod
 	def run_function_node(
@@ -236,43 +581,448 @@ class PhenoSimulation:
 		return vals_dict
 
 	def run_simulation_steps(
-			self, val_dict: ValuesDict
+			self,
+			val_dict: ValuesDict,
+			outputs: List[str] = None,
+			release_inputs: bool = False,
+			n_replicates: int = None
 	):
-		""" Run the simulation steps and optionally the output step. Returns
-		whatever is returned by the last step run.
+		""" Run the simulation steps in the order of the compiled execution
+		plan (see compile).
+
+		Sets the peak_live_bytes attribute to the peak total size of the
+		values held during the run.
 		
+		Values are read-only, so a node that modifies its input values in
+		place raises a ValueError. Node outputs are added to val_dict under
+		new keys.
+
 		Args:
-			val_dict: A ValuesDict containing the input values.
+			val_dict: A ValuesDict containing the input values. If it is
+				not a ReadOnlyValuesDict, it is converted to one (without
+				copying the values) and the new dict is returned.
+			outputs (default None): Aliases of the values to compute. Only
+				the steps these depend on are run, and intermediate values
+				are released as soon as no remaining step uses them. If
+				None, all steps are run and all values are kept.
+			release_inputs (default False): Whether input values in
+				val_dict that are not outputs are also released after their
+				last use. See ExecutionPlan.run.
+			n_replicates (default None): If set, simulates this many
+				replicates at once, and the outputs of the steps have a
+				leading replicate axis. Steps that do not depend on random
+				draws are only run once. See ExecutionPlan.run.
 			
 		Returns:
-			Whatever is returned by the last step run.
+			val_dict with the outputs of the steps run added.
 		"""
-		
+		plan = self.compile(outputs)
+
+		if not isinstance(val_dict, ReadOnlyValuesDict):
+			val_dict = ReadOnlyValuesDict(val_dict)
+
+		# Each run draws new random numbers
+		run_index = self._run_index
+		self._run_index += 1
+
+		return self._run_plan(
+			plan, val_dict, release_inputs, n_replicates, run_index
+		)
+
+	def _run_plan(
+		self,
+		plan: ExecutionPlan,
+		val_dict: ReadOnlyValuesDict,
+		release_inputs: bool,
+		n_replicates: int,
+		run_index: int,
+		sample_offset: int = 0,
+		keep_superseded: bool = False
+	) -> ReadOnlyValuesDict:
+		""" Runs an execution plan with the simulation's backend, with
+		random streams drawing the values of run run_index for the samples
+		from sample_offset on, and updates self.sim_config with random
+		selections of steps run for the first time. See
+		run_simulation_steps.
+
+		Values of steps redefined by later steps (see _version_aliases) are
+		removed after runs of all steps, unless keep_superseded is set.
+		"""
+		for step in plan.steps:
+			if step.random_stream is not None:
+				step.random_stream.start_run(run_index, sample_offset)
+
+		stored_run = None
+		if self.result_store is not None and n_replicates is None:
+			stored_run = self.result_store.start_run(
+				plan,
+				val_dict,
+				{
+					step.alias: step_config for step, step_config
+					in zip(self.simulation_steps, self.sim_config)
+				}
+			)
+
 		# Run simulation steps.
-		for step in self.simulation_steps:
-			val_dict = self.run_function_node(step, val_dict)
+		if self.backend != 'numpy' and n_replicates is None:
+			if plan not in self._fused_plans:
+				self._fused_plans[plan] = FusedPlan(
+					plan, use_numba=None if self.backend == 'fused' else False
+				)
+			fused_plan = self._fused_plans[plan]
+			val_dict = fused_plan.run(
+				val_dict,
+				release_inputs=release_inputs,
+				max_workers=self.sim_workers,
+				stored_run=stored_run
+			)
+			self.peak_live_bytes = fused_plan.peak_live_bytes
+		else:
+			val_dict = plan.run(
+				val_dict,
+				release_inputs=release_inputs,
+				max_workers=self.sim_workers,
+				n_replicates=n_replicates,
+				stored_run=stored_run
+			)
+			self.peak_live_bytes = plan.peak_live_bytes
 
-		# Update self.sim_config if it has not been updated.
+		# Update self.sim_config with random selections of steps run for
+		# the first time.
 		if not self.sim_config_updated:
-			for i in range(len(self.simulation_steps)):
-				self.sim_config[i].update(
-					self.simulation_steps[i].get_config_updates()
-				)
+			# Steps the plan replaced count as run
+			run_aliases = {step.alias for step in plan.steps}
+			run_aliases.update(plan.replaced_aliases)
+			for i, step in enumerate(self.simulation_steps):
+				if (
+					i not in self._config_updated_steps
+					and step.alias in run_aliases
+				):
+					self.sim_config[i].update(step.get_config_updates())
+					self._config_updated_steps.add(i)
 
 			# Update self.sim_config_updated
-			self.sim_config_updated = True
+			self.sim_config_updated = (
+				len(self._config_updated_steps) == len(self.simulation_steps)
+			)
+
+		if plan.outputs is None and not keep_superseded:
+			for alias in self._superseded_aliases:
+				val_dict.pop(alias, None)
 		
 		return val_dict
 	
-	def run_simulation(self):
-		""" Run phenotype simulation. """
+	def run_simulation(self, outputs: List[str] = None):
+		""" Run phenotype simulation.
+
+		The simulation is first checked with validate, so invalid
+		configurations fail before input data is loaded.
+
+		Args:
+			outputs (default None): Aliases of the values to compute (e.g.
+				['phenotype']). Only the input nodes and simulation steps
+				these depend on are loaded and run, though sample ids are
+				still read from every input source. Other values are
+				released once no remaining step uses them. If None,
+				everything is loaded, run, and returned.
+
+		Returns:
+			ValuesDict of the outputs, or of all input and simulation step
+			values if outputs is None.
+		"""
+		# Fail on invalid configurations before loading input data
+		self.validate(outputs)
+
+		input_aliases = None
+		if outputs is not None:
+			input_aliases = self.compile(outputs).required_inputs
 
 		# Run input step.
-		val_dict = self.run_input_step()
+		val_dict = self.run_input_step(input_aliases)
 
 		# Run simulation steps.
-		return self.run_simulation_steps(val_dict)
+		return self.run_simulation_steps(
+			val_dict, outputs, release_inputs=True
+		)
+
+	def run_simulation_chunked(
+		self,
+		outputs: List[str] = None,
+		chunk_size: int = DEFAULT_CHUNK_SIZE
+	) -> Iterator[Tuple[slice, ReadOnlyValuesDict]]:
+		""" Run phenotype simulation on chunks of samples, so only the
+		values of one chunk are held at once (see chunking).
+
+		Steps that scale with statistics over all samples (Heritability,
+		and the MinMaxScaler, StandardScaler, and RobustScaler) have their
+		statistics accumulated over the chunks in earlier passes, then
+		fixed for the final pass. With a seed, outputs are the same as
+		run_simulation's within rounding.
+
+		The simulation is validated and input data is loaded (memory
+		mapped from the input cache, if used) when this is called. Chunks
+		are simulated as the returned iterator is consumed.
+
+		Args:
+			outputs (default None): Aliases of the values to compute. If
+				None, all input and simulation step values are returned
+				for each chunk. See run_simulation.
+			chunk_size (default DEFAULT_CHUNK_SIZE): Number of samples per
+				chunk.
+
+		Returns:
+			Iterator of (samples, vals_dict) tuples, one per chunk, where
+			samples is the slice of self.sample_ids in the chunk and
+			vals_dict is a ValuesDict of the chunk's outputs.
+
+		Raises:
+			ValueError: If a statistics pass runs steps that use random
+				numbers without a random stream (i.e. the simulation has
+				no seed), since every pass must draw the same values, or
+				a population step's input is HaplotypeValues.
+		"""
+		if isinstance(outputs, str):
+			outputs = [outputs]
+		if chunk_size < 1:
+			raise ValueError("chunk_size must be a positive int.")
+
+		# Fail on invalid configurations before loading input data
+		self.validate(outputs)
+
+		plan = self.compile(outputs)
+		stat_passes = []
+		for stat_steps in population_passes(plan):
+			stat_aliases = {
+				step.alias: plan.dependencies[step.alias][0]
+				for step in stat_steps
+			}
+			for alias, input_alias in stat_aliases.items():
+				if self.value_specs[input_alias].haplotype:
+					raise ValueError(
+						f"Step '{alias}' scales HaplotypeValues, which "
+						"chunked runs do not support."
+					)
+
+			pass_plan = self.compile(sorted(set(stat_aliases.values())))
+			unseeded = [
+				step.alias for step in pass_plan.steps
+				if step.uses_random and step.random_stream is None
+			]
+			if unseeded:
+				raise ValueError(
+					f"Steps {unseeded} use random numbers before steps "
+					"that scale with population statistics. Chunked runs "
+					"of such simulations need a seed."
+				)
+			stat_passes.append((pass_plan, stat_steps, stat_aliases))
+
+		input_aliases = None
+		if outputs is not None:
+			input_aliases = plan.required_inputs
+		val_dict = self.run_input_step(input_aliases)
+
+		# All passes draw the random numbers of the same run
+		run_index = self._run_index
+		self._run_index += 1
+
+		return self._run_chunks(
+			plan,
+			stat_passes,
+			val_dict,
+			sample_chunks(len(self.sample_ids), chunk_size),
+			run_index
+		)
+
+	def _run_chunks(
+		self,
+		plan: ExecutionPlan,
+		stat_passes: list,
+		val_dict: ReadOnlyValuesDict,
+		chunks: List[slice],
+		run_index: int
+	) -> Iterator[Tuple[slice, ReadOnlyValuesDict]]:
+		""" Runs the statistics passes and then yields the outputs of plan
+		for each chunk. See run_simulation_chunked.
+
+		Sets the peak_live_bytes attribute to the largest peak of any
+		chunk.
+		"""
+		peak_live_bytes = 0
+
+		def run_chunk(chunk_plan, samples):
+			nonlocal peak_live_bytes
+			chunk_vals = ReadOnlyValuesDict({
+				alias: select_samples(vals, samples)
+				for alias, vals in val_dict.items()
+			})
+			chunk_vals = self._run_plan(
+				chunk_plan,
+				chunk_vals,
+				release_inputs=True,
+				n_replicates=None,
+				run_index=run_index,
+				sample_offset=samples.start
+			)
+			peak_live_bytes = max(peak_live_bytes, self.peak_live_bytes)
+			return chunk_vals
+
+		try:
+			for pass_plan, stat_steps, stat_aliases in stat_passes:
+				accumulators = {
+					step.alias: StatsAccumulator(
+						step.population_stat, step.population_by_row
+					)
+					for step in stat_steps
+				}
+				for samples in chunks:
+					chunk_vals = run_chunk(pass_plan, samples)
+					for alias, input_alias in stat_aliases.items():
+						accumulators[alias].add(chunk_vals[input_alias])
+
+				if chunks:
+					for step in stat_steps:
+						step.fixed_stats = accumulators[step.alias].result()
+
+			for samples in chunks:
+				yield samples, run_chunk(plan, samples)
+			self.peak_live_bytes = peak_live_bytes
+		finally:
+			for _, stat_steps, _ in stat_passes:
+				for step in stat_steps:
+					step.fixed_stats = None
 	
+	def update_node(self, alias: str, **params) -> None:
+		""" Updates parameters of a simulation step, for the next rerun.
+
+		The step is rebuilt from its configuration updated with params,
+		and the configuration in self.sim_config is updated. Random
+		selections of the step saved in its configuration (e.g. the
+		drawn_vals of a RandomConstant) are dropped, so they are made
+		again with the new parameters, unless they are in params.
+
+		Example:
+			sim.rerun()
+			sim.update_node('herit', heritability=0.3)
+			sim.update_node('beta', dist_name='uniform', dist_kwargs={})
+			sim_vals = sim.rerun()	# Only reruns changed values
+
+		Args:
+			alias: Alias of the simulation step to update. Steps redefined
+				by later steps with the same alias are named
+				'{alias}#{n}' (see _version_aliases).
+			**params: Configuration keys of the step to set (e.g.
+				heritability=0.3). May include 'type' to replace the step
+				with another node type.
+		"""
+		for i, step in enumerate(self.simulation_steps):
+			if step.alias == alias:
+				break
+		else:
+			raise ValueError(f"No simulation step has alias '{alias}'.")
+
+		step_config = self.sim_config[i].copy()
+		if i in self._config_updated_steps:
+			for key in step.get_config_updates():
+				if key not in params:
+					step_config.pop(key, None)
+		step_config.update(params)
+
+		node_config = step_config.copy()
+		node_type = node_config.pop('type')
+		new_step = self.func_node_builder.create_node(node_type, **node_config)
+		new_step.dtype_policy = self.dtype_policy
+
+		self.simulation_steps[i] = new_step
+		self.sim_config[i] = step_config
+		self._version_aliases()
+		if new_step.uses_random and self._seed is not None:
+			new_step.random_stream = RandomStream(self._seed, alias)
+
+		self._config_updated_steps.discard(i)
+		self.sim_config_updated = False
+		self._stale_aliases.add(alias)
+
+		# Plans of the old step are no longer used
+		self._plans = dict()
+		self._fused_plans = dict()
+
+	def rerun(self, outputs: List[str] = None) -> ValuesDict:
+		""" Runs the simulation, keeping all values for later reruns. After
+		the first rerun, only the steps updated with update_node (and the
+		steps that depend on them) are run again, and all other values,
+		including input values, are reused.
+
+		Steps that are run again draw the same random numbers as in the
+		first rerun if the simulation has a seed (e.g. only the signal of
+		a phenotype changes when updating an upstream step), and new ones
+		otherwise. Values are kept until the dtype policy or seed is
+		changed, which makes the next rerun run everything.
+
+		Args:
+			outputs (default None): Aliases of the values to return. If
+				None, all input and simulation step values are returned.
+
+		Returns:
+			ReadOnlyValuesDict of the outputs, or of all values.
+		"""
+		if self._session_vals is None:
+			self.validate()
+			self._session_run_index = self._run_index
+			self._run_index += 1
+			steps = self.simulation_steps
+			val_dict = self.run_input_step()
+		else:
+			stale = self._get_downstream_aliases(self._stale_aliases)
+			steps = [
+				step for step in self.simulation_steps if step.alias in stale
+			]
+			val_dict = ReadOnlyValuesDict({
+				alias: vals for alias, vals in self._session_vals.items()
+				if alias not in stale
+			})
+
+		plan_key = ('rerun', tuple(id(step) for step in steps), self.optimize)
+		if plan_key not in self._plans:
+			self._plans[plan_key] = ExecutionPlan(steps, optimize=self.optimize)
+
+		self._session_vals = self._run_plan(
+			self._plans[plan_key],
+			val_dict,
+			release_inputs=False,
+			n_replicates=None,
+			run_index=self._session_run_index,
+			keep_superseded=True
+		)
+		self._stale_aliases = set()
+
+		if outputs is None:
+			return ReadOnlyValuesDict({
+				alias: vals for alias, vals in self._session_vals.items()
+				if alias not in self._superseded_aliases
+			})
+		return ReadOnlyValuesDict({
+			alias: self._session_vals[alias] for alias in outputs
+		})
+
+	def _get_downstream_aliases(self, aliases) -> set:
+		""" Returns aliases and the aliases of the simulation steps that
+		depend on them.
+		"""
+		users = dict()
+		for step in self.simulation_steps:
+			for input_alias in ExecutionPlan.get_input_aliases(step):
+				users.setdefault(input_alias, []).append(step.alias)
+
+		downstream = set()
+		to_visit = list(aliases)
+		while to_visit:
+			alias = to_visit.pop()
+			if alias not in downstream:
+				downstream.add(alias)
+				to_visit.extend(users.get(alias, []))
+
+		return downstream
+
 	@staticmethod
 	def vals_dict_to_dataframe(vals_dict: ValuesDict) -> pd.DataFrame:
 		""" Convert a ValuesDict to a pandas DataFrame. 
@@ -293,10 +1043,20 @@ class PhenoSimulation:
 
 			Two length tuple of 2D arrays: Converted to 2*n_rows columns
 				with names that are '{key}*-*{a/b}*-*{row_index}'.
+
+		PackedValues are unpacked first.
 		"""
 		df_dict = dict()
 
 		for key, vals in vals_dict.items():
+			if isinstance(vals, PackedValues):
+				vals = vals.unpack()
+			elif isinstance(vals, tuple):
+				vals = tuple(
+					v.unpack() if isinstance(v, PackedValues) else v
+					for v in vals
+				)
+
 			# 1D or 2D array
 			if isinstance(vals, np.ndarray):
 				if vals.ndim == 1:
@@ -432,10 +1192,15 @@ class PhenoSimulation:
 	
 	def get_config(self) -> dict:
 		""" Get the simulation configuration. """
-		return {
+		config = {
 			"input": self.input_runner.get_config(),
 			"simulation_steps": self.sim_config
 		}
+		if self.dtype_policy != DTypePolicy():
+			config["dtype_policy"] = self.dtype_policy.to_config()
+		if self.seed is not None:
+			config["seed"] = self.seed
+		return config
 
 	def save_output(
 		self,
@@ -489,13 +1254,63 @@ class PhenoSimulation:
 
 		# Save simulation configuration.
 		if include_config:
-			with open(os.path.join(output_dir, output_config_name), 'w') as f:
-				json.dump(
-					self.get_config(),
+			self._save_config(output_dir, output_config_name)
+
+	def save_output_chunked(
+		self,
+		output_chunks: Iterator[Tuple[slice, ValuesDict]],
+		include_config: bool = True,
+		output_dir='.',
+		output_file_name='output.csv',
+		output_config_name='sim_config.json',
+		sep=',',
+		add_sample_ids=True,
+	):
+		""" Save the outputs of run_simulation_chunked to a file, writing
+		each chunk as it is simulated.
+
+		The file has the same columns and rows as with save_output. The
+		simulation configuration is saved after all chunks are written, so
+		it includes the random selections made.
+
+		Args:
+			output_chunks: Iterator of (samples, vals_dict) tuples, as
+				returned by run_simulation_chunked.
+			include_config, output_dir, output_file_name,
+			output_config_name, sep, add_sample_ids: See save_output.
+		"""
+
+		# Check if output directory exists.
+		if not os.path.exists(output_dir):
+			os.makedirs(output_dir)
+
+		with open(os.path.join(output_dir, output_file_name), 'w') as f:
+			for i, (samples, chunk_vals) in enumerate(output_chunks):
+				chunk_vals = chunk_vals.copy()
+
+				if add_sample_ids:
+					chunk_vals['sample_id'] = self.sample_ids[samples]
+
+				self.vals_dict_to_dataframe(chunk_vals).to_csv(
 					f,
-					indent=4
+					sep=sep,
+					index=False,
+					header=i == 0
 				)
 
+		# Save simulation configuration.
+		if include_config:
+			self._save_config(output_dir, output_config_name)
+
+	def _save_config(self, output_dir: str, output_config_name: str) -> None:
+		""" Save the simulation configuration as a JSON file. """
+		with open(os.path.join(output_dir, output_config_name), 'w') as f:
+			json.dump(
+				self.get_config(),
+				f,
+				indent=4
+			)
+
 
 	def estimate_heritability(
 		self,
@@ -532,43 +1347,30 @@ class PhenoSimulation:
 				n_samples,
 				replace=False
 			)
-			
-			for key, val in input_vals.items():
-				if isinstance(val, tuple):
-					input_vals[key] = (
-						val[0][..., selected_idx], val[1][..., selected_idx]
-					)
-				else:
-					input_vals[key] = val[..., selected_idx]
 		elif n_samples < 1:
 			selected_idx = np.random.choice(
 				len(self.sample_ids),
 				int(n_samples * len(self.sample_ids)),
 				replace=False
 			)
-			
-			for key, val in input_vals.items():
-				if isinstance(val, tuple):
-					input_vals[key] = (
-						val[0][..., selected_idx], val[1][..., selected_idx]
-					)
-				else:
-					input_vals[key] = val[..., selected_idx]
+		else:
+			selected_idx = None
+
+		if selected_idx is not None:
+			input_vals = ReadOnlyValuesDict({
+				key: select_samples(val, selected_idx)
+				for key, val in input_vals.items()
+			})
 		
 		# Estimate heritability.
 
-		# Step 1: Run simulation n_replicates times.
-		pheno_vals = []
-
-		for i in range(n_replicates):
-			pheno_vals.append(
-				self.run_simulation_steps(
-					copy.deepcopy(input_vals)
-				)[phenotype_alias]
-			)
-
-		# Convert to matrix where rows are replicates and columns are samples.
-		pheno_vals = np.vstack(pheno_vals).astype(float)
+		# Step 1: Run simulation n_replicates times, as one batch. Matrix
+		# where rows are replicates and columns are samples.
+		pheno_vals = self.run_simulation_steps(
+			ReadOnlyValuesDict(input_vals),
+			outputs=[phenotype_alias],
+			n_replicates=n_replicates
+		)[phenotype_alias].astype(float)
 
 		# Step 2: Compute total variance.
 		total_var = np.var(pheno_vals)
@@ -589,3 +1391,20 @@ class PhenoSimulation:
 		return heritability
 
 
+
+
+def _rename_inputs(inputs, aliases: Dict[str, str]):
+	""" Returns a function node's inputs attribute (None, str, list, or
+	dict, see AbstractBaseFunctionNode) with the input aliases that are
+	keys of aliases renamed to their values.
+	"""
+	if isinstance(inputs, str):
+		return aliases.get(inputs, inputs)
+	if isinstance(inputs, list):
+		return [_rename_inputs(alias, aliases) for alias in inputs]
+	if isinstance(inputs, dict):
+		return {
+			name: _rename_inputs(alias, aliases)
+			for name, alias in inputs.items()
+		}
+	return inputs
@@ -0,0 +1,330 @@
+""" Population statistics of simulation values, shared by the nodes that
+scale values using statistics over samples (Heritability and the scalers).
+
+Statistics are computed over the last (sample) axis of each row, or over
+all values, and returned with kept dimensions so they broadcast against
+the values:
+
+	- mean_std: Mean and standard deviation. The mean is computed once
+		and the centered values are reused for the variance (np.std
+		computes the mean again).
+	- min_max: Minimum and maximum.
+	- median_iqr: Median and interquartile range, from a single
+		np.partition of the values at the needed order statistics instead
+		of sorting them once for the median and again for each quartile.
+
+Results are the same as the corresponding NumPy functions (for the IQR,
+the difference of the 75th and 25th np.percentile), except that the IQR
+of float32 values is computed in float32.
+
+While a memoize() block is active (e.g. while an ExecutionPlan runs), the
+results are memoized per array, so nodes that use statistics of the same
+values (e.g. a StandardScaler and a Heritability node with the same input)
+compute them once. Values must not be modified in place within the block,
+which holds for the read-only values of a run.
+
+For values too large to hold at once (see
+PhenoSimulation.run_simulation_chunked), a StatsAccumulator computes the
+same statistics from chunks of samples. Means and standard deviations are
+merged with the pairwise update of Chan et al., and minimums and maximums
+directly. Medians and IQRs are not mergeable, so their accumulator keeps
+the values (of the input being scaled, not of all simulation values).
+
+Example:
+	with memoize():
+		mean, std = mean_std(vals)	# (n_feats, 1) arrays
+		mean, std = mean_std(vals)	# Memoized
+
+	acc = StatsAccumulator('mean_std')
+	for chunk in (vals[:, :1000], vals[:, 1000:]):
+		acc.add(chunk)
+	mean, std = acc.result()	# As mean_std(vals), within rounding
+"""
+
+from contextlib import contextmanager
+import threading
+import weakref
+
+import numpy as np
+
+from pheno_sim.data_types import _root_array
+
+
+_memo_lock = threading.Lock()
+_memo_depth = 0
+_memo = dict()
+
+
+@contextmanager
+def memoize():
+	""" Context manager that memoizes statistics within the block. Blocks
+	may be nested and used from several threads. The memo is cleared when
+	the outermost block exits.
+	"""
+	global _memo_depth
+
+	with _memo_lock:
+		_memo_depth += 1
+	try:
+		yield
+	finally:
+		with _memo_lock:
+			_memo_depth -= 1
+			if _memo_depth == 0:
+				_memo.clear()
+
+
+def mean_std(vals, by_row: bool = True):
+	""" Returns the mean and (population) standard deviation of vals, as
+	np.mean and np.std with keepdims=True.
+
+	Args:
+		vals: Array of values.
+		by_row (default True): Whether to compute statistics over the last
+			axis (i.e. for each row of a matrix) or over all values.
+
+	Returns:
+		Tuple of (mean, std) read-only arrays.
+	"""
+	return _memoized('mean_std', vals, by_row, _mean_std)
+
+
+def min_max(vals, by_row: bool = True):
+	""" Returns the minimum and maximum of vals, as np.min and np.max with
+	keepdims=True. See mean_std for args.
+
+	Returns:
+		Tuple of (min, max) read-only arrays.
+	"""
+	return _memoized('min_max', vals, by_row, _min_max)
+
+
+def median_iqr(vals, by_row: bool = True):
+	""" Returns the median and interquartile range of vals, as np.median
+	and np.percentile (linear interpolation) with keepdims=True. See
+	mean_std for args.
+
+	Returns:
+		Tuple of (median, iqr) read-only arrays.
+	"""
+	return _memoized('median_iqr', vals, by_row, _median_iqr)
+
+
+# Statistics by name, e.g. for AbstractBaseFunctionNode.population_stat
+STATISTICS = {
+	'mean_std': mean_std,
+	'min_max': min_max,
+	'median_iqr': median_iqr
+}
+
+
+class StatsAccumulator:
+	""" Accumulates a statistic (see STATISTICS) of values over chunks of
+	samples, for values too large to hold at once.
+
+	Chunks are added in sample order with add(), and result() returns the
+	statistic of all samples added, with the same shapes and dtypes as
+	computing it on the concatenated values.
+
+	Args:
+		name: Name of the statistic, a key of STATISTICS.
+		by_row (default True): See mean_std.
+	"""
+
+	def __init__(self, name: str, by_row: bool = True):
+		if name not in STATISTICS:
+			raise ValueError(
+				f"Unknown statistic '{name}'. Must be one of "
+				f"{list(STATISTICS)}."
+			)
+		self.name = name
+		self.by_row = by_row
+		self._axis = -1 if by_row else None
+		self._dtype = None
+		self._stats = None
+		self._chunks = []
+
+	def add(self, vals) -> None:
+		""" Adds the values of a chunk of samples. """
+		vals = np.asarray(vals)
+		if self._dtype is None:
+			# The dtype the statistics of all values would have
+			self._dtype = STATISTICS[self.name](vals[..., :1])[0].dtype
+
+		if self.name == 'median_iqr':
+			# Copied, so views do not keep the rest of a chunk's values
+			self._chunks.append(vals.copy())
+			return
+
+		if self.name == 'min_max':
+			stats = _min_max(vals, self._axis)
+			if self._stats is not None:
+				stats = (
+					np.minimum(self._stats[0], stats[0]),
+					np.maximum(self._stats[1], stats[1])
+				)
+			self._stats = stats
+			return
+
+		# Count, mean, and sum of squared deviations, in float64
+		vals = vals.astype(np.float64, copy=False)
+		count = vals.shape[-1] if self.by_row else vals.size
+		mean = np.mean(vals, axis=self._axis, keepdims=True)
+		centered = vals - mean
+		m2 = np.sum(centered * centered, axis=self._axis, keepdims=True)
+
+		if self._stats is not None:
+			prev_count, prev_mean, prev_m2 = self._stats
+			total = prev_count + count
+			delta = mean - prev_mean
+			mean = prev_mean + delta * (count / total)
+			m2 = prev_m2 + m2 + delta * delta * (prev_count * count / total)
+			count = total
+		self._stats = (count, mean, m2)
+
+	def result(self) -> tuple:
+		""" Returns the statistic of all values added, as read-only arrays.
+		"""
+		if self._dtype is None:
+			raise ValueError("No values were added.")
+
+		if self.name == 'median_iqr':
+			vals = np.concatenate(self._chunks, axis=-1)
+			return _read_only(_median_iqr(vals, self._axis))
+
+		if self.name == 'min_max':
+			return _read_only(self._stats)
+
+		count, mean, m2 = self._stats
+		return _read_only((
+			mean.astype(self._dtype),
+			np.sqrt(m2 / count).astype(self._dtype)
+		))
+
+
+def _memoized(name: str, vals, by_row: bool, compute):
+	""" Returns compute(vals, axis), memoized by the memory, shape, and
+	dtype of vals if a memoize() block is active.
+	"""
+	vals = np.asarray(vals)
+	axis = -1 if by_row else None
+
+	if _memo_depth == 0:
+		return _read_only(compute(vals, axis))
+
+	root = _root_array(vals)
+	try:
+		root_ref = weakref.ref(root)
+	except TypeError:
+		return _read_only(compute(vals, axis))
+
+	# Strides of size 1 axes do not change which values are used
+	key = (
+		name,
+		axis,
+		vals.__array_interface__['data'][0],
+		vals.shape,
+		tuple(
+			stride if size > 1 else 0
+			for size, stride in zip(vals.shape, vals.strides)
+		),
+		vals.dtype.str
+	)
+
+	with _memo_lock:
+		entry = _memo.get(key)
+	# The memory may belong to a new array if the memoized one was freed
+	if entry is not None and entry[0]() is root:
+		return entry[1]
+
+	result = _read_only(compute(vals, axis))
+	with _memo_lock:
+		if _memo_depth > 0:
+			_memo[key] = (root_ref, result)
+	return result
+
+
+def _read_only(arrays):
+	for arr in arrays:
+		arr.flags.writeable = False
+	return arrays
+
+
+def _mean_std(vals, axis):
+	mean = np.mean(vals, axis=axis, keepdims=True)
+	centered = np.asarray(vals - mean)
+	var = np.mean(
+		np.multiply(centered, centered, out=centered),
+		axis=axis,
+		keepdims=True
+	)
+	return mean, np.sqrt(var)
+
+
+def _min_max(vals, axis):
+	return (
+		np.min(vals, axis=axis, keepdims=True),
+		np.max(vals, axis=axis, keepdims=True)
+	)
+
+
+def _median_iqr(vals, axis):
+	if axis is None:
+		rows = vals.reshape(1, -1)
+	else:
+		rows = vals.reshape(-1, vals.shape[-1])
+	n = rows.shape[-1]
+
+	# Positions of the order statistics for the median and for the 25th
+	# and 75th percentiles (linear interpolation, as np.percentile)
+	# (virtual indices computed as np.percentile does, for the same
+	# rounding)
+	median_idx = [(n - 1) // 2, n // 2]
+	quartiles = [n * q + (1 - q) - 1 for q in (0.25, 0.75)]
+	quartile_idx = [
+		idx for q in quartiles for idx in (int(q), min(int(q) + 1, n - 1))
+	]
+
+	# The last position is included so NaN values (sorted last) are found
+	part = np.partition(
+		rows, sorted(set(median_idx + quartile_idx + [n - 1])), axis=-1
+	)
+
+	if n % 2 == 1:
+		median = np.mean(
+			part[:, median_idx[0]:median_idx[0] + 1], axis=-1, keepdims=True
+		)
+	else:
+		median = np.mean(
+			part[:, median_idx[0]:median_idx[1] + 1], axis=-1, keepdims=True
+		)
+
+	q25, q75 = [
+		_lerp(
+			part[:, int(q):int(q) + 1],
+			part[:, min(int(q) + 1, n - 1):min(int(q) + 1, n - 1) + 1],
+			q - int(q)
+		)
+		for q in quartiles
+	]
+	iqr = np.subtract(q75, q25)
+
+	if np.issubdtype(part.dtype, np.inexact):
+		has_nan = np.isnan(part[:, -1:])
+		if has_nan.any():
+			median = np.where(has_nan, np.nan, median)
+			iqr = np.where(has_nan, np.nan, iqr)
+
+	if axis is None:
+		shape = (1,) * vals.ndim
+	else:
+		shape = vals.shape[:-1] + (1,)
+	return median.reshape(shape), iqr.reshape(shape)
+
+
+def _lerp(a, b, t: float):
+	""" Linear interpolation between a and b, as in np.percentile. """
+	diff_b_a = np.subtract(b, a)
+	if t >= 0.5:
+		return np.subtract(b, diff_b_a * (1 - t))
+	return np.add(a, diff_b_a * t)
@@ -0,0 +1,179 @@
+""" Seeded random number streams for function nodes that draw random
+numbers.
+
+Each node gets its own RandomStream, derived from the simulation seed and
+the node's alias, so the values a node draws do not depend on which other
+nodes are run or in what order. Streams use counter-based Philox bit
+generators keyed with SeedSequence spawn keys:
+
+	(alias key, run index, call index, sample block)
+
+where the run index counts the runs of the simulation, the call index
+counts the draws of the node within a run (e.g. once per replicate), and
+sample blocks are fixed, global ranges of SAMPLE_BLOCK_SIZE samples. The
+values drawn for a sample therefore only depend on its global index, so
+drawing the values for a range of samples (see start_run's sample_offset)
+gives the same values as drawing them for all samples and slicing, and
+blocks can be drawn concurrently.
+
+Example:
+	stream = RandomStream(42, 'noise')
+	stream.start_run(0)
+	vals = stream.draw('normal', (3, 10000), {'scale': 2})
+
+	# Same values, drawn for samples 5000 onwards only
+	stream.start_run(0, sample_offset=5000)
+	vals[:, 5000:] == stream.draw('normal', (3, 5000), {'scale': 2})
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+
+import numpy as np
+
+
+# Number of samples per stream block. Changing this changes drawn values.
+SAMPLE_BLOCK_SIZE = 4096
+
+# Minimum number of values in a draw to draw blocks in threads
+PARALLEL_MIN_SIZE = 2**20
+
+
+class RandomStream:
+	""" Random number stream of a function node.
+
+	Attributes:
+		seed: Simulation seed (non-negative int).
+		alias: Alias of the node the stream is for.
+		run_index: Index of the current run.
+		sample_offset: Global index of the first sample of the values drawn
+			in the current run.
+		max_workers: Max number of threads used for large draws. If None,
+			uses the number of CPUs.
+	"""
+
+	def __init__(self, seed: int, alias: str, max_workers: int = None):
+		if int(seed) < 0:
+			raise ValueError("seed must be a non-negative int.")
+
+		self.seed = int(seed)
+		self.alias = alias
+		self.max_workers = max_workers
+
+		digest = hashlib.sha256(alias.encode('utf-8')).digest()
+		self._key = tuple(
+			int.from_bytes(digest[i:i + 4], 'little') for i in range(0, 16, 4)
+		)
+
+		self.start_run(0)
+
+	def start_run(self, run_index: int, sample_offset: int = 0) -> None:
+		""" Starts a run, resetting the call index.
+
+		Args:
+			run_index: Index of the run. Runs with the same index draw the
+				same values.
+			sample_offset (default 0): Global index of the first sample of
+				the values drawn, for runs on a range of samples.
+		"""
+		self.run_index = run_index
+		self.sample_offset = sample_offset
+		self._call_index = 0
+
+	def draw(
+		self,
+		dist_name: str,
+		shape,
+		dist_kwargs: dict = None,
+		by_sample: bool = True
+	) -> np.ndarray:
+		""" Draws values from a numpy.random.Generator distribution.
+
+		Args:
+			dist_name: Name of the Generator method (e.g. 'normal').
+			shape: Shape of the values, with samples on the last axis.
+			dist_kwargs (default None): Keyword arguments of the
+				distribution, other than size. Array arguments must be
+				constant along the sample axis.
+			by_sample (default True): Whether the last axis is the sample
+				axis. If False (e.g. for constants drawn once), the values
+				are drawn from a single generator and do not depend on
+				sample_offset.
+
+		Returns:
+			Array of drawn values of the given shape.
+		"""
+		shape = tuple(shape)
+		dist_kwargs = dict() if dist_kwargs is None else dist_kwargs
+		call_key = self._key + (self.run_index, self._call_index)
+		self._call_index += 1
+
+		if not by_sample or len(shape) == 0:
+			return getattr(self._generator(call_key), dist_name)(
+				size=shape, **dist_kwargs
+			)
+
+		# Values are drawn sample-major, with array arguments broadcast
+		# over the other axes
+		lead_shape = shape[:-1]
+		dist_kwargs = {
+			name: (
+				np.broadcast_to(value, lead_shape + (1,))[..., 0]
+				if np.ndim(value) > 0 else value
+			)
+			for name, value in dist_kwargs.items()
+		}
+
+		start = self.sample_offset
+		stop = start + shape[-1]
+		blocks = range(
+			start // SAMPLE_BLOCK_SIZE, -(-stop // SAMPLE_BLOCK_SIZE)
+		)
+		if len(blocks) == 0:
+			return getattr(self._generator(call_key), dist_name)(
+				size=shape, **dist_kwargs
+			)
+
+		def draw_block(block: int) -> tuple:
+			block_start = block * SAMPLE_BLOCK_SIZE
+			lo = max(start, block_start)
+			hi = min(stop, block_start + SAMPLE_BLOCK_SIZE)
+
+			# Values of earlier samples in the block are drawn and dropped,
+			# so each sample's values do not depend on the range drawn
+			vals = getattr(self._generator(call_key + (block,)), dist_name)(
+				size=(hi - block_start,) + lead_shape, **dist_kwargs
+			)
+			return lo - start, hi - start, vals[lo - block_start:]
+
+		def store(block_vals) -> None:
+			lo, hi, vals = block_vals
+			out[..., lo:hi] = np.moveaxis(vals, 0, -1)
+
+		# The first block gives the dtype of the values
+		first = draw_block(blocks[0])
+		out = np.empty(shape, dtype=first[2].dtype)
+		store(first)
+
+		max_workers = self.max_workers or os.cpu_count() or 1
+		if (
+			len(blocks) > 2
+			and max_workers > 1
+			and np.prod(shape) >= PARALLEL_MIN_SIZE
+		):
+			with ThreadPoolExecutor(
+				max_workers=min(max_workers, len(blocks) - 1)
+			) as executor:
+				for block_vals in executor.map(draw_block, blocks[1:]):
+					store(block_vals)
+		else:
+			for block in blocks[1:]:
+				store(draw_block(block))
+
+		return out
+
+	def _generator(self, spawn_key: tuple) -> np.random.Generator:
+		return np.random.Generator(np.random.Philox(
+			np.random.SeedSequence(self.seed, spawn_key=spawn_key)
+		))
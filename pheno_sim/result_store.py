@@ -0,0 +1,296 @@
+""" Persistent on-disk store of simulation step outputs, so rerunning a
+simulation with the same configuration, input data, and seed loads step
+outputs instead of computing them.
+
+Outputs are stored in a DiskCache (see disk_cache), so they are loaded as
+read-only memory maps and share the cache's size limit and least recently
+used eviction with cached input values. Each step output is stored under
+a fingerprint of everything that determines it:
+
+	- The step's configuration (without its alias), including its random
+		selections (see AbstractBaseFunctionNode.get_config_updates).
+	- The fingerprints of its inputs. Outputs of other steps use their
+		own fingerprints, and other values (e.g. input node values) a hash
+		of their contents.
+	- The dtype policy, and the version of the package.
+	- For steps that use random numbers, their random stream (seed, alias,
+		run, and sample offset). Steps that use random numbers without a
+		random stream (i.e. in simulations without a seed) are not
+		deterministic, so they and all steps that depend on them are not
+		stored.
+	- For steps with fixed population statistics (in chunked runs, see
+		PhenoSimulation.run_simulation_chunked), a hash of the statistics,
+		which depend on all samples rather than only on the step's inputs.
+
+Steps whose outputs are cheap to compute, i.e. broadcast constants and
+steps run on compact values (see graph_optimizer), are not stored, though
+their fingerprints are used by the steps that depend on them.
+
+Example:
+	sim = PhenoSimulation(config, seed=42, result_store=True)
+	sim.run_simulation()	# Computes and stores step outputs
+	sim = PhenoSimulation(config, seed=42, result_store=True)
+	sim.run_simulation()	# Loads step outputs
+"""
+
+import hashlib
+import json
+import threading
+
+import numpy as np
+
+import pheno_sim
+from pheno_sim.data_types import (
+	PackedValues, StackedHaplotypes, stack_haplotypes
+)
+from pheno_sim.disk_cache import DiskCache, make_key
+
+
+class ResultStore:
+	""" Store of simulation step outputs in a DiskCache.
+
+	Attributes:
+		cache: DiskCache the outputs are stored in.
+		hits: Number of step outputs loaded from the store.
+		misses: Number of step outputs computed and stored.
+
+	Args:
+		cache (default None): DiskCache to store outputs in. If None, a
+			DiskCache with the default location and size is used (the
+			same as for input values).
+	"""
+
+	def __init__(self, cache: DiskCache = None):
+		self.cache = DiskCache() if cache is None else cache
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+
+	def start_run(self, plan, vals_dict, step_configs: dict) -> 'StoredRun':
+		""" Returns a StoredRun for running an ExecutionPlan.
+
+		Args:
+			plan: The ExecutionPlan to run.
+			vals_dict: ValuesDict the plan is run with.
+			step_configs: Dict of step aliases to their configuration
+				dicts. Steps without a configuration are not stored.
+		"""
+		return StoredRun(self, plan, vals_dict, step_configs)
+
+	def get(self, key: str):
+		""" Returns the stored values for a key, or None. """
+		cached = self.cache.get(key)
+		if cached is None:
+			return None
+		arrays, layout = cached
+		try:
+			return _from_layout(layout, arrays)
+		except (KeyError, TypeError, ValueError):
+			return None
+
+	def put(self, key: str, vals) -> None:
+		""" Stores values under a key. Values that are not arrays,
+		HaplotypeValues, or PackedValues are not stored.
+		"""
+		arrays = dict()
+		layout = _to_layout(vals, arrays)
+		if layout is not None:
+			self.cache.put(key, arrays, metadata=layout)
+
+	@staticmethod
+	def values_fingerprint(vals):
+		""" Returns a hash of the contents of Values, HaplotypeValues, or
+		PackedValues, or None for other objects.
+		"""
+		hasher = hashlib.sha256()
+		arrays = dict()
+		layout = _to_layout(vals, arrays)
+		if layout is None:
+			return None
+
+		hasher.update(json.dumps(layout, sort_keys=True).encode())
+		for name in sorted(arrays):
+			arr = arrays[name]
+			if arr.ndim == 0 or arr.flags.c_contiguous:
+				hasher.update(np.ascontiguousarray(arr))
+			else:
+				# Hash row by row so large views are not copied at once
+				for idx in np.ndindex(arr.shape[:-1]):
+					hasher.update(np.ascontiguousarray(arr[idx]))
+		return hasher.hexdigest()
+
+
+class StoredRun:
+	""" Fingerprints the steps of one run of an ExecutionPlan and loads
+	or stores their outputs (see ResultStore.start_run).
+
+	Outputs of steps are fingerprinted when they are computed or loaded,
+	and values that are not step outputs when first used.
+
+	Methods:
+		call(i, compute): Returns the output of step i, loaded from the
+			store or computed with compute() and stored.
+		add_fingerprint(i): Fingerprints the output of step i when it is
+			computed without call (e.g. in a fused group).
+	"""
+
+	def __init__(
+		self,
+		result_store: ResultStore,
+		plan,
+		vals_dict,
+		step_configs: dict
+	):
+		self.result_store = result_store
+		self.plan = plan
+		self.vals_dict = vals_dict
+		self.step_configs = step_configs
+		self.fingerprints = dict()
+		self._lock = threading.Lock()
+
+	def call(self, i: int, compute):
+		""" Returns the output of step i, loaded from the store if it was
+		stored, otherwise computed with compute() (and stored if the step
+		is deterministic).
+		"""
+		node = self.plan.steps[i]
+		if (
+			node.broadcast_constant
+			or node.alias in self.plan.compact_aliases
+		):
+			vals = compute()
+			self.add_fingerprint(i)
+			return vals
+
+		key = self._step_fingerprint(i)
+		if key is not None:
+			vals = self.result_store.get(key)
+			if vals is not None:
+				with self.result_store._lock:
+					self.result_store.hits += 1
+				self.fingerprints[node.alias] = key
+				return vals
+
+		vals = compute()
+		if key is not None:
+			self.result_store.put(key, vals)
+			with self.result_store._lock:
+				self.result_store.misses += 1
+		self.fingerprints[node.alias] = key
+		return vals
+
+	def add_fingerprint(self, i: int) -> None:
+		""" Sets the fingerprint of the output of step i, which is computed
+		without call. Must be called while its inputs are in vals_dict.
+		"""
+		alias = self.plan.steps[i].alias
+		self.fingerprints[alias] = self._step_fingerprint(i)
+
+	def _step_fingerprint(self, i: int):
+		""" Returns the fingerprint of the output of step i, or None if it
+		is not deterministic or has no configuration.
+		"""
+		node = self.plan.steps[i]
+		config = self.step_configs.get(node.alias)
+		if config is None:
+			return None
+
+		stream = None
+		if node.uses_random:
+			if node.random_stream is None:
+				return None
+			stream = [
+				node.random_stream.seed,
+				node.random_stream.alias,
+				node.random_stream.run_index,
+				node.random_stream.sample_offset
+			]
+
+		stats = None
+		if node.fixed_stats is not None:
+			stats = ResultStore.values_fingerprint(tuple(node.fixed_stats))
+			if stats is None:
+				return None
+
+		# In the order of the step's inputs in its configuration
+		input_fingerprints = [
+			self._value_fingerprint(alias)
+			for alias in self.plan.dependencies[node.alias]
+		]
+		if None in input_fingerprints:
+			return None
+
+		config = {**config, **node.get_config_updates()}
+		config.pop('alias', None)
+
+		return make_key(
+			'step_output',
+			pheno_sim.__version__,
+			f"{type(node).__module__}.{type(node).__qualname__}",
+			config,
+			input_fingerprints,
+			node.dtype_policy.to_config(),
+			stream,
+			stats
+		)
+
+	def _value_fingerprint(self, alias: str):
+		""" Returns the fingerprint of the value of alias used as input. """
+		if alias in self.fingerprints:
+			return self.fingerprints[alias]
+
+		with self._lock:
+			if alias not in self.fingerprints:
+				self.fingerprints[alias] = ResultStore.values_fingerprint(
+					self.vals_dict.get(alias)
+				)
+			return self.fingerprints[alias]
+
+
+def _to_layout(vals, arrays: dict):
+	""" Adds the arrays of vals to arrays, and returns a JSON serializable
+	layout to rebuild vals from them, or None if vals cannot be stored.
+
+	Broadcast axes (e.g. of Constant outputs) are stored with size 1.
+	"""
+	if isinstance(vals, StackedHaplotypes):
+		layout = _to_layout(stack_haplotypes(vals), arrays)
+		return None if layout is None else {'stacked': layout}
+	if isinstance(vals, tuple):
+		layouts = [_to_layout(v, arrays) for v in vals]
+		return None if None in layouts else {'tuple': layouts}
+	if isinstance(vals, PackedValues):
+		layout = _to_layout(vals.bits, arrays)
+		return None if layout is None else {
+			'packed': layout,
+			'n_feats': vals.n_feats,
+			'is_vector': vals.is_vector
+		}
+	if isinstance(vals, np.ndarray) and vals.dtype != object:
+		name = str(len(arrays))
+		compact = vals[tuple(
+			slice(0, 1) if stride == 0 and size > 1 else slice(None)
+			for size, stride in zip(vals.shape, vals.strides)
+		)]
+		arrays[name] = compact
+		return {'array': name, 'shape': list(vals.shape)}
+	return None
+
+
+def _from_layout(layout: dict, arrays: dict):
+	""" Rebuilds values stored with _to_layout. """
+	if 'stacked' in layout:
+		return StackedHaplotypes(_from_layout(layout['stacked'], arrays))
+	if 'tuple' in layout:
+		return tuple(_from_layout(sub, arrays) for sub in layout['tuple'])
+	if 'packed' in layout:
+		return PackedValues(
+			_from_layout(layout['packed'], arrays),
+			layout['n_feats'],
+			layout['is_vector']
+		)
+	arr = arrays[layout['array']]
+	shape = tuple(layout['shape'])
+	if arr.shape != shape:
+		arr = np.broadcast_to(arr, shape)
+	return arr
@@ -29,7 +29,7 @@ class SHAPWrapper:
 		"""
 		X = pd.DataFrame(X, columns=self.column_names)
 		vals_dict = self.simulation.dataframe_to_vals_dict(X)
-		return self.simulation.run_simulation_steps(vals_dict)[
-			self.phenotype
-		].astype(float)
+		return self.simulation.run_simulation_steps(
+			vals_dict, outputs=[self.phenotype]
+		)[self.phenotype].astype(float)
 	
@@ -0,0 +1,292 @@
+""" Checks simulation steps and infers the shape and dtype of every value
+before any input data is loaded.
+
+Input node values are shaped from the input node definitions (one row per
+locus, or a vector for a single locus) as placeholder arrays of zeros for
+a few samples, with the dtype of the simulation's dtype policy (and
+bit-packed if the input source is). The simulation steps are then run on
+these placeholders, so every node checks its own inputs as it does on
+real values. All problems found are reported together:
+
+	- Inputs and outputs that are not aliases of input nodes or steps.
+	- Errors raised by steps, e.g. combine nodes given values that are
+		not HaplotypeValues, or values whose shapes do not broadcast.
+	- Step outputs without the sample axis last.
+
+Steps that depend on a step with a problem are not run. Values are
+described by ValueSpecs, with the sample axis left symbolic.
+
+Example:
+	specs = check_simulation(
+		sim.input_runner.input_sources, sim.simulation_steps
+	)
+	specs['phenotype']	# ValueSpec(shape=(n_samples,), dtype=float64)
+	specs['gene_a']		# ValueSpec(haplotype, shape=(3, n_samples), dtype=int8)
+"""
+
+import copy
+import itertools
+from typing import Dict, List
+
+import numpy as np
+
+from pheno_sim.base_nodes import AbstractBaseFunctionNode
+from pheno_sim.data_types import (
+	PackedValues, ReadOnlyValuesDict, StackedHaplotypes
+)
+from pheno_sim.execution_plan import ExecutionPlan
+from pheno_sim.random_streams import RandomStream
+
+
+class ValueSpec:
+	""" Shape and dtype of Values, HaplotypeValues, or PackedValues, apart
+	from the sample (last) axis.
+
+	Attributes:
+		haplotype: Whether the values are HaplotypeValues.
+		packed: Whether the values (of each haplotype) are PackedValues.
+		feat_shape: Shape without the sample axis, i.e. () for vectors and
+			(n_feats,) for matrices.
+		dtype: dtype of the (unpacked) values.
+	"""
+	__slots__ = ('haplotype', 'packed', 'feat_shape', 'dtype')
+
+	def __init__(self, haplotype, packed, feat_shape, dtype):
+		self.haplotype = haplotype
+		self.packed = packed
+		self.feat_shape = tuple(feat_shape)
+		self.dtype = np.dtype(dtype)
+
+	@classmethod
+	def of(cls, vals, n_samples: int, unpacked_dtype=int):
+		""" Returns the ValueSpec of values for n_samples samples, or None
+		if they are not Values, HaplotypeValues, or PackedValues with the
+		sample axis last. PackedValues are described with unpacked_dtype,
+		the dtype nodes get them unpacked as.
+		"""
+		haplotype = isinstance(vals, tuple)
+		if haplotype:
+			if len(vals) != 2:
+				return None
+			specs = [cls.of(v, n_samples, unpacked_dtype) for v in vals]
+			if None in specs or specs[0] != specs[1]:
+				return None
+			return cls(
+				True, specs[0].packed, specs[0].feat_shape, specs[0].dtype
+			)
+
+		if isinstance(vals, PackedValues):
+			packed, dtype = True, np.dtype(unpacked_dtype)
+		elif isinstance(vals, np.ndarray):
+			packed, dtype = False, vals.dtype
+		else:
+			return None
+
+		if vals.ndim not in (1, 2) or vals.shape[-1] != n_samples:
+			return None
+		return cls(False, packed, vals.shape[:-1], dtype)
+
+	def shape(self, n_samples: int) -> tuple:
+		""" Returns the shape of the values (of each haplotype) for
+		n_samples samples.
+		"""
+		return self.feat_shape + (n_samples,)
+
+	def __eq__(self, other):
+		return isinstance(other, ValueSpec) and all(
+			getattr(self, attr) == getattr(other, attr)
+			for attr in self.__slots__
+		)
+
+	def __repr__(self):
+		shape = ', '.join([str(n) for n in self.feat_shape] + ['n_samples'])
+		if len(self.feat_shape) == 0:
+			shape += ','
+		kinds = [
+			kind for kind, is_kind in [
+				('haplotype', self.haplotype), ('packed', self.packed)
+			]
+			if is_kind
+		]
+		return 'ValueSpec({}shape=({}), dtype={})'.format(
+			''.join(kind + ', ' for kind in kinds), shape, self.dtype
+		)
+
+
+def check_simulation(
+	input_sources: List,
+	simulation_steps: List,
+	outputs: List[str] = None
+) -> Dict[str, ValueSpec]:
+	""" Checks the simulation steps against the input node definitions of
+	the input sources, without loading input data.
+
+	Args:
+		input_sources: Input sources (see BaseInputSource) of the
+			simulation.
+		simulation_steps: Function nodes of the simulation.
+		outputs (default None): Aliases of the values to compute. If None,
+			all steps are checked.
+
+	Returns:
+		Dict of the aliases of all input nodes and checked steps to their
+		ValueSpecs.
+
+	Raises:
+		ValueError: Listing every problem found.
+	"""
+	# A sample count that differs from the number of loci of every input
+	# node, so axes are not confused
+	n_loci = {
+		len(input_node.get_required_loci())
+		for input_source in input_sources
+		for input_node in input_source.input_nodes
+	}
+	n_samples = next(n for n in itertools.count(3) if n not in n_loci)
+
+	return infer_specs(
+		simulation_steps,
+		placeholder_inputs(input_sources, n_samples),
+		n_samples,
+		outputs
+	)
+
+
+def placeholder_inputs(input_sources: List, n_samples: int) -> dict:
+	""" Returns zero input node values of the input sources for n_samples
+	samples, with the shapes and dtypes loaded values would have.
+	"""
+	input_vals = dict()
+	for input_source in input_sources:
+		required_loci = input_source.get_required_loci()
+		hap_vals = StackedHaplotypes(np.zeros(
+			(2, len(required_loci), n_samples),
+			dtype=input_source.dtype_policy.genotype
+		))
+		input_vals.update(
+			input_source.get_input_node_vals(hap_vals, required_loci)
+		)
+	return input_vals
+
+
+def infer_specs(
+	simulation_steps: List,
+	input_vals: dict,
+	n_samples: int,
+	outputs: List[str] = None
+) -> Dict[str, ValueSpec]:
+	""" Runs (copies of) the simulation steps on input values for a few
+	samples and returns the ValueSpecs of all values. See
+	check_simulation.
+
+	Args:
+		simulation_steps: Function nodes of the simulation.
+		input_vals: Dict of input aliases to values for n_samples samples
+			(e.g. from placeholder_inputs).
+		n_samples: Number of samples of input_vals.
+		outputs (default None): See check_simulation.
+
+	Returns:
+		Dict of the aliases of input_vals and the checked steps to their
+		ValueSpecs.
+
+	Raises:
+		ValueError: Listing every problem found.
+	"""
+	# Steps are copied so running them does not change their state (e.g.
+	# RandomConstant's drawn values), and draw from their own streams so
+	# NumPy's global random state is not used
+	steps = []
+	for step in simulation_steps:
+		step = copy.copy(step)
+		if step.uses_random:
+			step.random_stream = RandomStream(0, step.alias)
+		steps.append(step)
+
+	plan = ExecutionPlan(steps, outputs, optimize=False)
+	step_aliases = {step.alias for step in steps}
+
+	# Nodes unpack PackedValues to the genotype dtype of their policy
+	unpacked_dtype = (
+		steps[0].dtype_policy.genotype if steps
+		else AbstractBaseFunctionNode.dtype_policy.genotype
+	)
+
+	problems = []
+	specs = {
+		alias: ValueSpec.of(vals, n_samples, unpacked_dtype)
+		for alias, vals in input_vals.items()
+	}
+	failed = set()
+
+	for alias in outputs or []:
+		if alias not in step_aliases and alias not in input_vals:
+			problems.append(
+				f"Output '{alias}' is not the alias of an input node or "
+				"simulation step."
+			)
+
+	# Read-only, so steps that modify their inputs in place fail too
+	vals_dict = ReadOnlyValuesDict(input_vals)
+	with np.errstate(all='ignore'):
+		for i, step in enumerate(plan.steps):
+			input_aliases = plan.dependencies[step.alias]
+
+			missing = [
+				alias for alias in input_aliases
+				if alias not in vals_dict and alias not in step_aliases
+			]
+			if missing:
+				problems.append(
+					f"Step '{step.alias}' ({type(step).__name__}) inputs "
+					f"{missing} are not aliases of input nodes or "
+					"simulation steps."
+				)
+				failed.add(step.alias)
+				continue
+			if any(alias in failed for alias in input_aliases):
+				failed.add(step.alias)
+				continue
+
+			try:
+				args, kwargs = plan._bind_inputs(i, vals_dict)
+				vals = plan._call_step(i, args, kwargs)
+			except Exception as e:
+				problems.append(
+					f"Step '{step.alias}' ({type(step).__name__}) raised "
+					f"{type(e).__name__}: {e} (inputs: "
+					+ ', '.join(
+						f"'{alias}' {specs.get(alias)}"
+						for alias in dict.fromkeys(input_aliases)
+					)
+					+ ")"
+				)
+				failed.add(step.alias)
+				continue
+
+			specs[step.alias] = ValueSpec.of(vals, n_samples, unpacked_dtype)
+			if specs[step.alias] is None:
+				problems.append(
+					f"Step '{step.alias}' ({type(step).__name__}) output "
+					f"{_describe(vals)} does not have the sample axis last."
+				)
+				failed.add(step.alias)
+				continue
+			vals_dict[step.alias] = vals
+
+	if problems:
+		raise ValueError(
+			"Invalid simulation configuration:\n"
+			+ '\n'.join(f"\t- {problem}" for problem in problems)
+		)
+
+	return specs
+
+
+def _describe(vals) -> str:
+	""" Returns a short description of the type and shape of values. """
+	if isinstance(vals, tuple):
+		return '({})'.format(', '.join(_describe(v) for v in vals))
+	if hasattr(vals, 'shape'):
+		return f"{type(vals).__name__} of shape {tuple(vals.shape)}"
+	return type(vals).__name__
@@ -28,3 +28,55 @@ echo "Saving tmp files in ${TMPDIR}"
 # Check version
 runcmd_pass "citrus --version"
 runcmd_pass "python -c 'import citrus; print(citrus.__version__)'"
+
+# Simulate with the native engine, so Hail is not needed
+export CITRUS_CACHE_DIR=${TMPDIR}/cache
+sed -e 's/"file_format": "vcf",/"engine": "native", "file_format": "vcf",/' \
+    example-files/linear_additive.json > ${TMPDIR}/native.json
+
+# Check input cache
+runcmd_pass "citrus simulate -c ${TMPDIR}/native.json -o ${TMPDIR} -f no_cache.csv --no-cache"
+runcmd_pass "citrus simulate -c ${TMPDIR}/native.json -o ${TMPDIR} -f cached.csv"
+runcmd_pass "citrus simulate -c ${TMPDIR}/native.json -o ${TMPDIR} -f cached.csv"
+runcmd_pass "cmp ${TMPDIR}/no_cache.csv ${TMPDIR}/cached.csv"
+runcmd_pass "ls ${CITRUS_CACHE_DIR} | grep -q ."
+
+# Check concurrent simulation steps
+runcmd_pass "citrus simulate -c ${TMPDIR}/native.json -o ${TMPDIR} -f workers.csv -w 2"
+runcmd_pass "cmp ${TMPDIR}/no_cache.csv ${TMPDIR}/workers.csv"
+runcmd_pass "citrus simulate -c ${TMPDIR}/native.json -o ${TMPDIR} -f workers.csv -w 0"
+runcmd_pass "cmp ${TMPDIR}/no_cache.csv ${TMPDIR}/workers.csv"
+
+# Check seeded simulations
+python - <<EOF
+import json
+with open('${TMPDIR}/native.json') as f:
+    config = json.load(f)
+config['simulation_steps'].append({
+    'type': 'GaussianNoise',
+    'alias': 'noisy_phenotype',
+    'input_alias': 'phenotype',
+    'noise_std': 1.0
+})
+with open('${TMPDIR}/noise.json', 'w') as f:
+    json.dump(config, f)
+EOF
+runcmd_pass "citrus simulate -c ${TMPDIR}/noise.json -o ${TMPDIR} -f seed_42.csv --seed 42"
+runcmd_pass "citrus simulate -c ${TMPDIR}/noise.json -o ${TMPDIR} -f seed_42_workers.csv -s 42 -w 2"
+runcmd_pass "cmp ${TMPDIR}/seed_42.csv ${TMPDIR}/seed_42_workers.csv"
+runcmd_pass "citrus simulate -c ${TMPDIR}/noise.json -o ${TMPDIR} -f seed_43.csv -s 43"
+runcmd_fail "cmp ${TMPDIR}/seed_42.csv ${TMPDIR}/seed_43.csv"
+
+# Check stored step outputs
+runcmd_pass "citrus simulate -c ${TMPDIR}/noise.json -o ${TMPDIR} -f stored.csv -s 42 --store-results"
+runcmd_pass "citrus simulate -c ${TMPDIR}/noise.json -o ${TMPDIR} -f stored.csv -s 42 --store-results"
+runcmd_pass "cmp ${TMPDIR}/seed_42.csv ${TMPDIR}/stored.csv"
+runcmd_pass "citrus simulate -c ${TMPDIR}/noise.json -o ${TMPDIR} -f stored.csv -s 42 --store-results --no-cache"
+runcmd_pass "cmp ${TMPDIR}/seed_42.csv ${TMPDIR}/stored.csv"
+
+# Check chunked simulations
+runcmd_fail "citrus simulate -c ${TMPDIR}/noise.json -o ${TMPDIR} -f chunked.csv --chunk-size 0"
+runcmd_pass "citrus simulate -c ${TMPDIR}/native.json -o ${TMPDIR} -f chunked.csv --chunk-size 1000"
+runcmd_pass "cmp ${TMPDIR}/no_cache.csv ${TMPDIR}/chunked.csv"
+runcmd_pass "citrus simulate -c ${TMPDIR}/noise.json -o ${TMPDIR} -f chunked.csv -s 42 --chunk-size 1000"
+runcmd_pass "cmp ${TMPDIR}/seed_42.csv ${TMPDIR}/chunked.csv"